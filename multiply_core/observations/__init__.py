@@ -2,7 +2,10 @@ from .observations import ProductObservations, ObservationData, ProductObservati
     ObservationsWrapper
 from .s2_observations import S2Observations, S2ObservationsCreator, extract_angles_from_metadata_file, extract_tile_id
 from .data_validation import INPUT_TYPES, DataTypeConstants, DataValidator, add_validator, get_valid_type, \
-    get_valid_types, get_data_type_path, is_valid, is_valid_for, get_file_pattern, get_relative_path, differs_by_name, \
-    get_types_of_unprocessed_data_for_model_data_type, get_types_of_preprocessed_data_for_model_data_type, \
+    get_valid_types, get_data_type_path, is_valid, is_valid_for, are_valid_for, get_file_pattern, get_relative_path, \
+    differs_by_name, get_types_of_unprocessed_data_for_model_data_type, get_types_of_preprocessed_data_for_model_data_type, \
     SENTINEL_1_MODEL_DATA_TYPE, SENTINEL_2_MODEL_DATA_TYPE, get_valid_files
-from .output import GeoTiffWriter
+from .output import AsyncWriter, CloudOptimizedGeoTiffWriter, GeoTiffWriter
+from .watch import ValidFilesWatcher
+from .tile_processing import TileProcessor, process_tiles
+from .time_series import NetCdfTimeSeriesReader, NetCdfTimeSeriesWriter
@@ -10,11 +10,12 @@ __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
 from abc import ABCMeta, abstractmethod
 from datetime import datetime
-from multiply_core.util import FileRef, FileRefCreation, get_time_from_string
+from multiply_core.util import FileRef, get_file_ref_creation, get_time_from_string, get_times_from_strings
 from multiply_core.variables import get_registered_variables
 from shapely.geometry import Polygon
-from typing import List, Optional
+from typing import List, Optional, Sequence
 import glob
+import numpy as np
 import re
 import os
 
@@ -63,6 +64,63 @@ def _get_end_of_path(path: str):
     return path.split('/')[-1]
 
 
+# finds the first underscore-separated part of a name which starts with a time and captures that whole part
+_FIRST_TIME_IN_NAME_MATCHER = re.compile('^(?:[^_\n]*_)*?([0-9]{8}T[0-9]{6}[^_\n]*)', re.MULTILINE)
+
+
+def _get_names_matcher(pattern: str):
+    """Compiles a pattern so it can be matched against the start of every line of a newline-separated text."""
+    return re.compile('^(?:{})'.format(pattern), re.MULTILINE)
+
+
+def _find_in_names(names_matcher, names: Sequence[str], group: int = 0) -> List[str]:
+    """
+    Applies a matcher created by _get_names_matcher once to all names.
+    :return: A list with, for every name, the matched group or an empty string if the name does not match.
+    """
+    found = [''] * len(names)
+    if len(names) == 0:
+        return found
+    line_starts = np.cumsum([0] + [len(name) + 1 for name in names[:-1]])
+    name_indexes = dict(zip(line_starts.tolist(), range(len(names))))
+    for match in names_matcher.finditer('\n'.join(names)):
+        name_index = name_indexes.get(match.start())
+        if name_index is not None:
+            found[name_index] = match.group(group)
+    return found
+
+
+def _are_in_time_range(time_strings: Sequence[str], start_time: Optional[datetime], end_time: Optional[datetime]) \
+        -> np.ndarray:
+    """Returns a boolean mask indicating which of the time strings lie between start and end time. Empty strings
+    never do, neither do strings which cannot be parsed. If start or end time are not given, the time range is not
+    restricted in that direction."""
+    unique_time_strings, inverse = np.unique(np.asarray(time_strings, dtype=str), return_inverse=True)
+    unique_times = np.empty(len(unique_time_strings), dtype='datetime64[us]')
+    for i, time_string in enumerate(unique_time_strings):
+        try:
+            unique_times[i] = get_times_from_strings([str(time_string)])[0]
+        except ValueError:
+            unique_times[i] = np.datetime64('NaT')
+    times = unique_times[inverse].reshape(len(time_strings))
+    in_range = np.logical_not(np.isnat(times))
+    if start_time is not None:
+        in_range &= times >= np.datetime64(start_time, 'us')
+    if end_time is not None:
+        in_range &= times <= np.datetime64(end_time, 'us')
+    return in_range
+
+
+def _are_named_products_valid_for(names_matcher, paths: Sequence[str], start_time: Optional[datetime],
+                                  end_time: Optional[datetime]) -> np.ndarray:
+    """Batch check for products whose names match a pattern and contain their sensing time."""
+    names = [_get_end_of_path(path) for path in paths]
+    matches_name = np.array(_find_in_names(names_matcher, names), dtype=str) != ''
+    names = [name if matches_name[i] else '' for i, name in enumerate(names)]
+    time_strings = _find_in_names(_FIRST_TIME_IN_NAME_MATCHER, names, 1)
+    return _are_in_time_range(time_strings, start_time, end_time)
+
+
 class DataValidator(metaclass=ABCMeta):
 
     @abstractmethod
@@ -73,6 +131,14 @@ class DataValidator(metaclass=ABCMeta):
     def is_valid(self, path: str) -> bool:
         """Whether the data at the given path is a valid data product for the type."""
 
+    def is_valid_name(self, path: str) -> bool:
+        """
+        Whether the path is named like a valid data product for the type. Other than is_valid, this is decided from
+        the path alone, checks on the existence of files are deferred. Validators which need to access the file system
+        in is_valid must override this.
+        """
+        return self.is_valid(path)
+
     @abstractmethod
     def get_relative_path(self, path: str) -> str:
         """
@@ -99,6 +165,23 @@ class DataValidator(metaclass=ABCMeta):
         :return:
         """
 
+    def are_valid_for(self, paths: Sequence[str], roi: Polygon, start_time: Optional[datetime],
+                      end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+        """
+        Batch version of is_valid_for. Validators which can tell time and footprint from the path alone are
+        expected to override this with a vectorized implementation.
+        :param paths: The paths to be checked
+        :param roi:
+        :param start_time:
+        :param end_time:
+        :param name_only: If true, the paths are checked without accessing the file system.
+        :return: A boolean array which is true for every path that is valid for roi and time range.
+        """
+        if name_only:
+            return np.array([self.is_valid_name(path) and self.is_valid_for(path, roi, start_time, end_time)
+                             for path in paths], dtype=bool)
+        return np.array([self.is_valid_for(path, roi, start_time, end_time) for path in paths], dtype=bool)
+
     @classmethod
     def differs_by_name(cls) -> bool:
         """
@@ -112,6 +195,7 @@ class S1SlcValidator(DataValidator):
         self._S1_PATTERN = \
             '(S1A|S1B)_(IW|EW|WV|(S[1-9]{1}))_SLC__1([A-Z]{3})_([0-9]{8}T[0-9]{6})_([0-9]{8}T[0-9]{6})_.*.(SAFE)?'
         self._S1_MATCHER = re.compile(self._S1_PATTERN)
+        self._S1_NAMES_MATCHER = _get_names_matcher(self._S1_PATTERN)
         self.TIME_PATTERN = '([0-9]{8}T[0-9]{6})'
         self.TIME_MATCHER = re.compile(self.TIME_PATTERN)
 
@@ -148,6 +232,10 @@ class S1SlcValidator(DataValidator):
             return False
         return start_time <= time <= end_time
 
+    def are_valid_for(self, paths: Sequence[str], roi: Polygon, start_time: Optional[datetime],
+                      end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+        return _are_named_products_valid_for(self._S1_NAMES_MATCHER, paths, start_time, end_time)
+
     @classmethod
     def differs_by_name(cls) -> bool:
         return False
@@ -159,6 +247,7 @@ class S1SpeckledValidator(DataValidator):
         self._S1_SPECKLED_PATTERN = '(S1A|S1B)_(IW|EW|WV|(S[1-9]{1}))_SLC__1([A-Z]{3})_' \
                                     '([0-9]{8}T[0-9]{6})_([0-9]{8}T[0-9]{6})_.*._GC_RC_No_Su_Co_speckle.nc'
         self._S1_SPECKLED_MATCHER = re.compile(self._S1_SPECKLED_PATTERN)
+        self._S1_SPECKLED_NAMES_MATCHER = _get_names_matcher(self._S1_SPECKLED_PATTERN)
         self.TIME_PATTERN = '([0-9]{8}T[0-9]{6})'
         self.TIME_MATCHER = re.compile(self.TIME_PATTERN)
 
@@ -195,6 +284,10 @@ class S1SpeckledValidator(DataValidator):
             return False
         return start_time <= time <= end_time
 
+    def are_valid_for(self, paths: Sequence[str], roi: Polygon, start_time: Optional[datetime],
+                      end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+        return _are_named_products_valid_for(self._S1_SPECKLED_NAMES_MATCHER, paths, start_time, end_time)
+
     @classmethod
     def differs_by_name(cls) -> bool:
         return False
@@ -205,6 +298,7 @@ class S2L1CValidator(DataValidator):
     def __init__(self):
         self.S2_PATTERN = '(S2A|S2B|S2_)_(([A-Z|0-9]{4})_[A-Z|0-9|_]{4})?([A-Z|0-9|_]{6})_(([A-Z|0-9|_]{4})_)?([0-9]{8}T[0-9]{6})_.*.(SAFE)?'
         self.S2_MATCHER = re.compile(self.S2_PATTERN)
+        self._S2_NAMES_MATCHER = _get_names_matcher(self.S2_PATTERN)
         self.TIME_PATTERN = '([0-9]{8}T[0-9]{6})'
         self.TIME_MATCHER = re.compile(self.TIME_PATTERN)
         self._manifest_file_name = 'MTD_MSIL1C.xml'
@@ -230,6 +324,11 @@ class S2L1CValidator(DataValidator):
                     return False
         return True
 
+    def is_valid_name(self, path: str) -> bool:
+        end_of_path = _get_end_of_path(path)
+        # atmospherically corrected products keep the name of the L1C product, but are marked by a suffix
+        return self.S2_MATCHER.match(end_of_path) is not None and not end_of_path.endswith('-ac')
+
     def get_relative_path(self, path: str) -> str:
         dir_name = self.S2_MATCHER.search(path)
         if dir_name is None:
@@ -260,6 +359,14 @@ class S2L1CValidator(DataValidator):
             return False
         return start_time <= time <= end_time
 
+    def are_valid_for(self, paths: Sequence[str], roi: Polygon, start_time: Optional[datetime],
+                      end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+        valid = _are_named_products_valid_for(self._S2_NAMES_MATCHER, paths, start_time, end_time)
+        # only products which pass the checks on name and time need to be looked at
+        for i in np.flatnonzero(valid):
+            valid[i] = self.is_valid_name(paths[i]) if name_only else self.is_valid(paths[i])
+        return valid
+
     @classmethod
     def differs_by_name(cls) -> bool:
         return False
@@ -270,6 +377,7 @@ class S2L2Validator(DataValidator):
     def __init__(self):
         self.S2_PATTERN = '(S2A|S2B|S2_)_(([A-Z|0-9]{4})_[A-Z|0-9|_]{4})?([A-Z|0-9|_]{6})_(([A-Z|0-9|_]{4})_)?([0-9]{8}T[0-9]{6})_.*.(SAFE)?-ac'
         self.S2_MATCHER = re.compile(self.S2_PATTERN)
+        self._S2_NAMES_MATCHER = _get_names_matcher(self.S2_PATTERN)
         self.TIME_PATTERN = '([0-9]{8}T[0-9]{6})'
         self.TIME_MATCHER = re.compile(self.TIME_PATTERN)
         self._manifest_file_names = ['MTD_TL.xml', 'MTD_MSIL1C.xml']
@@ -286,6 +394,9 @@ class S2L2Validator(DataValidator):
                 return True
         return False
 
+    def is_valid_name(self, path: str) -> bool:
+        return self.S2_MATCHER.match(_get_end_of_path(path)) is not None
+
     def get_relative_path(self, path: str) -> str:
         dir_name = self.S2_MATCHER.search(path)
         if dir_name is None:
@@ -316,17 +427,30 @@ class S2L2Validator(DataValidator):
             return False
         return start_time <= time <= end_time
 
+    def are_valid_for(self, paths: Sequence[str], roi: Polygon, start_time: Optional[datetime],
+                      end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+        valid = _are_named_products_valid_for(self._S2_NAMES_MATCHER, paths, start_time, end_time)
+        # only products which pass the checks on name and time need to be looked at
+        for i in np.flatnonzero(valid):
+            valid[i] = self.is_valid_name(paths[i]) if name_only else self.is_valid(paths[i])
+        return valid
+
     @classmethod
     def differs_by_name(cls) -> bool:
         return False
 
 
+# AWS products of all levels are stored in the same directory structure
+_BASIC_AWS_S2_PATTERN = '/[0-9]{1,2}/[A-Z]/[A-Z]{2}/20[0-9][0-9]/[0-9]{1,2}/[0-9]{1,2}/[0-9]{1,2}'
+_AWS_S2_PATTERN = '.*' + _BASIC_AWS_S2_PATTERN
+
+
 class AWSS2L1Validator(DataValidator):
 
     def __init__(self):
-        self.BASIC_AWS_S2_PATTERN = '/[0-9]{1,2}/[A-Z]/[A-Z]{2}/20[0-9][0-9]/[0-9]{1,2}/[0-9]{1,2}/[0-9]{1,2}'
+        self.BASIC_AWS_S2_PATTERN = _BASIC_AWS_S2_PATTERN
         self.BASIC_AWS_S2_MATCHER = re.compile(self.BASIC_AWS_S2_PATTERN)
-        self.AWS_S2_PATTERN = '.*/[0-9]{1,2}/[A-Z]/[A-Z]{2}/20[0-9][0-9]/[0-9]{1,2}/[0-9]{1,2}/[0-9]{1,2}'
+        self.AWS_S2_PATTERN = _AWS_S2_PATTERN
         self.AWS_S2_MATCHER = re.compile(self.AWS_S2_PATTERN)
         self._expected_files = ['B01.jp2', 'B02.jp2', 'B03.jp2', 'B04.jp2', 'B05.jp2', 'B06.jp2', 'B07.jp2', 'B08.jp2',
                                 'B8A.jp2', 'B09.jp2', 'B10.jp2', 'B11.jp2', 'B12.jp2', 'metadata.xml']
@@ -342,6 +466,9 @@ class AWSS2L1Validator(DataValidator):
                 return False
         return True
 
+    def is_valid_name(self, path: str) -> bool:
+        return self._matches_pattern(path)
+
     def _matches_pattern(self, path: str) -> bool:
         return self.AWS_S2_MATCHER.match(path) is not None
 
@@ -366,6 +493,7 @@ class AWSS2L1Validator(DataValidator):
 class AWSS2L2Validator(DataValidator):
 
     def __init__(self):
+        self.AWS_S2_MATCHER = re.compile(_AWS_S2_PATTERN)
         self._expected_files = [['B01_sur.tif', 'B01_sur.tiff'], ['B02_sur.tif', 'B02_sur.tiff'],
                                 ['B03_sur.tif', 'B03_sur.tiff'], ['B04_sur.tif', 'B04_sur.tiff'],
                                 ['B05_sur.tif', 'B05_sur.tiff'], ['B06_sur.tif', 'B06_sur.tiff'],
@@ -389,6 +517,11 @@ class AWSS2L2Validator(DataValidator):
                 return False
         return True
 
+    def is_valid_name(self, path: str) -> bool:
+        # AWS products of different levels share the same directory structure, so from the path alone they can
+        # not be told apart
+        return self.AWS_S2_MATCHER.match(path) is not None
+
     def get_relative_path(self, path: str) -> str:
         return ''
 
@@ -495,6 +628,9 @@ class CamsTiffValidator(DataValidator):
                 return False
         return True
 
+    def is_valid_name(self, path: str) -> bool:
+        return self.BASIC_CAMS_NAME_MATCHER.fullmatch(_get_end_of_path(path)) is not None
+
     def get_relative_path(self, path: str) -> str:
         start_pos, end_pos = self.BASIC_CAMS_NAME_MATCHER.search(path).regs[0]
         return path[start_pos:end_pos]
@@ -635,6 +771,7 @@ class AsterValidator(DataValidator):
     def __init__(self):
         self.ASTER_NAME_PATTERN = 'ASTGTM2_[N|S][0-8][0-9][E|W][0|1][0-9][0-9]_dem.tif'
         self.ASTER_NAME_MATCHER = re.compile(self.ASTER_NAME_PATTERN)
+        self._ASTER_NAMES_MATCHER = _get_names_matcher(self.ASTER_NAME_PATTERN)
 
     def name(self) -> str:
         return DataTypeConstants.ASTER
@@ -666,6 +803,23 @@ class AsterValidator(DataValidator):
             return False
         return True
 
+    def are_valid_for(self, paths: Sequence[str], roi: Polygon, start_time: Optional[datetime],
+                      end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+        names = _find_in_names(self._ASTER_NAMES_MATCHER, [_get_end_of_path(path) for path in paths])
+        valid = np.array(names, dtype=str) != ''
+        valid_indexes = np.flatnonzero(valid)
+        valid_names = np.array([names[i] for i in valid_indexes], dtype=str)
+        if len(valid_names) == 0:
+            return valid
+        path_lats = np.array([name[9:11] for name in valid_names], dtype=float)
+        path_lats[np.char.startswith(valid_names, 'S', 8)] *= -1
+        path_lons = np.array([name[12:15] for name in valid_names], dtype=float)
+        path_lons[np.char.startswith(valid_names, 'W', 11)] *= -1
+        min_lon, min_lat, max_lon, max_lat = roi.bounds
+        valid[valid_indexes] = (min_lon <= path_lons + 1) & (max_lon >= path_lons) & \
+                               (min_lat <= path_lats + 1) & (max_lat >= path_lats)
+        return valid
+
     @classmethod
     def differs_by_name(cls) -> bool:
         return False
@@ -720,17 +874,15 @@ class VariableValidator(DataValidator):
 
 
 def get_valid_files(datasets_dir: str, data_types: Optional[List[str]] = []) -> List[FileRef]:
-    file_refs = []
-    file_ref_creation = FileRefCreation()
+    types_and_paths = []
     found_files = glob.glob(datasets_dir + '/**', recursive=True)
     for found_file in found_files:
         found_file = found_file.replace('\\', '/')
         type = get_valid_type(found_file)
         if len(data_types) > 0 and type in data_types:
-            file_ref = file_ref_creation.get_file_ref(type, found_file)
-            if file_ref is not None:
-                file_refs.append(file_ref)
-    return file_refs
+            types_and_paths.append((type, found_file))
+    file_refs = get_file_ref_creation().create_file_refs(types_and_paths)
+    return [file_ref for file_ref in file_refs if file_ref is not None]
 
 
 def _set_up_validators():
@@ -758,17 +910,26 @@ def add_validator(validator: DataValidator):
         DATA_VALIDATORS[validator.name()] = validator
 
 
-def get_valid_type(path: str) -> str:
+def get_valid_type(path: str, name_only: bool = False) -> str:
+    """
+    :param path: Path to a file.
+    :param name_only: If true, the type is determined from the path alone without accessing the file system.
+    Types which cannot be told apart by their names are not distinguished then, e.g., AWS S2 L1C and L2 products share
+    the same directory structure, so paths of both are reported as AWS_S2_L1C.
+    :return: The name of the first data type the path is valid for or an empty string, if there is none.
+    """
     _set_up_validators()
     for validator in DATA_VALIDATORS.values():
-        if validator.is_valid(path):
+        if (validator.is_valid_name(path) if name_only else validator.is_valid(path)):
             return validator.name()
     return ''
 
 
-def is_valid(path: str, data_type: str) -> bool:
+def is_valid(path: str, data_type: str, name_only: bool = False) -> bool:
     _set_up_validators()
     if data_type in DATA_VALIDATORS:
+        if name_only:
+            return DATA_VALIDATORS[data_type].is_valid_name(path)
         return DATA_VALIDATORS[data_type].is_valid(path)
     return False
 
@@ -795,6 +956,24 @@ def is_valid_for(path: str, data_type: str, roi: Polygon, start_time: Optional[d
     return False
 
 
+def are_valid_for(paths: Sequence[str], data_type: str, roi: Polygon, start_time: Optional[datetime],
+                  end_time: Optional[datetime], name_only: bool = False) -> np.ndarray:
+    """
+    Checks for many paths at once whether they are valid products of the given type for roi and time range.
+    :param paths: The paths to be checked
+    :param data_type: The data type the products are expected to be of
+    :param roi: The region of interest the products need to intersect with
+    :param start_time: The start of the time range
+    :param end_time: The end of the time range
+    :param name_only: If true, the paths are checked without accessing the file system.
+    :return: A boolean array which is true for every path that is valid for roi and time range.
+    """
+    _set_up_validators()
+    if data_type in DATA_VALIDATORS:
+        return DATA_VALIDATORS[data_type].are_valid_for(paths, roi, start_time, end_time, name_only)
+    return np.zeros(len(paths), dtype=bool)
+
+
 def get_valid_types() -> List[str]:
     """Returns the names of all data types which can be valid."""
     _set_up_validators()
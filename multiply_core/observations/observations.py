@@ -13,7 +13,7 @@ import pkg_resources
 import scipy.sparse as sp
 from typing import List, Optional, Union
 
-from multiply_core.util import FileRef, Reprojection, get_time_from_string
+from multiply_core.util import FileRef, FileRefTable, Reprojection, get_time_from_string
 from .data_validation import get_valid_type, get_types_of_preprocessed_data_for_model_data_type
 from ..models.forward_models import get_forward_models
 
@@ -214,21 +214,26 @@ class ObservationsFactory(object):
                 observations = observations_creator.create_observations(file_refs, reprojection, emulator_folder)
                 return observations
 
-    def create_observations(self, file_refs: List[FileRef], reprojection: Optional[Reprojection] = None,
+    def create_observations(self, file_refs: Union[List[FileRef], FileRefTable],
+                            reprojection: Optional[Reprojection] = None,
                             forward_model_names: Optional[List[str]] = None) -> \
             ObservationsWrapper:
+        if isinstance(file_refs, FileRefTable):
+            file_refs = file_refs.to_file_refs()
         observations_wrapper = ObservationsWrapper()
         self.sort_file_ref_list(file_refs)
         file_ref_sets = {}
         for file_ref in file_refs:
-            data_type = get_valid_type(file_ref.url)
-            time = get_time_from_string(file_ref.start_time).strftime('%Y-%m-%d')
-            file_ref_set_id = f'{data_type}/{time}'
+            data_type = file_ref.data_type
+            if data_type is None:
+                data_type = get_valid_type(file_ref.url)
+            start_time = file_ref.start_datetime
+            file_ref_set_id = (data_type, datetime(start_time.year, start_time.month, start_time.day))
             if not file_ref_set_id in file_ref_sets:
                 file_ref_sets[file_ref_set_id] = []
             file_ref_sets[file_ref_set_id].append(file_ref)
         for file_ref_set_id in file_ref_sets:
-            data_type = file_ref_set_id.split('/')[0]
+            data_type, date = file_ref_set_id
             emulators_dir = None
             if forward_model_names is not None:
                 forward_models = get_forward_models()
@@ -245,12 +250,13 @@ class ObservationsFactory(object):
                         break
             observations = self._create_observations(file_ref_sets[file_ref_set_id], reprojection, emulators_dir)
             if observations is not None:
-                observations_wrapper.add_observations(observations, file_ref_set_id.split('/')[1])
+                observations_wrapper.add_observations(observations, date)
         return observations_wrapper
 
     @staticmethod
     def _start_time(file_ref: FileRef):
-        return file_ref.start_time
+        start_time = file_ref.start_datetime
+        return datetime.min if start_time is None else start_time
 
     def sort_file_ref_list(self, file_refs: List[FileRef]):
         file_refs.sort(key=self._start_time)
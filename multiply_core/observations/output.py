@@ -1,9 +1,13 @@
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 import gdal
 import logging
+import math
 import numpy as np
 import os
-from typing import List, Optional
+import queue
+import threading
+from typing import List, Optional, Sequence, Union
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -17,16 +21,25 @@ logging_handler.setFormatter(formatter)
 logger.addHandler(logging_handler)
 
 
-class Writer(metaclass=ABCMeta):
+def _to_raster_shape(data: np.array, num_bands: int, width: int, height: int) -> np.array:
+    """
+    Brings flat data into the shape (height, width) for single bands and (num_bands, height, width) for several bands.
+    """
+    if data.shape == (width * height,):
+        data = data.reshape(height, width)
+    elif data.shape == (num_bands, width * height):
+        data = data.reshape(num_bands, height, width)
+    if data.shape == (num_bands, height, width) and num_bands == 1:
+        data = data.reshape(height, width)
+    logger.info(f'Expecting height {height} and width {width} as {(height, width)}, receiving {data.shape}')
+    assert data.shape == (height, width) or data.shape == (num_bands, height, width)
+    return data
 
-    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
-                 num_bands: Optional[List[int]], data_types: Optional[List[str]]):
-        self.init(file_names, geo_transform, projection, width, height, num_bands, data_types)
 
-    @abstractmethod
-    def init(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
-             num_bands: Optional[List[int]] = None, data_types: Optional[List[str]] = None):
-        pass
+class BaseWriter(metaclass=ABCMeta):
+    """
+    What can be done with a writer once it has been set up: write data, set checkpoints and close it.
+    """
 
     @abstractmethod
     def write(self, data: List[np.array], width: Optional[int] = None, height: Optional[int] = None,
@@ -37,8 +50,40 @@ class Writer(metaclass=ABCMeta):
     def close(self):
         pass
 
+    def checkpoint(self):
+        """
+        Makes sure that everything which has been written so far is persisted. Writers which write directly do not
+        need to do anything here.
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Writer(BaseWriter):
+    """
+    A writer which creates its files when it is set up.
+    """
+
+    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+                 num_bands: Optional[List[int]], data_types: Optional[List[str]]):
+        self.init(file_names, geo_transform, projection, width, height, num_bands, data_types)
+
+    @abstractmethod
+    def init(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+             num_bands: Optional[List[int]] = None, data_types: Optional[List[str]] = None):
+        pass
+
 
 class GeoTiffWriter(Writer):
+    """
+    Writes data into GeoTIFF files. The files are kept open while the writer is in use, data is written through the
+    block cache of gdal and only flushed to disk on checkpoint() and close().
+    """
 
     def init(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
              num_bands: Optional[List[int]] = None, data_types: Optional[List[str]] = None):
@@ -56,25 +101,30 @@ class GeoTiffWriter(Writer):
             gdal_data_types.append(self._get_gdal_data_type(data_type))
         self._width = width
         self._height = height
-        drv = gdal.GetDriverByName('GTiff')
-        self._file_names = file_names
-        # self._destination_data_sets = []
+        self._file_names = []
+        self._destination_data_sets = []
         for i, file_name in enumerate(file_names):
             parent_dir = os.path.dirname(file_name)
             if not os.path.exists(parent_dir):
                 os.makedirs(parent_dir)
             if not file_name.endswith('.tif') and not file_name.endswith('tiff'):
                 file_name = file_name + '.tif'
-            if not os.path.exists(file_name):
-            # if os.path.exists(file_name):
-            #     data_set = gdal.OpenShared(file_name, gdal.GA_Update)
-            # else:
-                data_set = drv.Create(file_name, width, height, num_bands[i], gdal_data_types[i],
-                                  ['COMPRESS=DEFLATE', 'BIGTIFF=YES', 'PREDICTOR=1', 'TILED=YES'])
-                data_set.SetProjection(projection)
-                data_set.SetGeoTransform(geo_transform)
-                data_set = None
-            # self._destination_data_sets.append(data_set)
+            self._file_names.append(file_name)
+            self._destination_data_sets.append(self._open_data_set(file_name, width, height, num_bands[i],
+                                                                   gdal_data_types[i], geo_transform, projection))
+
+    def _get_creation_options(self) -> List[str]:
+        return ['COMPRESS=DEFLATE', 'BIGTIFF=YES', 'PREDICTOR=1', 'TILED=YES']
+
+    def _open_data_set(self, file_name: str, width: int, height: int, num_bands: int, gdal_data_type: int,
+                       geo_transform: tuple, projection: str) -> gdal.Dataset:
+        if os.path.exists(file_name):
+            return gdal.Open(file_name, gdal.GA_Update)
+        data_set = gdal.GetDriverByName('GTiff').Create(file_name, width, height, num_bands, gdal_data_type,
+                                                        self._get_creation_options())
+        data_set.SetProjection(projection)
+        data_set.SetGeoTransform(geo_transform)
+        return data_set
 
     @staticmethod
     def _get_gdal_data_type(data_type: str) -> str:
@@ -88,37 +138,275 @@ class GeoTiffWriter(Writer):
 
     def write(self, data: List[np.array], width: Optional[int] = None, height: Optional[int] = None,
               offset_x: Optional[int] = 0, offset_y: Optional[int] = 0):
-        # assert len(data) == len(self._destination_data_sets)
-        assert len(data) == len(self._file_names)
+        if self._destination_data_sets is None:
+            raise ValueError('Writer has already been closed')
+        assert len(data) == len(self._destination_data_sets)
         if width is None:
             width = self._width
         if height is None:
             height = self._height
         for i, d in enumerate(data):
-            if d.shape == (width * height,):
-                d = d.reshape(height, width)
-            elif d.shape == (self.num_bands[i], width * height):
-                d = d.reshape(self.num_bands[i], height, width)
-            if d.shape == (self.num_bands[i], height, width) and self.num_bands[i] == 1:
-                d = d.reshape(height, width)
-            logger.info(f'Expecting height {height} and width {width} as {(height, width)}, receiving {d.shape}')
-            assert d.shape == (height, width) or d.shape == (self.num_bands[i], height, width)
-            dataset = gdal.OpenShared(self._file_names[i], gdal.GA_Update)
+            d = _to_raster_shape(d, self.num_bands[i], width, height)
             if self.num_bands[i] > 1:
                 for band in range(self.num_bands[i]):
-                    # self._destination_data_sets[i].GetRasterBand(band + 1).WriteArray(d[band],
-                    dataset.GetRasterBand(band + 1).WriteArray(d[band],
-                                                                                      xoff=offset_x, yoff=offset_y)
+                    self._destination_data_sets[i].GetRasterBand(band + 1).WriteArray(d[band], xoff=offset_x,
+                                                                                      yoff=offset_y)
             else:
-                # self._destination_data_sets[i].GetRasterBand(1).WriteArray(d, xoff=offset_x, yoff=offset_y)
-                dataset.GetRasterBand(1).WriteArray(d, xoff=offset_x, yoff=offset_y)
-            # self._destination_data_sets[i].FlushCache()
+                self._destination_data_sets[i].GetRasterBand(1).WriteArray(d, xoff=offset_x, yoff=offset_y)
+
+    def checkpoint(self):
+        if self._destination_data_sets is None:
+            return
+        for dataset in self._destination_data_sets:
             dataset.FlushCache()
-            dataset = None
+
+    def close(self):
+        if self._destination_data_sets is None:
+            return
+        self.checkpoint()
+        # the files are only completely written when the datasets are dereferenced
+        self._destination_data_sets = None
+
+
+_COG_BLOCK_SIZES = [64, 128, 256, 512, 1024, 2048, 4096]
+
+
+@contextmanager
+def _config_option(key: str, value: str):
+    # gdal config options are global, so the previous value is restored afterwards
+    previous_value = gdal.GetConfigOption(key)
+    gdal.SetConfigOption(key, value)
+    try:
+        yield
+    finally:
+        gdal.SetConfigOption(key, previous_value)
+
+
+def _get_overview_factors(width: int, height: int, block_size: int) -> List[int]:
+    """
+    :return: The factors of the overviews which are needed until the whole image fits into a single block
+    """
+    factors = []
+    factor = 1
+    while math.ceil(max(width, height) / factor) > block_size:
+        factor *= 2
+        factors.append(factor)
+    return factors
 
 
+def _downsample(data: np.array, no_data_value: Optional[float] = None) -> np.array:
+    """
+    Halves the resolution of a 2D array by averaging blocks of 2 x 2 pixels. NaN values, no data values and pixels
+    beyond the edges of the array are left out of the average. Blocks without any valid pixel are set to the no data
+    value, or to NaN if there is none.
+    """
+    height, width = data.shape
+    padded = np.full((height + height % 2, width + width % 2), np.nan)
+    padded[:height, :width] = data
+    if no_data_value is not None and not np.isnan(no_data_value):
+        padded[:height, :width][data == no_data_value] = np.nan
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    num_valid = valid.sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        downsampled = np.where(valid, blocks, 0).sum(axis=(1, 3)) / num_valid
+    if np.issubdtype(data.dtype, np.integer):
+        downsampled = np.round(downsampled)
+    if no_data_value is not None:
+        downsampled[num_valid == 0] = no_data_value
+    return downsampled.astype(data.dtype)
+
+
+def _get_working_file_name(file_name: str) -> str:
+    return '{}.partial.tif'.format(os.path.splitext(file_name)[0])
+
+
+class CloudOptimizedGeoTiffWriter(GeoTiffWriter):
+    """
+    Writes data into Cloud Optimized GeoTIFFs, so that readers can fetch single blocks and overview levels without
+    reading the whole file. While the writer is in use, data is written into a tiled working file next to each output
+    file. Its internal overviews are updated whenever a tile has been written, so they need not be computed from the
+    full-resolution data at the end. When the writer is closed, the working files are turned into COGs, with the
+    overviews placed before the full-resolution data.
+    :param block_size: The width and height of the blocks, a power of two from 64 to 4096. Overviews are added until
+    the whole image fits into one block.
+    """
+
+    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+                 num_bands: Optional[List[int]] = None, data_types: Optional[List[str]] = None,
+                 block_size: int = 512):
+        if block_size not in _COG_BLOCK_SIZES:
+            raise ValueError('Block size must be one of {}'.format(_COG_BLOCK_SIZES))
+        self._block_size = block_size
+        super().__init__(file_names, geo_transform, projection, width, height, num_bands, data_types)
+
+    def _get_creation_options(self) -> List[str]:
+        return ['COMPRESS=DEFLATE', 'BIGTIFF=YES', 'PREDICTOR=1', 'TILED=YES',
+                'BLOCKXSIZE={}'.format(self._block_size), 'BLOCKYSIZE={}'.format(self._block_size)]
+
+    def _open_data_set(self, file_name: str, width: int, height: int, num_bands: int, gdal_data_type: int,
+                       geo_transform: tuple, projection: str) -> gdal.Dataset:
+        working_file_name = _get_working_file_name(file_name)
+        if os.path.exists(working_file_name):
+            # continues with a working file which has not been closed before
+            return gdal.Open(working_file_name, gdal.GA_Update)
+        factors = _get_overview_factors(width, height, self._block_size)
+        with _config_option('GDAL_TIFF_OVR_BLOCKSIZE', str(self._block_size)):
+            if os.path.exists(file_name):
+                data_set = gdal.Translate(working_file_name, file_name, format='GTiff',
+                                          creationOptions=self._get_creation_options())
+                data_set.BuildOverviews('AVERAGE', factors)
+            else:
+                data_set = super()._open_data_set(working_file_name, width, height, num_bands, gdal_data_type,
+                                                  geo_transform, projection)
+                # only creates the overviews, they are filled as tiles are written
+                data_set.BuildOverviews('NONE', factors)
+        return data_set
+
+    def write(self, data: List[np.array], width: Optional[int] = None, height: Optional[int] = None,
+              offset_x: Optional[int] = 0, offset_y: Optional[int] = 0):
+        super().write(data, width, height, offset_x, offset_y)
+        if width is None:
+            width = self._width
+        if height is None:
+            height = self._height
+        for data_set in self._destination_data_sets:
+            self._update_overviews(data_set, offset_x, offset_y, width, height)
+
+    @staticmethod
+    def _update_overviews(data_set: gdal.Dataset, offset_x: int, offset_y: int, width: int, height: int):
+        for band_index in range(1, data_set.RasterCount + 1):
+            source_band = data_set.GetRasterBand(band_index)
+            no_data_value = source_band.GetNoDataValue()
+            x_min, y_min, x_max, y_max = offset_x, offset_y, offset_x + width, offset_y + height
+            # every level is derived from the previous one, which has twice its resolution
+            for level in range(source_band.GetOverviewCount()):
+                overview_band = source_band.GetOverview(level)
+                x_min, y_min = x_min - x_min % 2, y_min - y_min % 2
+                x_max, y_max = min(x_max + x_max % 2, source_band.XSize), min(y_max + y_max % 2, source_band.YSize)
+                downsampled = _downsample(source_band.ReadAsArray(x_min, y_min, x_max - x_min, y_max - y_min),
+                                          no_data_value)
+                x_min, y_min = x_min // 2, y_min // 2
+                overview_band.WriteArray(downsampled, xoff=x_min, yoff=y_min)
+                x_max, y_max = x_min + downsampled.shape[1], y_min + downsampled.shape[0]
+                source_band = overview_band
+
     def close(self):
-        pass
-        # for dataset in self._destination_data_sets:
-        #     dataset = None
-        # self._destination_data_sets = None
+        if self._destination_data_sets is None:
+            return
+        super().close()
+        for file_name in self._file_names:
+            working_file_name = _get_working_file_name(file_name)
+            temp_file_name = '{}.tmp.tif'.format(os.path.splitext(file_name)[0])
+            self._write_cog(working_file_name, temp_file_name)
+            os.replace(temp_file_name, file_name)
+            os.remove(working_file_name)
+
+    def _write_cog(self, source_file_name: str, file_name: str):
+        if gdal.GetDriverByName('COG') is not None:
+            cog_data_set = gdal.Translate(file_name, source_file_name, format='COG',
+                                          creationOptions=['COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER',
+                                                           'BLOCKSIZE={}'.format(self._block_size),
+                                                           'OVERVIEWS=FORCE_USE_EXISTING'])
+        else:
+            # before gdal 3.1, COGs are created by copying the overviews of a tiled file, which puts them first
+            with _config_option('GDAL_TIFF_OVR_BLOCKSIZE', str(self._block_size)):
+                cog_data_set = gdal.Translate(file_name, source_file_name, format='GTiff',
+                                              creationOptions=['COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER', 'TILED=YES',
+                                                               'BLOCKXSIZE={}'.format(self._block_size),
+                                                               'BLOCKYSIZE={}'.format(self._block_size),
+                                                               'COPY_SRC_OVERVIEWS=YES'])
+        cog_data_set = None
+
+
+class AsyncWriter(BaseWriter):
+    """
+    Wraps one or more writers so that writes are carried out by background threads, while the caller can continue
+    computing. Writes are queued and carried out in the order in which they have been made. When a queue is full,
+    write blocks, so the memory taken by pending data is bounded. The arrays passed to write must not be modified
+    afterwards. Errors which occur in the background are raised by the next call to write, checkpoint or close.
+    As gdal datasets must not be written from several threads at once, every wrapped writer gets one thread. To write
+    several files in parallel, wrap one writer per file. The data passed to write then holds one array per writer.
+    :param writer: The writer which actually writes the data, or a list of writers which write one file each
+    :param max_queued_writes: The maximum number of writes waiting to be carried out per writer
+    """
+
+    def __init__(self, writer: Union[BaseWriter, Sequence[BaseWriter]], max_queued_writes: int = 4):
+        if isinstance(writer, BaseWriter):
+            self._writers = [writer]
+            self._splits_data = False
+        else:
+            self._writers = list(writer)
+            self._splits_data = True
+        self._queues = [queue.Queue(maxsize=max(max_queued_writes, 1)) for _ in self._writers]
+        self._error = None
+        self._error_lock = threading.Lock()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, args=(task_queue,), name='AsyncWriter', daemon=True)
+                         for task_queue in self._queues]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, task_queue: queue.Queue):
+        while True:
+            task = task_queue.get()
+            try:
+                if task is None:
+                    return
+                # after an error, the remaining tasks are dropped
+                if self._error is None:
+                    method, args = task
+                    method(*args)
+            except BaseException as error:
+                with self._error_lock:
+                    if self._error is None:
+                        self._error = error
+            finally:
+                task_queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, data: List[np.array], width: Optional[int] = None, height: Optional[int] = None,
+              offset_x: Optional[int] = 0, offset_y: Optional[int] = 0):
+        if self._closed:
+            raise ValueError('Writer has already been closed')
+        self._raise_error()
+        if not self._splits_data:
+            self._queues[0].put((self._writers[0].write, (data, width, height, offset_x, offset_y)))
+            return
+        if len(data) != len(self._writers):
+            raise ValueError('Expected data for {} writers, got {}'.format(len(self._writers), len(data)))
+        for writer, task_queue, writer_data in zip(self._writers, self._queues, data):
+            task_queue.put((writer.write, ([writer_data], width, height, offset_x, offset_y)))
+
+    def checkpoint(self):
+        """Waits until all queued writes have been carried out and then sets checkpoints on the wrapped writers."""
+        if self._closed:
+            return
+        for writer, task_queue in zip(self._writers, self._queues):
+            task_queue.put((writer.checkpoint, ()))
+        for task_queue in self._queues:
+            task_queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Waits until all queued writes have been carried out and closes the wrapped writers."""
+        if self._closed:
+            return
+        self._closed = True
+        for task_queue in self._queues:
+            task_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        close_error = None
+        for writer in self._writers:
+            try:
+                writer.close()
+            except BaseException as error:
+                if close_error is None:
+                    close_error = error
+        self._raise_error()
+        if close_error is not None:
+            raise close_error
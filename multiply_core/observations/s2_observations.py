@@ -9,7 +9,7 @@ import xml.etree.ElementTree as eT
 
 from multiply_core.observations import ProductObservations, ObservationData, ProductObservationsCreator, \
     data_validation
-from multiply_core.util import FileRef, Reprojection, get_aux_data_provider
+from multiply_core.util import FileRef, Reprojection, get_aux_data_provider, read_window
 from typing import List, Optional, Tuple, Union
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
@@ -114,9 +114,24 @@ def _prepare_band_emulators(emulator_folder: str, sza: float, saa: float, vza: f
 
 class S2Observations(ProductObservations):
 
-    def __init__(self, file_refs: List[FileRef], reprojection: Optional[Reprojection], emulator_folder: Optional[str]):
+    def __init__(self, file_refs: List[FileRef], reprojection: Optional[Reprojection], emulator_folder: Optional[str],
+                 window: Optional[Tuple[int, int, int, int]] = None, state_mask: Optional[np.array] = None):
+        """
+        :param window: If given, only this window of the (reprojected) data is read. It is given as x offset,
+        y offset, width and height in pixels. Together with a lazy reprojection, only the window is warped.
+        :param state_mask: If given, a mask on the grid of the (reprojected) data. Only the bounding box of the valid
+        pixels within the window is warped. If there are no valid pixels, no data is read at all.
+        """
         self._file_refs = file_refs
         self._reprojection = reprojection
+        # angles have no no data value, so they are read without the state mask to not average in filled pixels
+        self._unmasked_reprojection = reprojection
+        self._window = window
+        self._state_mask = None
+        if state_mask is not None:
+            self._state_mask = self._get_state_mask_within_window(state_mask)
+            if reprojection is not None:
+                self._reprojection = reprojection.with_state_mask(self._state_mask)
         # we assume that all file refs are of the same type
         self._data_type = data_validation.get_valid_type(file_refs[0].url)
         file_szas = np.empty(shape=len(self._file_refs), dtype=np.float32)
@@ -140,6 +155,24 @@ class S2Observations(ProductObservations):
         self._bands_per_observation = len(EMULATOR_BAND_MAP)
         self._no_data_values = NO_DATA_VALUES
 
+    def _get_state_mask_within_window(self, state_mask: np.array) -> np.array:
+        state_mask = np.asarray(state_mask).astype(bool)
+        if self._window is None:
+            return state_mask
+        x_offset, y_offset, width, height = self._window
+        state_mask_within_window = np.zeros_like(state_mask)
+        state_mask_within_window[y_offset:y_offset + height, x_offset:x_offset + width] = \
+            state_mask[y_offset:y_offset + height, x_offset:x_offset + width]
+        return state_mask_within_window
+
+    def _has_valid_pixels(self) -> bool:
+        return self._state_mask is None or bool(self._state_mask.any())
+
+    def _get_empty_data(self) -> np.array:
+        if self._window is not None:
+            return np.zeros((self._window[3], self._window[2]))
+        return np.zeros(self._state_mask.shape)
+
     def _get_metadata_file(self, url: str):
         metadata_file_names = ["metadata.xml", "MTD_TL.xml"]
         for metadata_file_name in metadata_file_names:
@@ -153,11 +186,20 @@ class S2Observations(ProductObservations):
             raise ValueError(f'Invalid band index: {band_index} > {len(BAND_NAMES)}')
         return self._get_raw_band_data_from_name(BAND_NAMES[band_index])
 
-    def _get_raw_band_data_from_name(self, band_name: str) -> np.array:
+    def _get_state_mask_of_window(self) -> np.array:
+        if self._window is None:
+            return self._state_mask
+        x_offset, y_offset, width, height = self._window
+        return self._state_mask[y_offset:y_offset + height, x_offset:x_offset + width]
+
+    def _get_raw_band_data_from_name(self, band_name: str, apply_state_mask: bool = True) -> np.array:
+        if not self._has_valid_pixels():
+            return self._get_empty_data()
         data_set = self._get_raw_data_set_from_name(band_name)
-        if self._reprojection is not None:
-                data_set = self._reprojection.reproject(data_set)
-        return data_set.ReadAsArray()
+        reprojection = self._reprojection if apply_state_mask else self._unmasked_reprojection
+        if reprojection is not None:
+                data_set = reprojection.reproject(data_set)
+        return read_window(data_set, self._window)
 
     def _get_raw_data_set_from_name(self, band_name: str) -> Dataset:
         if len(self._file_refs) > 1:
@@ -223,8 +265,13 @@ class S2Observations(ProductObservations):
 
     def read_granule(self) -> (List[np.array], np.array, np.float, np.float, np.float, List[np.array]):
         band_map = ['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B8A', 'B09', 'B10', 'B11', 'B12']
+        if not self._has_valid_pixels():
+            return None, None, None, None, None, None
         cloud_mask = self._get_raw_band_data_from_name(CLOUD_MASK_NAME)
         mask = cloud_mask <= BAND_PROB_THRESHOLD
+        if self._state_mask is not None:
+            # pixels outside of the state mask are filled, which must not be taken for clear pixels
+            mask = np.logical_and(mask, self._get_state_mask_of_window())
         if mask.sum() == 0:
             return None, None, None, None, None, None
         rho_surface = []
@@ -249,8 +296,8 @@ class S2Observations(ProductObservations):
         rho_unc = np.nanmean(rho_unc, axis=(1, 2))
         rho_surface[:, ~mask] = np.nan
 
-        sun_angles = self._get_raw_band_data_from_name(SUN_ANGLES_NAME)
-        view_angles = self._get_raw_band_data_from_name(VIEW_ANGLES_NAME)
+        sun_angles = self._get_raw_band_data_from_name(SUN_ANGLES_NAME, apply_state_mask=False)
+        view_angles = self._get_raw_band_data_from_name(VIEW_ANGLES_NAME, apply_state_mask=False)
         sza = np.cos(np.deg2rad(sun_angles[1].mean() / 100.0))
         vza = np.cos(np.deg2rad(view_angles[1].mean() / 100.0))
         saa = sun_angles[0].mean() / 100.0
@@ -0,0 +1,140 @@
+"""
+Description
+===========
+
+This module allows to process the tiles of a tile grid concurrently and to write the results of all tiles to a
+common output.
+"""
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+import logging
+import numpy as np
+import os
+
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiply_core.util import Tile, TileGrid, limit_warp_threads
+from .output import BaseWriter
+from typing import Callable, List, Optional
+
+logger = logging.getLogger('TileProcessing')
+
+TileFunction = Callable[[Tile], Optional[List[np.array]]]
+
+
+def _process_tile(tile_function: TileFunction, tile_grid: TileGrid, tile_x: int, tile_y: int) \
+        -> Optional[List[np.array]]:
+    # the tile is set up in the worker, as its reprojection cannot be sent to other processes
+    # tiles are processed in parallel already, so warps within a worker do not use further threads
+    with limit_warp_threads(1):
+        return tile_function(tile_grid.get_tile(tile_x, tile_y))
+
+
+class TileProcessor(object):
+    """
+    Runs a function on every tile of a tile grid in a pool of workers and writes the results with a writer.
+    Results are written in the order of the tiles, so the output does not depend on which worker finishes first.
+    :param tile_grid: The grid with the tiles to be processed
+    :param max_workers: The number of workers. If not given, the number of processors is used.
+    :param max_tiles_in_flight: The maximum number of tiles which are being processed or whose results are waiting to
+    be written. This bounds the memory needed for results. If not given, twice the number of workers is used.
+    :param max_retries: How often the processing of a tile is retried after it has failed
+    :param use_processes: If true, tiles are processed in a process pool, otherwise in a thread pool. With processes,
+    the tile function must be picklable, i.e., be defined on the top level of a module.
+    As tiles are processed in parallel, warps within the tile function use a single thread (see limit_warp_threads).
+    """
+
+    def __init__(self, tile_grid: TileGrid, max_workers: Optional[int] = None,
+                 max_tiles_in_flight: Optional[int] = None, max_retries: int = 1, use_processes: bool = True):
+        if max_retries < 0:
+            raise ValueError('Number of retries must not be negative')
+        self._tile_grid = tile_grid
+        self._max_workers = max_workers
+        self._max_tiles_in_flight = max_tiles_in_flight
+        self._max_retries = max_retries
+        self._use_processes = use_processes
+
+    def _create_executor(self) -> Executor:
+        if self._use_processes:
+            return ProcessPoolExecutor(max_workers=self._max_workers)
+        return ThreadPoolExecutor(max_workers=self._max_workers)
+
+    def _get_max_tiles_in_flight(self) -> int:
+        if self._max_tiles_in_flight is not None:
+            return max(self._max_tiles_in_flight, 1)
+        if self._max_workers is not None:
+            return 2 * self._max_workers
+        return 2 * (os.cpu_count() or 1)
+
+    def process(self, tile_function: TileFunction, writer: Optional[BaseWriter] = None) -> int:
+        """
+        Processes all tiles of the grid.
+        :param tile_function: A function which is called with a tile and returns a list of arrays for the window of
+        the tile, one for each file of the writer. It may return None for tiles without results.
+        :param writer: A writer for the whole grid to which the results are written. It is not closed afterwards.
+        :return: The number of tiles for which results have been written
+        :raises RuntimeError: If a tile could not be processed after all retries
+        """
+        tile_indexes = [(tile.tile_x, tile.tile_y) for tile in self._tile_grid]
+        num_written = 0
+        with self._create_executor() as executor:
+            max_tiles_in_flight = self._get_max_tiles_in_flight()
+            futures = {}
+            attempts = {}
+            results = {}
+            next_to_submit = 0
+            next_to_write = 0
+            try:
+                while next_to_write < len(tile_indexes):
+                    while next_to_submit < len(tile_indexes) and \
+                            next_to_submit - next_to_write < max_tiles_in_flight:
+                        self._submit(executor, tile_function, tile_indexes, next_to_submit, futures, attempts)
+                        next_to_submit += 1
+                    done, _ = wait(futures.keys(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = futures.pop(future)
+                        error = future.exception()
+                        if error is None:
+                            results[index] = future.result()
+                        elif attempts[index] <= self._max_retries:
+                            logger.warning('Processing of tile {} failed, retrying: {}'.format(tile_indexes[index],
+                                                                                              error))
+                            self._submit(executor, tile_function, tile_indexes, index, futures, attempts)
+                        else:
+                            raise RuntimeError('Processing of tile {} failed after {} attempts'.
+                                               format(tile_indexes[index], attempts[index])) from error
+                    while next_to_write in results:
+                        if self._write(writer, tile_indexes[next_to_write], results.pop(next_to_write)):
+                            num_written += 1
+                        next_to_write += 1
+            finally:
+                for future in futures.keys():
+                    future.cancel()
+        return num_written
+
+    def _submit(self, executor: Executor, tile_function: TileFunction, tile_indexes: List, index: int, futures: dict,
+                attempts: dict):
+        tile_x, tile_y = tile_indexes[index]
+        future = executor.submit(_process_tile, tile_function, self._tile_grid, tile_x, tile_y)
+        futures[future] = index
+        attempts[index] = attempts.get(index, 0) + 1
+
+    def _write(self, writer: Optional[BaseWriter], tile_index: tuple, result: Optional[List[np.array]]) -> bool:
+        if result is None:
+            return False
+        if writer is not None:
+            x_offset, y_offset, width, height = self._tile_grid.get_tile_window(*tile_index)
+            writer.write(result, width, height, x_offset, y_offset)
+        return True
+
+
+def process_tiles(tile_grid: TileGrid, tile_function: TileFunction, writer: Optional[BaseWriter] = None,
+                  max_workers: Optional[int] = None, max_tiles_in_flight: Optional[int] = None, max_retries: int = 1,
+                  use_processes: bool = True) -> int:
+    """
+    Runs a function on every tile of a tile grid in parallel and writes the results with a writer.
+    See TileProcessor for a description of the parameters.
+    :return: The number of tiles for which results have been written
+    """
+    tile_processor = TileProcessor(tile_grid, max_workers, max_tiles_in_flight, max_retries, use_processes)
+    return tile_processor.process(tile_function, writer)
@@ -0,0 +1,270 @@
+"""
+Description
+===========
+
+This module allows to write results for many dates into NetCDF4 files with one (time, y, x) variable each, and to
+read them back. Chunks span many dates but only a small spatial area, so the time series of a pixel can be read from
+a few chunks instead of from one file per date.
+"""
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+import numpy as np
+import os
+
+from datetime import datetime
+from multiply_core.util import get_time_from_string
+from .output import Writer, _to_raster_shape
+from typing import List, Optional, Tuple, Union
+
+_EPOCH = np.datetime64('1970-01-01T00:00:00', 's')
+_TIME_UNITS = 'seconds since 1970-01-01 00:00:00'
+
+
+def _to_seconds(time: Union[str, datetime], adjust_to_last_day: bool = False) -> int:
+    if type(time) is str:
+        time = get_time_from_string(time, adjust_to_last_day)
+    return int((np.datetime64(time, 's') - _EPOCH).astype(np.int64))
+
+
+def _get_netcdf_data_type(data_type: str) -> str:
+    if data_type == 'Float':
+        return 'f4'
+    elif data_type == 'Double':
+        return 'f8'
+    elif data_type == 'Int':
+        return 'i4'
+    raise ValueError('Data Type {} not supported.'.format(data_type))
+
+
+def _get_variable_name(file_name: str) -> str:
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+class NetCdfTimeSeriesWriter(Writer):
+    """
+    Writes data into NetCDF4 files, one per variable, which hold the data of all dates. Each file has a variable with
+    the dimensions (time, y, x), or (time, band, y, x) for several bands, named after the file. Writing data for a
+    date which is not in a file yet appends it to the time dimension, writing data for a date which is already in
+    there overwrites it. Hence, results can be written date by date with one writer per date.
+    Unlike GeoTIFFs for different dates, a file must not be written by several writers at the same time, as HDF5 does
+    not support concurrent writers. Writers for different dates must therefore be used one after the other, and tiles
+    computed in parallel must be passed to a single writer, e.g., via a TileProcessor.
+    The coordinate reference system is stored in the way gdal expects it, so gdal can read the files, too.
+    :param time: The date for which data is written. It can also be set later with set_time.
+    :param time_chunk_size: The number of dates in a chunk. Larger chunks make reading time series faster, but
+    appending a date slower, as it has to update chunks which hold many dates.
+    :param spatial_chunk_size: The width and height of a chunk in pixels.
+    """
+
+    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+                 num_bands: Optional[List[int]] = None, data_types: Optional[List[str]] = None,
+                 time: Optional[Union[str, datetime]] = None, time_chunk_size: int = 16, spatial_chunk_size: int = 64):
+        self._time_chunk_size = time_chunk_size
+        self._spatial_chunk_size = spatial_chunk_size
+        super().__init__(file_names, geo_transform, projection, width, height, num_bands, data_types)
+        self._time_indexes = None
+        if time is not None:
+            self.set_time(time)
+
+    def init(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+             num_bands: Optional[List[int]] = None, data_types: Optional[List[str]] = None):
+        import netCDF4
+        if num_bands is None or len(num_bands) == 0:
+            num_bands = [1] * len(file_names)
+        elif len(num_bands) != len(file_names):
+            raise ValueError('List with number of bands must be of same size as list of file names')
+        self.num_bands = num_bands
+        if data_types is None or len(data_types) == 0:
+            data_types = ['Float'] * len(file_names)
+        elif len(data_types) != len(file_names):
+            raise ValueError('List with data types must be of same size as list of file names')
+        netcdf_data_types = [_get_netcdf_data_type(data_type) for data_type in data_types]
+        self._width = width
+        self._height = height
+        self._file_names = []
+        self._data_sets = []
+        self._variable_names = []
+        for i, file_name in enumerate(file_names):
+            parent_dir = os.path.dirname(file_name)
+            if not os.path.exists(parent_dir):
+                os.makedirs(parent_dir)
+            if not file_name.endswith('.nc'):
+                file_name = file_name + '.nc'
+            if os.path.exists(file_name):
+                data_set = netCDF4.Dataset(file_name, 'a')
+            else:
+                data_set = netCDF4.Dataset(file_name, 'w', format='NETCDF4')
+                self._create_variables(data_set, _get_variable_name(file_name), geo_transform, projection, width,
+                                       height, num_bands[i], netcdf_data_types[i])
+            self._file_names.append(file_name)
+            self._data_sets.append(data_set)
+            self._variable_names.append(_get_variable_name(file_name))
+
+    def _create_variables(self, data_set, variable_name: str, geo_transform: tuple, projection: str, width: int,
+                          height: int, num_bands: int, data_type: str):
+        data_set.createDimension('time', None)
+        data_set.createDimension('y', height)
+        data_set.createDimension('x', width)
+        time_variable = data_set.createVariable('time', 'i8', ('time',))
+        time_variable.units = _TIME_UNITS
+        time_variable.calendar = 'standard'
+        # coordinates of the pixel centres
+        x_variable = data_set.createVariable('x', 'f8', ('x',))
+        x_variable[:] = geo_transform[0] + (np.arange(width) + 0.5) * geo_transform[1]
+        y_variable = data_set.createVariable('y', 'f8', ('y',))
+        y_variable[:] = geo_transform[3] + (np.arange(height) + 0.5) * geo_transform[5]
+        crs_variable = data_set.createVariable('crs', 'i4')
+        crs_variable.spatial_ref = projection
+        crs_variable.GeoTransform = ' '.join([str(value) for value in geo_transform])
+        dimensions = ('time', 'y', 'x')
+        chunk_sizes = [self._time_chunk_size, min(self._spatial_chunk_size, height),
+                       min(self._spatial_chunk_size, width)]
+        if num_bands > 1:
+            data_set.createDimension('band', num_bands)
+            dimensions = ('time', 'band', 'y', 'x')
+            chunk_sizes.insert(1, 1)
+        fill_value = np.nan if data_type.startswith('f') else None
+        variable = data_set.createVariable(variable_name, data_type, dimensions, zlib=True, shuffle=True,
+                                           chunksizes=chunk_sizes, fill_value=fill_value)
+        variable.grid_mapping = 'crs'
+
+    def set_time(self, time: Union[str, datetime]):
+        """
+        Sets the date for which data is written from now on.
+        """
+        if self._data_sets is None:
+            raise ValueError('Writer has already been closed')
+        seconds = _to_seconds(time)
+        self._time_indexes = []
+        for data_set in self._data_sets:
+            times = data_set.variables['time'][:]
+            indexes = np.where(times == seconds)[0]
+            if len(indexes) > 0:
+                self._time_indexes.append(int(indexes[0]))
+            else:
+                data_set.variables['time'][len(times)] = seconds
+                self._time_indexes.append(len(times))
+
+    def write(self, data: List[np.array], width: Optional[int] = None, height: Optional[int] = None,
+              offset_x: Optional[int] = 0, offset_y: Optional[int] = 0):
+        if self._data_sets is None:
+            raise ValueError('Writer has already been closed')
+        if self._time_indexes is None:
+            raise ValueError('No time has been set')
+        assert len(data) == len(self._data_sets)
+        if width is None:
+            width = self._width
+        if height is None:
+            height = self._height
+        for i, d in enumerate(data):
+            d = _to_raster_shape(d, self.num_bands[i], width, height)
+            variable = self._data_sets[i].variables[self._variable_names[i]]
+            if self.num_bands[i] > 1:
+                variable[self._time_indexes[i], :, offset_y:offset_y + height, offset_x:offset_x + width] = d
+            else:
+                variable[self._time_indexes[i], offset_y:offset_y + height, offset_x:offset_x + width] = d
+
+    def checkpoint(self):
+        if self._data_sets is None:
+            return
+        for data_set in self._data_sets:
+            data_set.sync()
+
+    def close(self):
+        if self._data_sets is None:
+            return
+        for data_set in self._data_sets:
+            data_set.close()
+        self._data_sets = None
+
+
+class NetCdfTimeSeriesReader(object):
+    """
+    Reads the data written by a NetCdfTimeSeriesWriter. Times are returned in ascending order, regardless of the
+    order in which they have been written.
+    :param file_name: The file to read from
+    :param variable_name: The name of the variable to read. If not given, the variable named after the file is read.
+    """
+
+    def __init__(self, file_name: str, variable_name: Optional[str] = None):
+        import netCDF4
+        self._data_set = netCDF4.Dataset(file_name, 'r')
+        if variable_name is None:
+            variable_name = _get_variable_name(file_name)
+        if variable_name not in self._data_set.variables:
+            raise ValueError('File {} has no variable {}'.format(file_name, variable_name))
+        self._variable = self._data_set.variables[variable_name]
+        self._variable.set_auto_mask(False)
+        seconds = np.asarray(self._data_set.variables['time'][:], dtype=np.int64)
+        self._time_order = np.argsort(seconds, kind='mergesort')
+        self._times = (_EPOCH + seconds[self._time_order]).astype('datetime64[s]')
+
+    @property
+    def times(self) -> np.ndarray:
+        """The dates in the file, as numpy datetime64 in ascending order"""
+        return self._times
+
+    @property
+    def width(self) -> int:
+        return len(self._data_set.dimensions['x'])
+
+    @property
+    def height(self) -> int:
+        return len(self._data_set.dimensions['y'])
+
+    @property
+    def geo_transform(self) -> tuple:
+        return tuple(float(value) for value in self._data_set.variables['crs'].GeoTransform.split())
+
+    @property
+    def projection(self) -> str:
+        return self._data_set.variables['crs'].spatial_ref
+
+    def _get_time_selection(self, start_time: Optional[Union[str, datetime]],
+                            end_time: Optional[Union[str, datetime]]) -> np.ndarray:
+        selection = np.ones(len(self._times), dtype=bool)
+        if start_time is not None:
+            selection &= self._times >= _EPOCH + np.timedelta64(_to_seconds(start_time), 's')
+        if end_time is not None:
+            # an end time given as a date includes the whole day
+            selection &= self._times <= _EPOCH + np.timedelta64(_to_seconds(end_time, True), 's')
+        return selection
+
+    def read_time_series(self, x: int, y: int, start_time: Optional[Union[str, datetime]] = None,
+                         end_time: Optional[Union[str, datetime]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reads the time series of a single pixel.
+        :return: The dates and the values of the pixel at these dates. For several bands, the values are of shape
+        (time, band).
+        """
+        times, data = self.read_window(x, y, 1, 1, start_time, end_time)
+        return times, data[..., 0, 0]
+
+    def read_window(self, x: int, y: int, width: int, height: int, start_time: Optional[Union[str, datetime]] = None,
+                    end_time: Optional[Union[str, datetime]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reads the data of a window for all dates within a time range.
+        :return: The dates and the data, of shape (time, height, width) or (time, band, height, width)
+        """
+        selection = self._get_time_selection(start_time, end_time)
+        time_indexes = self._time_order[selection]
+        if len(time_indexes) == 0:
+            shape = (0,) + self._variable.shape[1:-2] + (height, width)
+            return self._times[selection], np.empty(shape, dtype=self._variable.dtype)
+        # the contiguous range of stored dates is read at once and sorted afterwards
+        first, last = int(time_indexes.min()), int(time_indexes.max())
+        band_index = (slice(None),) * (len(self._variable.shape) - 3)
+        data = self._variable[(slice(first, last + 1),) + band_index + (slice(y, y + height), slice(x, x + width))]
+        return self._times[selection], np.asarray(data)[time_indexes - first]
+
+    def close(self):
+        if self._data_set is not None:
+            self._data_set.close()
+            self._data_set = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,127 @@
+"""
+Description
+===========
+
+This module allows to watch a directory tree for data products that are added to it over time.
+"""
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from multiply_core.util import FileRef, get_file_ref_creation
+from .data_validation import get_valid_type
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger('ValidFilesWatcher')
+
+
+class ValidFilesWatcher(object):
+    """
+    Watches a directory tree for valid data products of the given types. Every call to poll returns file refs to
+    the products which have become valid since the previous call. Between calls, a snapshot of the modification times
+    of all directories is kept, so that only directories which have changed need to be listed again.
+    Products for which no file ref can be created yet, e.g., because their metadata is still being written, are tried
+    again with every poll until this succeeds.
+    """
+
+    def __init__(self, datasets_dir: str, data_types: List[str]):
+        self._datasets_dir = datasets_dir.replace('\\', '/').rstrip('/')
+        self._data_types = data_types
+        self._file_ref_creation = get_file_ref_creation()
+        # maps a directory to its modification time and its sub directories at the time it was listed
+        self._directories = {}
+        self._known_paths = set()
+        self._pending_paths = set()
+
+    def poll(self) -> List[FileRef]:
+        """
+        Scans the directory tree for changes.
+        :return: File refs to all products which have become valid since the last call, sorted by their urls.
+        """
+        types_and_paths = []
+        for candidate in sorted(self._get_changed_paths() | self._pending_paths):
+            if candidate in self._known_paths:
+                continue
+            data_type = get_valid_type(candidate)
+            if len(self._data_types) > 0 and data_type in self._data_types:
+                types_and_paths.append((data_type, candidate))
+        self._pending_paths = set()
+        file_refs = []
+        for (data_type, path), file_ref in zip(types_and_paths, self._create_file_refs(types_and_paths)):
+            if file_ref is None:
+                self._pending_paths.add(path)
+                continue
+            self._known_paths.add(file_ref.url)
+            file_refs.append(file_ref)
+        return file_refs
+
+    def _create_file_refs(self, types_and_paths: Sequence[Tuple[str, str]]) -> List[Optional[FileRef]]:
+        if len(types_and_paths) == 0:
+            return []
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(lambda type_and_path: self._create_file_ref(*type_and_path), types_and_paths))
+
+    def _create_file_ref(self, data_type: str, path: str) -> Optional[FileRef]:
+        # a single product which cannot be read must not keep the others from being found
+        try:
+            return self._file_ref_creation.get_file_ref(data_type, path)
+        except Exception as error:
+            logger.warning('Could not create file ref for {}, will try again: {}'.format(path, error))
+            return None
+
+    def watch(self, interval: float = 60.0, max_polls: Optional[int] = None) -> Iterator[FileRef]:
+        """
+        Polls the directory tree repeatedly and yields file refs to products as soon as they have become valid.
+        :param interval: The time in seconds to wait between two polls.
+        :param max_polls: The number of polls after which watching stops. If not given, watching continues forever.
+        :return: An iterator over file refs to newly valid products.
+        """
+        num_polls = 0
+        while True:
+            for file_ref in self.poll():
+                yield file_ref
+            num_polls += 1
+            if max_polls is not None and num_polls >= max_polls:
+                return
+            time.sleep(interval)
+
+    def _get_changed_paths(self) -> set:
+        changed_paths = set()
+        visited_directories = set()
+        directories = [self._datasets_dir]
+        while len(directories) > 0:
+            directory = directories.pop()
+            try:
+                # the modification time is read before the listing, so changes made meanwhile are found next time
+                modification_time = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            visited_directories.add(directory)
+            snapshot = self._directories.get(directory)
+            if snapshot is not None and snapshot[0] == modification_time:
+                directories.extend(snapshot[1])
+                continue
+            sub_directories = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        path = '{}/{}'.format(directory, entry.name)
+                        changed_paths.add(path)
+                        if entry.is_dir():
+                            sub_directories.append(path)
+            except OSError:
+                continue
+            # a change within a directory might have turned the directory itself into a valid product
+            changed_paths.add(directory)
+            self._directories[directory] = (modification_time, sub_directories)
+            directories.extend(sub_directories)
+        for directory in list(self._directories.keys()):
+            if directory not in visited_directories:
+                del self._directories[directory]
+        return changed_paths
@@ -1,8 +1,11 @@
 from .aux_data_provision import AuxDataProvider, AuxDataProviderCreator, DefaultAuxDataProvider, get_aux_data_provider
-from .util import AttributeDict, FileRef, compute_distance, get_time_from_string, get_days_of_month, \
-    get_time_from_year_and_day_of_year, is_leap_year, get_mime_type, block_diag, are_times_equal, \
+from .util import AttributeDict, FileRef, compute_distance, get_time_from_string, get_times_from_strings, \
+    get_days_of_month, get_time_from_year_and_day_of_year, is_leap_year, get_mime_type, block_diag, are_times_equal, \
     are_polygons_almost_equal, get_logger
-from .reproject import transform_coordinates, get_spatial_reference_system_from_dataset, get_target_resolutions, \
-    reproject_dataset, reproject_image, Reprojection, reproject_to_wgs84, get_num_tiles, \
-    get_mask_data_set_and_reprojection
-from .file_ref_creation import FileRefCreation
+from .reproject import transform_coordinates, transform_coordinate_arrays, get_spatial_reference_system_from_dataset, \
+    get_target_resolutions, reproject_dataset, reproject_image, reproject_images, Reprojection, reproject_to_wgs84, \
+    get_num_tiles, get_mask_data_set_and_reprojection, reproject_rois_to_wgs84, read_window, WarpConfiguration, Tile, \
+    TileGrid, limit_warp_threads
+from .warp_cache import WarpCache, get_warp_cache, set_warp_cache
+from .file_ref_creation import FileRefCreation, get_file_ref_creation
+from .file_ref_table import FileRefTable
@@ -8,14 +8,19 @@ This module contains MULTIPLY File Ref Creators. The purpose of these is to extr
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
 import os
+import threading
 
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from multiply_core.util import FileRef, get_time_from_string
 from multiply_core.variables import get_registered_variables
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple
 from datetime import datetime
 import xml.etree.ElementTree as eT
 
+_FILE_REF_CREATION = None
+_FILE_REF_CREATION_LOCK = threading.Lock()
+
 
 class FileRefCreator(metaclass=ABCMeta):
 
@@ -35,7 +40,7 @@ class AWSS2L2FileRefCreator(FileRefCreator):
 
     def create_file_ref(self, path: str) -> FileRef:
         time = self._extract_time_from_metadata_file(path)
-        return FileRef(path, time, time, 'application/x-directory')
+        return FileRef(path, time, time, 'application/x-directory', self.name())
 
     @staticmethod
     def _get_xml_root(xml_file_name: str):
@@ -66,7 +71,7 @@ class S2L2FileRefCreator(FileRefCreator):
     def create_file_ref(self, path: str) -> FileRef:
         start_time = self._extract_time_from_metadata_file(path, self._start_time_element)
         stop_time = self._extract_time_from_metadata_file(path, self._stop_time_element)
-        return FileRef(path, start_time, stop_time, 'application/x-directory')
+        return FileRef(path, start_time, stop_time, 'application/x-directory', self.name())
 
     @staticmethod
     def _get_xml_root(xml_file_name: str):
@@ -114,13 +119,13 @@ class VariableFileRefCreator(FileRefCreator):
         date_part = end_of_path.split('_')[-1].split('.tif')[0].split('A')[-1]
         time = get_time_from_string(date_part)
         time = datetime.strftime(time, '%Y-%m-%d')
-        return FileRef(path, time, time, 'image/tiff')
+        return FileRef(path, time, time, 'image/tiff', self.name())
 
 
 class FileRefCreation(object):
 
     def __init__(self):
-        self.FILE_REF_CREATORS = []
+        self.FILE_REF_CREATORS = {}
         self.add_file_ref_creator(AWSS2L2FileRefCreator())
         self.add_file_ref_creator(S2L2FileRefCreator())
         variables = get_registered_variables()
@@ -128,9 +133,35 @@ class FileRefCreation(object):
             self.add_file_ref_creator(VariableFileRefCreator(variable.short_name))
 
     def add_file_ref_creator(self, file_ref_creator: FileRefCreator):
-        self.FILE_REF_CREATORS.append(file_ref_creator)
+        if file_ref_creator.name() not in self.FILE_REF_CREATORS:
+            self.FILE_REF_CREATORS[file_ref_creator.name()] = file_ref_creator
 
     def get_file_ref(self, data_type: str, path: str) -> Optional[FileRef]:
-        for file_ref_creator in self.FILE_REF_CREATORS:
-            if file_ref_creator.name() == data_type:
-                return file_ref_creator.create_file_ref(path)
+        if data_type in self.FILE_REF_CREATORS:
+            return self.FILE_REF_CREATORS[data_type].create_file_ref(path)
+
+    def create_file_refs(self, types_and_paths: Sequence[Tuple[str, str]], max_workers: Optional[int] = None) \
+            -> List[Optional[FileRef]]:
+        """
+        Creates file refs for many files at once. Metadata is read concurrently.
+        :param types_and_paths: A sequence of pairs of data type and path
+        :param max_workers: The maximum number of threads used to create the file refs. If not given, the default of
+        the ThreadPoolExecutor is used.
+        :return: A list of file refs in the order of the input. Where no file ref could be created, it contains None.
+        """
+        if len(types_and_paths) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda type_and_path: self.get_file_ref(*type_and_path), types_and_paths))
+
+
+def get_file_ref_creation() -> FileRefCreation:
+    """
+    :return: A FileRefCreation that is shared within the process. It is set up on first use.
+    """
+    global _FILE_REF_CREATION
+    if _FILE_REF_CREATION is None:
+        with _FILE_REF_CREATION_LOCK:
+            if _FILE_REF_CREATION is None:
+                _FILE_REF_CREATION = FileRefCreation()
+    return _FILE_REF_CREATION
@@ -0,0 +1,205 @@
+"""
+Description
+===========
+
+This module contains a columnar representation of many file refs. It allows to filter and group large numbers of
+file refs without handling every single one of them in Python.
+"""
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+import numpy as np
+
+from datetime import datetime
+from multiply_core.util import FileRef, get_times_from_strings
+from typing import Dict, List, Optional, Sequence, Union
+
+_MICROSECONDS_PER_SECOND = 1000000
+_MICROSECONDS_PER_DAY = 86400 * _MICROSECONDS_PER_SECOND
+# int64 representation of NaT
+_NO_TIME = np.iinfo(np.int64).min
+
+
+def _get_codes(values: Sequence[Optional[str]]) -> (np.ndarray, List[str]):
+    categories = sorted(set(value for value in values if value is not None))
+    category_codes = dict(zip(categories, range(len(categories))))
+    codes = np.array([category_codes.get(value, -1) for value in values], dtype=np.int32)
+    return codes, categories
+
+
+def _get_times(time_strings: Sequence[Optional[str]], adjust_to_last_day: bool = False) -> np.ndarray:
+    # file refs without times may hold None as well as empty strings
+    return get_times_from_strings(['' if time_string is None else time_string for time_string in time_strings],
+                                  adjust_to_last_day).view(np.int64)
+
+
+def _to_object_array(values: Sequence) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _to_microseconds(time: Union[str, datetime], adjust_to_last_day: bool = False) -> int:
+    if type(time) is str:
+        return int(get_times_from_strings([time], adjust_to_last_day)[0].astype(np.int64))
+    return int(np.datetime64(time, 'us').astype(np.int64))
+
+
+def _to_time_strings(times: np.ndarray) -> List[str]:
+    unit = 's' if np.all(times[times != _NO_TIME] % _MICROSECONDS_PER_SECOND == 0) else 'us'
+    time_strings = np.datetime_as_string(times.view('datetime64[us]'), unit=unit)
+    return ['' if time == _NO_TIME else time_string for time, time_string in zip(times, time_strings)]
+
+
+class FileRefTable(object):
+    """
+    A table of file refs which are held column-wise in numpy arrays. Start and end times are stored as int64
+    microseconds since 1970-01-01 (NaT, if no time is given), data types and mime types as int32 codes into the lists
+    data_types and mime_types (-1, if no data type is given). End times without time of day, such as '2017-06-05',
+    are stored as the end of that day.
+    The time strings of the file refs a table has been created from can be kept in object arrays, so that converting
+    the table back gives file refs that are equal to the original ones.
+    Slicing a table returns a table that shares the arrays of the original one.
+    """
+
+    def __init__(self, urls: np.ndarray, start_times: np.ndarray, end_times: np.ndarray, type_codes: np.ndarray,
+                 mime_codes: np.ndarray, data_types: List[str], mime_types: List[str],
+                 start_time_strings: Optional[np.ndarray] = None, end_time_strings: Optional[np.ndarray] = None):
+        if not len(urls) == len(start_times) == len(end_times) == len(type_codes) == len(mime_codes):
+            raise ValueError('All columns of a file ref table must be of the same length')
+        if (start_time_strings is not None and len(start_time_strings) != len(urls)) or \
+                (end_time_strings is not None and len(end_time_strings) != len(urls)):
+            raise ValueError('All columns of a file ref table must be of the same length')
+        self._urls = urls
+        self._start_times = start_times
+        self._end_times = end_times
+        self._type_codes = type_codes
+        self._mime_codes = mime_codes
+        self._data_types = data_types
+        self._mime_types = mime_types
+        self._start_time_strings = start_time_strings
+        self._end_time_strings = end_time_strings
+
+    @classmethod
+    def from_file_refs(cls, file_refs: List[FileRef]) -> 'FileRefTable':
+        urls = _to_object_array([file_ref.url for file_ref in file_refs])
+        start_time_strings = _to_object_array([file_ref.start_time for file_ref in file_refs])
+        end_time_strings = _to_object_array([file_ref.end_time for file_ref in file_refs])
+        start_times = _get_times(start_time_strings)
+        end_times = _get_times(end_time_strings, adjust_to_last_day=True)
+        type_codes, data_types = _get_codes([file_ref.data_type for file_ref in file_refs])
+        mime_codes, mime_types = _get_codes([file_ref.mime_type for file_ref in file_refs])
+        return FileRefTable(urls, start_times, end_times, type_codes, mime_codes, data_types, mime_types,
+                            start_time_strings, end_time_strings)
+
+    def to_file_refs(self) -> List[FileRef]:
+        """
+        Converts the table into a list of file refs. Times are given as the strings the table has been created from,
+        so the file refs are equal to the original ones. Tables without these strings give times in ISO format, with
+        fractions of seconds only if any of the times of the table has them.
+        """
+        start_times = self._start_time_strings
+        if start_times is None:
+            start_times = _to_time_strings(self._start_times)
+        end_times = self._end_time_strings
+        if end_times is None:
+            end_times = _to_time_strings(self._end_times)
+        file_refs = []
+        data_types = self._data_types + [None]
+        mime_types = self._mime_types + [None]
+        for i in range(len(self)):
+            file_refs.append(FileRef(self._urls[i], start_times[i], end_times[i], mime_types[self._mime_codes[i]],
+                                     data_types[self._type_codes[i]]))
+        return file_refs
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def __getitem__(self, item: Union[slice, np.ndarray]) -> 'FileRefTable':
+        """Returns a table with the selected rows. For slices, the arrays of this table are shared."""
+        start_time_strings = None if self._start_time_strings is None else self._start_time_strings[item]
+        end_time_strings = None if self._end_time_strings is None else self._end_time_strings[item]
+        return FileRefTable(self._urls[item], self._start_times[item], self._end_times[item],
+                            self._type_codes[item], self._mime_codes[item], self._data_types, self._mime_types,
+                            start_time_strings, end_time_strings)
+
+    @property
+    def urls(self) -> np.ndarray:
+        return self._urls
+
+    @property
+    def start_times(self) -> np.ndarray:
+        return self._start_times
+
+    @property
+    def end_times(self) -> np.ndarray:
+        return self._end_times
+
+    @property
+    def type_codes(self) -> np.ndarray:
+        return self._type_codes
+
+    @property
+    def mime_codes(self) -> np.ndarray:
+        return self._mime_codes
+
+    @property
+    def data_types(self) -> List[str]:
+        return self._data_types
+
+    @property
+    def mime_types(self) -> List[str]:
+        return self._mime_types
+
+    def get_time_mask(self, start_time: Optional[Union[str, datetime]] = None,
+                      end_time: Optional[Union[str, datetime]] = None) -> np.ndarray:
+        """
+        :return: A boolean array which is true for all file refs whose time range intersects with the given one.
+        If no time is given, the time range is not restricted in that direction. An end time given as a string
+        without time of day, such as '2017-06-05', includes the whole day.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if start_time is not None:
+            mask &= (self._end_times != _NO_TIME) & (self._end_times >= _to_microseconds(start_time))
+        if end_time is not None:
+            mask &= (self._start_times != _NO_TIME) & (self._start_times <= _to_microseconds(end_time, True))
+        return mask
+
+    def get_type_mask(self, data_types: Sequence[str]) -> np.ndarray:
+        """
+        :return: A boolean array which is true for all file refs of any of the given data types.
+        """
+        codes = [i for i, data_type in enumerate(self._data_types) if data_type in data_types]
+        return np.isin(self._type_codes, codes)
+
+    def select(self, start_time: Optional[Union[str, datetime]] = None,
+               end_time: Optional[Union[str, datetime]] = None,
+               data_types: Optional[Sequence[str]] = None) -> 'FileRefTable':
+        """
+        :return: A table with the file refs which intersect with the time range and are of any of the data types.
+        """
+        mask = self.get_time_mask(start_time, end_time)
+        if data_types is not None:
+            mask &= self.get_type_mask(data_types)
+        return self[mask]
+
+    def sort_by_start_time(self) -> 'FileRefTable':
+        """
+        :return: A table with the file refs sorted by start time. File refs without start time come first.
+        """
+        return self[np.argsort(self._start_times, kind='mergesort')]
+
+    def group_by_day(self) -> Dict[datetime, 'FileRefTable']:
+        """
+        Groups the file refs by the day of their start time. File refs without start time are left out.
+        :return: A dictionary from the days, in ascending order, to tables with the file refs starting on these days.
+        """
+        sorted_table = self[self._start_times != _NO_TIME].sort_by_start_time()
+        days = sorted_table.start_times // _MICROSECONDS_PER_DAY
+        unique_days, day_starts = np.unique(days, return_index=True)
+        day_ends = np.append(day_starts[1:], len(days))
+        groups = {}
+        for day, day_start, day_end in zip(unique_days, day_starts, day_ends):
+            date = np.datetime64(int(day), 'D').astype(datetime)
+            groups[datetime(date.year, date.month, date.day)] = sorted_table[day_start:day_end]
+        return groups
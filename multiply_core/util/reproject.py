@@ -1,38 +1,113 @@
 import gdal
+import hashlib
 import numpy as np
+import ogr
+import os
 import osr
 import pyproj
-from functools import partial
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from shapely.geometry import Polygon
 from shapely.ops import transform
 from shapely.wkt import dumps, loads
-from typing import Optional, Sequence, Tuple, Union
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+from .warp_cache import WarpCache, get_warp_cache
 
 __author__ = "José Luis Gómez-Dans (University College London)," \
              "Tonio Fincke (Brockmann Consult GmbH)"
 
+_TRANSFORMERS = threading.local()
+_WARP_THREAD_LIMIT = threading.local()
+_COORDINATE_TRANSFORMATIONS = threading.local()
+_REFERENCE_SYSTEMS = threading.local()
+# points are handed to gdal as python lists, so they are transformed in chunks of this size to bound memory use
+_MAX_POINTS_PER_TRANSFORMATION = 65536
+_DEFAULT_GLOBAL_STATE_MASKS = threading.local()
+
+
+def _get_transformer(source_crs: str, target_crs: str) -> pyproj.Transformer:
+    # transformers must not be shared between threads, so every thread keeps its own
+    if not hasattr(_TRANSFORMERS, 'cache'):
+        _TRANSFORMERS.cache = {}
+    key = (source_crs, target_crs)
+    if key not in _TRANSFORMERS.cache:
+        _TRANSFORMERS.cache[key] = pyproj.Transformer.from_crs(source_crs, target_crs, always_xy=True)
+    return _TRANSFORMERS.cache[key]
+
+
+def _get_roi_as_polygon(roi: Union[str, Polygon]) -> Polygon:
+    if type(roi) is str:
+        return loads(roi)
+    return roi
+
+
+def _check_roi_grid(roi_grid: str):
+    if not roi_grid.startswith('EPSG'):
+        raise ValueError('ROI grid must be given as EPSG code (e.g., EPSG:4326)')
+
 
 def reproject_to_wgs84(roi: Union[str, Polygon], roi_grid: str) -> str:
     if roi == '':
         return roi
-    if not roi_grid.startswith('EPSG'):
-        raise ValueError('ROI grid must be given as EPSG code (e.g., EPSG:4326)')
-    if type(roi) is str:
-        roi_as_string = roi
-        roi_as_polygon = loads(roi)
-    else:
-        roi_as_string = dumps(roi)
-        roi_as_polygon = roi
+    _check_roi_grid(roi_grid)
     if roi_grid == 'EPSG:4326':
-        return roi_as_string
-    project = partial(
-        pyproj.transform,
-        pyproj.Proj(init=roi_grid),
-        pyproj.Proj(init='EPSG:4326'))
-    transformed_roi = transform(project, roi_as_polygon)
+        return roi if type(roi) is str else dumps(roi)
+    transformer = _get_transformer(roi_grid, 'EPSG:4326')
+    transformed_roi = transform(transformer.transform, _get_roi_as_polygon(roi))
     return dumps(transformed_roi)
 
 
+def reproject_rois_to_wgs84(rois: Sequence[Union[str, Polygon]], roi_grid: str) -> List[str]:
+    """
+    Reprojects many regions of interest given in the same reference system to WGS84 at once. The vertices of all
+    polygons are transformed in a single call.
+    :param rois: The regions of interest, as polygons or their WKT representations
+    :param roi_grid: The EPSG code of the reference system of the regions of interest (e.g., EPSG:3301)
+    :return: The WKT representations of the reprojected regions of interest, in the same order. Empty input strings
+    are returned unchanged.
+    """
+    _check_roi_grid(roi_grid)
+    if roi_grid == 'EPSG:4326':
+        return [roi if type(roi) is str else dumps(roi) for roi in rois]
+    transformer = _get_transformer(roi_grid, 'EPSG:4326')
+    reprojected_rois = [''] * len(rois)
+    polygons = {}
+    rings = []
+    for i, roi in enumerate(rois):
+        if roi == '':
+            continue
+        polygon = _get_roi_as_polygon(roi)
+        if polygon.geom_type != 'Polygon':
+            reprojected_rois[i] = dumps(transform(transformer.transform, polygon))
+            continue
+        polygons[i] = len(polygon.interiors) + 1
+        rings.append(np.asarray(polygon.exterior.coords)[:, :2])
+        rings.extend(np.asarray(interior.coords)[:, :2] for interior in polygon.interiors)
+    if len(rings) == 0:
+        return reprojected_rois
+    coordinates = np.concatenate(rings)
+    x, y = transformer.transform(coordinates[:, 0], coordinates[:, 1])
+    transformed_rings = np.split(np.column_stack((x, y)), np.cumsum([len(ring) for ring in rings])[:-1])
+    ring_index = 0
+    for i, num_rings in polygons.items():
+        reprojected_rois[i] = dumps(Polygon(transformed_rings[ring_index],
+                                            transformed_rings[ring_index + 1:ring_index + num_rings]))
+        ring_index += num_rings
+    return reprojected_rois
+
+
+def _get_coordinate_transformation(source: osr.SpatialReference, target: osr.SpatialReference) \
+        -> osr.CoordinateTransformation:
+    # coordinate transformations must not be shared between threads, so every thread keeps its own
+    if not hasattr(_COORDINATE_TRANSFORMATIONS, 'cache'):
+        _COORDINATE_TRANSFORMATIONS.cache = {}
+    key = (source.ExportToWkt(), target.ExportToWkt())
+    if key not in _COORDINATE_TRANSFORMATIONS.cache:
+        _COORDINATE_TRANSFORMATIONS.cache[key] = osr.CoordinateTransformation(source, target)
+    return _COORDINATE_TRANSFORMATIONS.cache[key]
+
+
 def transform_coordinates(source: osr.SpatialReference, target: osr.SpatialReference,
                           coords: Sequence[float]) -> Sequence[float]:
     """
@@ -46,13 +121,41 @@ def transform_coordinates(source: osr.SpatialReference, target: osr.SpatialRefer
     as the source coordinates.
     """
     num_coords = int(len(coords) / 2)
-    target_coords = []
-    coordinate_transformation = osr.CoordinateTransformation(source, target)
-    for i in range(num_coords):
-        target_coord = coordinate_transformation.TransformPoint(coords[i * 2], coords[i * 2 + 1])
-        target_coords.append(target_coord[0])
-        target_coords.append(target_coord[1])
-    return target_coords
+    coords = np.asarray(coords[:num_coords * 2], dtype=np.float64)
+    target_x, target_y = transform_coordinate_arrays(source, target, coords[0::2], coords[1::2])
+    return np.column_stack((target_x, target_y)).ravel().tolist()
+
+
+def transform_coordinate_arrays(source: osr.SpatialReference, target: osr.SpatialReference,
+                                x: Union[Sequence[float], np.ndarray], y: Union[Sequence[float], np.ndarray]) \
+        -> (np.ndarray, np.ndarray):
+    """
+    Transforms arrays of coordinates from the source reference system to the target reference system in one call.
+    Coordinate transformations are cached per pair of reference systems.
+    :param source: The source spatial reference system
+    :param target: The target spatial reference system
+    :param x: The x-coordinates to be transformed
+    :param y: The y-coordinates to be transformed. Must be of the same shape as the x-coordinates.
+    :return: The transformed x- and y-coordinates, in arrays of the same shape as the input.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.shape != y.shape:
+        raise ValueError('x- and y-coordinates must be of the same shape')
+    if x.size == 0:
+        return x.copy(), y.copy()
+    coordinate_transformation = _get_coordinate_transformation(source, target)
+    x_values = x.ravel()
+    y_values = y.ravel()
+    transformed_x = np.empty(x.size, dtype=np.float64)
+    transformed_y = np.empty(y.size, dtype=np.float64)
+    for start in range(0, x.size, _MAX_POINTS_PER_TRANSFORMATION):
+        end = min(start + _MAX_POINTS_PER_TRANSFORMATION, x.size)
+        points = np.column_stack((x_values[start:end], y_values[start:end])).tolist()
+        transformed_points = np.array(coordinate_transformation.TransformPoints(points), dtype=np.float64)
+        transformed_x[start:end] = transformed_points[:, 0]
+        transformed_y[start:end] = transformed_points[:, 1]
+    return transformed_x.reshape(x.shape), transformed_y.reshape(y.shape)
 
 
 def get_spatial_reference_system_from_dataset(dataset: gdal.Dataset) -> osr.SpatialReference:
@@ -78,9 +181,222 @@ def get_target_resolutions(dataset: gdal.Dataset) -> (float, float):
     return geo_transform[1], -geo_transform[5]
 
 
+@contextmanager
+def limit_warp_threads(num_threads: int):
+    """
+    Within this context, warps in the current thread use at most the given number of threads, regardless of their
+    warp configuration. Meant for code which runs in parallel workers already, so that the CPUs are not
+    oversubscribed. With a limit of one thread, warps are not multithreaded at all.
+    """
+    previous_limit = getattr(_WARP_THREAD_LIMIT, 'num_threads', None)
+    _WARP_THREAD_LIMIT.num_threads = num_threads
+    try:
+        yield
+    finally:
+        _WARP_THREAD_LIMIT.num_threads = previous_limit
+
+
+class WarpConfiguration(object):
+    """
+    Configures how gdal warps datasets. The defaults correspond to how gdal warps without further options. No
+    defaults tuned for throughput are chosen, as none have been benchmarked; callers who want faster warps need to
+    enable multithreading and raise the working memory themselves.
+    :param multithread: Whether the warping of data and the reading of input data shall be done in parallel threads
+    :param warp_memory_limit: The working memory of the warper in MB. If not given, the gdal default is used.
+    :param num_threads: The number of threads the warper uses for computations, or 'ALL_CPUS'. Only used in case
+    multithread is set to true. Within limit_warp_threads, at most the number of threads given there is used.
+    :param output_type: The gdal data type of the warped datasets (e.g., gdal.GDT_Float32). If not given, the data
+    type of the input is kept.
+    :param crop_source: If true, the input is cropped to the window that covers the target bounds before it is
+    warped. Files that are much larger than the target area are then not scanned as a whole. Not applied to
+    in-memory datasets.
+    :param overview_level: The overview level of the input from which is read. 'AUTO' selects the overview with the
+    resolution closest to the target resolution, 'AUTO-n' the n-th overview finer than that, 'NONE' reads the full
+    resolution. An integer selects an overview level directly. If not given, the gdal default (AUTO) applies.
+    :param overview_cache_dir: If given, overviews are built for inputs without overviews which need to be sampled down
+    by a factor of two or more. They are stored in this directory and reused as long as the input is not modified.
+    """
+
+    def __init__(self, multithread: bool = False, warp_memory_limit: Optional[float] = None,
+                 num_threads: Optional[Union[int, str]] = None, output_type: Optional[int] = None,
+                 crop_source: bool = False, overview_level: Optional[Union[int, str]] = None,
+                 overview_cache_dir: Optional[str] = None):
+        self.multithread = multithread
+        self.warp_memory_limit = warp_memory_limit
+        self.num_threads = num_threads
+        self.output_type = output_type
+        self.crop_source = crop_source
+        self.overview_level = overview_level
+        self.overview_cache_dir = overview_cache_dir
+
+    def _get_threading(self) -> Tuple[bool, Optional[Union[int, str]]]:
+        # whether to multithread and with how many threads, considering the limit set for the current thread
+        thread_limit = getattr(_WARP_THREAD_LIMIT, 'num_threads', None)
+        if not self.multithread or thread_limit == 1:
+            return False, None
+        num_threads = self.num_threads
+        if thread_limit is not None and (num_threads is None or num_threads == 'ALL_CPUS' or
+                                         int(num_threads) > thread_limit):
+            num_threads = thread_limit
+        return True, num_threads
+
+    def get_result_parameters(self) -> tuple:
+        """
+        :return: The settings of this configuration which may change the outcome of a warp. Threading and working
+        memory only affect how fast a warp is, so they are not included.
+        """
+        return self.output_type, self.crop_source, self.overview_level, self.overview_cache_dir
+
+    def get_warp_options(self, **kwargs):
+        """
+        :param kwargs: Further options to be passed to gdal.WarpOptions
+        :return: gdal warp options with this configuration and the given further options
+        """
+        multithread, num_threads = self._get_threading()
+        if multithread:
+            kwargs['multithread'] = True
+            if num_threads is not None:
+                kwargs['warpOptions'] = ['NUM_THREADS={}'.format(num_threads)]
+        if self.warp_memory_limit is not None:
+            kwargs['warpMemoryLimit'] = self.warp_memory_limit
+        if self.output_type is not None:
+            kwargs['outputType'] = self.output_type
+        options = []
+        if self.overview_level is not None:
+            options = ['-ovr', str(self.overview_level)]
+        return gdal.WarpOptions(options=options, **kwargs)
+
+
+DEFAULT_WARP_CONFIGURATION = WarpConfiguration()
+# the radii of the resampling kernels, in pixels of the coarser of the source and the target grid
+_KERNEL_RADII = {'near': 1, 'bilinear': 1, 'cubic': 2, 'cubicspline': 2, 'lanczos': 3}
+
+
+def _get_pixel_coordinates(geo_transform: Sequence[float], x: np.ndarray, y: np.ndarray) -> (np.ndarray, np.ndarray):
+    determinant = geo_transform[1] * geo_transform[5] - geo_transform[2] * geo_transform[4]
+    cols = (geo_transform[5] * (x - geo_transform[0]) - geo_transform[2] * (y - geo_transform[3])) / determinant
+    rows = (geo_transform[1] * (y - geo_transform[3]) - geo_transform[4] * (x - geo_transform[0])) / determinant
+    return cols, rows
+
+
+def _get_source_window(dataset: gdal.Dataset, bounds: Sequence[float], bounds_srs: osr.SpatialReference, x_res: float,
+                       y_res: float, destination_srs: osr.SpatialReference, resampling_mode: str) \
+        -> Optional[Tuple[int, int, int, int]]:
+    """
+    Determines the window of a dataset which covers the given bounds. gdal snaps the target extent to whole target
+    pixels, and resampling kernels need values around every target pixel, so a margin of one target pixel plus the
+    kernel radius is added on each side. When sampling down, the kernel radius is scaled like the target pixels.
+    :return: The window as x offset, y offset, width and height, or None if it would not be smaller than the dataset
+    """
+    if dataset.GetProjection() == '':
+        return None
+    source_srs = get_spatial_reference_system_from_dataset(dataset)
+    x_min, y_min, x_max, y_max = bounds
+    # the borders are sampled densely, as straight lines in one reference system may be curves in another
+    steps = np.linspace(0., 1., 21)
+    x = np.concatenate((x_min + steps * (x_max - x_min), np.full(21, x_max), x_max - steps * (x_max - x_min),
+                        np.full(21, x_min)))
+    y = np.concatenate((np.full(21, y_min), y_min + steps * (y_max - y_min), np.full(21, y_max),
+                        y_max - steps * (y_max - y_min)))
+    source_x, source_y = transform_coordinate_arrays(bounds_srs, source_srs, x, y)
+    cols, rows = _get_pixel_coordinates(dataset.GetGeoTransform(), source_x, source_y)
+    if not (np.all(np.isfinite(cols)) and np.all(np.isfinite(rows))):
+        return None
+    if not bounds_srs.IsSame(destination_srs):
+        x, y = transform_coordinate_arrays(bounds_srs, destination_srs, x, y)
+    num_target_cols = max((x.max() - x.min()) / abs(x_res), 1.)
+    num_target_rows = max((y.max() - y.min()) / abs(y_res), 1.)
+    kernel_radius = _KERNEL_RADII.get(resampling_mode, 1)
+    # source pixels per target pixel, times the target pixels needed around the bounds
+    col_margin = int(np.ceil(max((cols.max() - cols.min()) / num_target_cols, 1.) * (kernel_radius + 1)))
+    row_margin = int(np.ceil(max((rows.max() - rows.min()) / num_target_rows, 1.) * (kernel_radius + 1)))
+    col_min = max(int(np.floor(cols.min())) - col_margin, 0)
+    row_min = max(int(np.floor(rows.min())) - row_margin, 0)
+    col_max = min(int(np.ceil(cols.max())) + col_margin, dataset.RasterXSize)
+    row_max = min(int(np.ceil(rows.max())) + row_margin, dataset.RasterYSize)
+    if col_min >= col_max or row_min >= row_max:
+        return None
+    if col_min == 0 and row_min == 0 and col_max == dataset.RasterXSize and row_max == dataset.RasterYSize:
+        return None
+    return col_min, row_min, col_max - col_min, row_max - row_min
+
+
+def _write_into(target_data_set: gdal.Dataset, source_data_set: gdal.Dataset):
+    """
+    Writes the data of a dataset into a larger dataset on the same grid. The pixel offsets are derived from the geo
+    transforms and the written window is clipped to both datasets, so that a source which is off by a pixel cannot
+    overflow the target.
+    """
+    target_geo_transform = target_data_set.GetGeoTransform()
+    source_geo_transform = source_data_set.GetGeoTransform()
+    x_offset = int(round((source_geo_transform[0] - target_geo_transform[0]) / target_geo_transform[1]))
+    y_offset = int(round((source_geo_transform[3] - target_geo_transform[3]) / target_geo_transform[5]))
+    source_x_offset = max(-x_offset, 0)
+    source_y_offset = max(-y_offset, 0)
+    x_offset = max(x_offset, 0)
+    y_offset = max(y_offset, 0)
+    width = min(source_data_set.RasterXSize - source_x_offset, target_data_set.RasterXSize - x_offset)
+    height = min(source_data_set.RasterYSize - source_y_offset, target_data_set.RasterYSize - y_offset)
+    if width <= 0 or height <= 0:
+        return
+    for i in range(source_data_set.RasterCount):
+        data = source_data_set.GetRasterBand(i + 1).ReadAsArray(source_x_offset, source_y_offset, width, height)
+        target_data_set.GetRasterBand(i + 1).WriteArray(data, xoff=x_offset, yoff=y_offset)
+
+
+def _can_be_cropped(dataset: gdal.Dataset) -> bool:
+    # cropping is done with a VRT, which needs to refer to the dataset by its name
+    driver = dataset.GetDriver()
+    return dataset.GetDescription() != '' and driver is not None and driver.ShortName != 'MEM'
+
+
+def _crop(dataset: gdal.Dataset, window: Optional[Tuple[int, int, int, int]]) -> gdal.Dataset:
+    if window is None:
+        return dataset
+    return gdal.Translate('', dataset, format='VRT', srcWin=list(window))
+
+
+def _get_overview_factors(dataset: gdal.Dataset, bounds: Sequence[float], x_res: float, y_res: float,
+                          bounds_srs: osr.SpatialReference, destination_srs: osr.SpatialReference) -> List[int]:
+    # overviews are built in powers of two up to the factor by which the dataset needs to be sampled down
+    downsampling_factor = _get_downsampling_factor(dataset, bounds, x_res, y_res, bounds_srs, destination_srs)
+    factors = []
+    factor = 2
+    while factor <= downsampling_factor:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def _get_dataset_with_overviews(dataset: gdal.Dataset, factors: List[int], cache_dir: str) -> gdal.Dataset:
+    """
+    Provides a dataset with overviews for the given factors. For a file without overviews, these are built for a VRT
+    referring to the file, which is kept in the cache directory.
+    :return: The dataset itself, if it already has overviews or is not a file, otherwise the VRT.
+    """
+    path = dataset.GetDescription()
+    if len(factors) == 0 or dataset.GetRasterBand(1).GetOverviewCount() > 0 or not os.path.isfile(path):
+        return dataset
+    path = os.path.abspath(path)
+    file_stat = os.stat(path)
+    key = '{}:{}:{}:{}'.format(path, file_stat.st_mtime_ns, file_stat.st_size, factors)
+    vrt_file_name = os.path.join(cache_dir, '{}.vrt'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+    if not os.path.exists(vrt_file_name):
+        os.makedirs(cache_dir, exist_ok=True)
+        # files are built under temporary names, so that no other process sees an incomplete vrt
+        temp_vrt_file_name = '{}.{}.{}.vrt'.format(vrt_file_name[:-4], os.getpid(), threading.get_ident())
+        vrt_data_set = gdal.BuildVRT(temp_vrt_file_name, [path])
+        vrt_data_set.BuildOverviews('AVERAGE', factors)
+        vrt_data_set = None
+        os.replace(temp_vrt_file_name + '.ovr', vrt_file_name + '.ovr')
+        os.replace(temp_vrt_file_name, vrt_file_name)
+    return gdal.Open(vrt_file_name)
+
+
 def reproject_dataset(dataset: Union[str, gdal.Dataset], bounds: Sequence[float], x_res: int, y_res: int,
                       destination_srs: osr.SpatialReference, bounds_srs: Optional[osr.SpatialReference],
-                      resampling_mode: Optional[str]) -> gdal.Dataset:
+                      resampling_mode: Optional[str], lazy: bool=False,
+                      warp_configuration: Optional[WarpConfiguration]=None) -> gdal.Dataset:
     """
     Reprojects a gdal dataset to a reference system with the given bounds and the given spatial resolution.
     :param dataset: A dataset
@@ -109,6 +425,10 @@ def reproject_dataset(dataset: Union[str, gdal.Dataset], bounds: Sequence[float]
     * q3
     If none is selected, 'bilinear' will be selected in case the source values need to be sampled up to a finer
     destination resolution and 'average' in case the values need to be sampled down to a coarser destination resolution.
+    :param lazy: If true, a warped VRT is returned instead of an in-memory dataset. Data is then only warped when it
+    is read, and reading a window warps only that window.
+    :param warp_configuration: Configures threading, working memory, output data type and cropping of the warp. If
+    not given, the default warp configuration is used.
     :return: A spatial dataset with the chosen destination spatial reference system, in the bounds and the x- and y-
     resolutions that have been set.
     """
@@ -118,12 +438,43 @@ def reproject_dataset(dataset: Union[str, gdal.Dataset], bounds: Sequence[float]
         bounds_srs = destination_srs
     if resampling_mode is None:
         resampling_mode = _get_resampling(dataset, bounds, x_res, y_res, bounds_srs, destination_srs)
-    warp_options = gdal.WarpOptions(format='Mem', outputBounds=bounds, outputBoundsSRS=bounds_srs,
-                                    xRes=x_res, yRes=y_res, dstSRS=destination_srs, resampleAlg=resampling_mode)
+    if warp_configuration is None:
+        warp_configuration = DEFAULT_WARP_CONFIGURATION
+    warp_options = warp_configuration.get_warp_options(format=_get_warp_format(lazy), outputBounds=bounds,
+                                                       outputBoundsSRS=bounds_srs, xRes=x_res, yRes=y_res,
+                                                       dstSRS=destination_srs, resampleAlg=resampling_mode)
+    overview_factors = []
+    if warp_configuration.overview_cache_dir is not None:
+        overview_factors = _get_overview_factors(dataset, bounds, x_res, y_res, bounds_srs, destination_srs)
+    # the vrt with overviews has the same grid as the dataset, so it is cropped in the same way
+    dataset = _get_dataset_with_overviews(dataset, overview_factors, warp_configuration.overview_cache_dir)
+    if warp_configuration.crop_source and _can_be_cropped(dataset):
+        dataset = _crop(dataset, _get_source_window(dataset, bounds, bounds_srs, x_res, y_res, destination_srs,
+                                                    resampling_mode))
     reprojected_data_set = gdal.Warp('', dataset, options=warp_options)
     return reprojected_data_set
 
 
+def _get_warp_format(lazy: bool) -> str:
+    if lazy:
+        return 'VRT'
+    return 'Mem'
+
+
+def read_window(dataset: gdal.Dataset, window: Optional[Sequence[int]]=None) -> np.ndarray:
+    """
+    Reads the data of a dataset, or of a window of it.
+    :param dataset: The dataset to read from. If it is a warped VRT, only the requested window is warped.
+    :param window: The window to read, given as x offset, y offset, width and height in pixels. If not given,
+    the whole dataset is read.
+    :return: The data of the window
+    """
+    if window is None:
+        return dataset.ReadAsArray()
+    x_offset, y_offset, width, height = window
+    return dataset.ReadAsArray(x_offset, y_offset, width, height)
+
+
 def _get_resampling(dataset: gdal.Dataset, bounds: Sequence[float], x_res: float, y_res: float,
                     bounds_srs: osr.SpatialReference, destination_srs: osr.SpatialReference) -> str:
     if _need_to_sample_up(dataset, bounds, x_res, y_res, bounds_srs, destination_srs):
@@ -134,6 +485,24 @@ def _get_resampling(dataset: gdal.Dataset, bounds: Sequence[float], x_res: float
 
 def _need_to_sample_up(dataset: gdal.Dataset, bounds: Sequence[float], x_res: float, y_res: float,
                        bounds_srs: osr.SpatialReference, destination_srs: osr.SpatialReference) -> bool:
+    source_resolution_measure, dest_resolution_measure = \
+        _get_resolution_measures(dataset, bounds, x_res, y_res, bounds_srs, destination_srs)
+    return dest_resolution_measure > source_resolution_measure
+
+
+def _get_downsampling_factor(dataset: gdal.Dataset, bounds: Sequence[float], x_res: float, y_res: float,
+                             bounds_srs: osr.SpatialReference, destination_srs: osr.SpatialReference) -> float:
+    source_resolution_measure, dest_resolution_measure = \
+        _get_resolution_measures(dataset, bounds, x_res, y_res, bounds_srs, destination_srs)
+    if dest_resolution_measure == 0:
+        return 1.0
+    # the measures correspond to numbers of pixels, so the factor per dimension is their square root
+    return float(np.sqrt(source_resolution_measure / dest_resolution_measure))
+
+
+def _get_resolution_measures(dataset: gdal.Dataset, bounds: Sequence[float], x_res: float, y_res: float,
+                             bounds_srs: osr.SpatialReference, destination_srs: osr.SpatialReference) \
+        -> (float, float):
     source_srs = get_spatial_reference_system_from_dataset(dataset)
     bounds_in_source_coordinates = transform_coordinates(bounds_srs, source_srs, bounds)
     source_resolutions = get_target_resolutions(dataset)
@@ -141,7 +510,7 @@ def _need_to_sample_up(dataset: gdal.Dataset, bounds: Sequence[float], x_res: fl
                                                   source_resolutions[0], source_resolutions[1])
     bounds_in_dest_coordinates = transform_coordinates(bounds_srs, destination_srs, bounds)
     dest_resolution_measure = _get_dist_measure(bounds_in_dest_coordinates, x_res, y_res)
-    return dest_resolution_measure > source_resolution_measure
+    return source_resolution_measure, dest_resolution_measure
 
 
 def _get_dist_measure(source_coordinates: Sequence[float], x_res: float, y_res: float):
@@ -152,10 +521,198 @@ def _get_dist_measure(source_coordinates: Sequence[float], x_res: float, y_res:
     return (x_dist / x_res) * (y_dist / y_res)
 
 
+_REMAP_RESAMPLING_MODES = ['near', 'bilinear']
+
+
+class _RemapTable(object):
+    """
+    Maps the pixels of a target grid to the pixels of a source grid from which their values are derived. Once set up,
+    it allows to reproject any dataset on the source grid by indexing into its data. Like gdal.Warp, bilinear
+    resampling leaves out source pixels which are beyond the borders of the source or hold the no data value and
+    renormalises the weights of the others. gdal scales the bilinear kernel when sampling down, which remap tables do
+    not, so for bilinear resampling onto a coarser grid a remap table is not supported and gdal.Warp must be used.
+    """
+
+    def __init__(self, source_dataset: gdal.Dataset, target_dataset: gdal.Dataset, resampling_mode: str):
+        self._source_width = source_dataset.RasterXSize
+        self._source_height = source_dataset.RasterYSize
+        self._target_width = target_dataset.RasterXSize
+        self._target_height = target_dataset.RasterYSize
+        self._target_geo_transform = target_dataset.GetGeoTransform()
+        self._target_projection = target_dataset.GetProjection()
+        self._target_data_type = target_dataset.GetRasterBand(1).DataType
+        if resampling_mode not in _REMAP_RESAMPLING_MODES:
+            raise ValueError('Resampling mode {} not supported by remap tables.'.format(resampling_mode))
+        source_x, source_y = self._get_source_pixel_coordinates(source_dataset, target_dataset)
+        self.supported = True
+        if resampling_mode == 'near':
+            self._set_up_nearest_neighbour(source_x, source_y)
+        elif self._samples_down(source_x, source_y):
+            self.supported = False
+        else:
+            self._set_up_bilinear(source_x, source_y)
+
+    def _get_source_pixel_coordinates(self, source_dataset: gdal.Dataset, target_dataset: gdal.Dataset) \
+            -> (np.array, np.array):
+        tgt = self._target_geo_transform
+        source_geo_transform = source_dataset.GetGeoTransform()
+        target_srs = get_spatial_reference_system_from_dataset(target_dataset)
+        source_srs = get_spatial_reference_system_from_dataset(source_dataset)
+        source_x = np.empty(self._target_height * self._target_width, dtype=np.float64)
+        source_y = np.empty(self._target_height * self._target_width, dtype=np.float64)
+        target_cols = np.arange(self._target_width) + 0.5
+        # the target grid is handled in blocks of rows, so that no temporary arrays of its full size are needed
+        rows_per_block = max(_MAX_POINTS_PER_TRANSFORMATION // max(self._target_width, 1), 1)
+        for first_row in range(0, self._target_height, rows_per_block):
+            last_row = min(first_row + rows_per_block, self._target_height)
+            target_rows = np.arange(first_row, last_row)[:, np.newaxis] + 0.5
+            target_x = tgt[0] + target_cols * tgt[1] + target_rows * tgt[2]
+            target_y = tgt[3] + target_cols * tgt[4] + target_rows * tgt[5]
+            x, y = transform_coordinate_arrays(target_srs, source_srs, target_x.ravel(), target_y.ravel())
+            block = slice(first_row * self._target_width, last_row * self._target_width)
+            source_x[block], source_y[block] = _get_pixel_coordinates(source_geo_transform, x, y)
+        return source_x, source_y
+
+    def _samples_down(self, source_x: np.array, source_y: np.array) -> bool:
+        # like gdal, the scale is determined per axis from the source pixels covered by the whole target grid
+        source_x = source_x.reshape(self._target_height, self._target_width)
+        source_y = source_y.reshape(self._target_height, self._target_width)
+        with np.errstate(invalid='ignore'):
+            x_scale = np.nanmedian(np.hypot(np.diff(source_x, axis=1), np.diff(source_y, axis=1))) \
+                if self._target_width > 1 else 0.
+            y_scale = np.nanmedian(np.hypot(np.diff(source_x, axis=0), np.diff(source_y, axis=0))) \
+                if self._target_height > 1 else 0.
+        # source pixels per target pixel
+        return x_scale > 1. + 1e-6 or y_scale > 1. + 1e-6
+
+    def _set_up_nearest_neighbour(self, source_x: np.array, source_y: np.array):
+        cols = np.floor(source_x)
+        rows = np.floor(source_y)
+        valid = (cols >= 0) & (cols < self._source_width) & (rows >= 0) & (rows < self._source_height)
+        self._target_indexes = np.flatnonzero(valid)
+        self._source_indexes = [(rows[valid] * self._source_width + cols[valid]).astype(np.int64)]
+        self._weights = None
+
+    def _set_up_bilinear(self, source_x: np.array, source_y: np.array):
+        # like for gdal, target pixels are covered if their centers lie within the source
+        valid = (source_x >= 0) & (source_x < self._source_width) & (source_y >= 0) & (source_y < self._source_height)
+        self._target_indexes = np.flatnonzero(valid)
+        # values are given for the centers of the source pixels
+        x = source_x[valid] - 0.5
+        y = source_y[valid] - 0.5
+        col_0 = np.floor(x).astype(np.int64)
+        row_0 = np.floor(y).astype(np.int64)
+        x_weight = x - col_0
+        y_weight = y - row_0
+        self._source_indexes = []
+        self._weights = []
+        for col, row, weight in [(col_0, row_0, (1 - x_weight) * (1 - y_weight)),
+                                 (col_0 + 1, row_0, x_weight * (1 - y_weight)),
+                                 (col_0, row_0 + 1, (1 - x_weight) * y_weight),
+                                 (col_0 + 1, row_0 + 1, x_weight * y_weight)]:
+            # neighbours beyond the borders of the source are left out by giving them no weight
+            inside = (col >= 0) & (col < self._source_width) & (row >= 0) & (row < self._source_height)
+            self._source_indexes.append(np.clip(row, 0, self._source_height - 1) * self._source_width +
+                                        np.clip(col, 0, self._source_width - 1))
+            self._weights.append(np.where(inside, weight, 0.))
+
+    def remap_array(self, data: np.array, fill_value: float = 0, no_data_value: Optional[float] = None) -> np.array:
+        """
+        Reprojects an array on the source grid onto the target grid.
+        :param data: A 2-d array on the source grid
+        :param fill_value: The value to be set for target pixels that are not covered by the source or, for bilinear
+        resampling, have no valid source pixel around them
+        :param no_data_value: The no data value of the source. For bilinear resampling, source pixels with this value
+        are left out.
+        :return: A 2-d array on the target grid of the same data type as the input
+        """
+        if not self.supported:
+            raise ValueError('Remap table is not supported for sampling down with bilinear resampling')
+        source_data = data.ravel()
+        target_data = np.full(self._target_width * self._target_height, fill_value, dtype=data.dtype)
+        if self._weights is None:
+            target_data[self._target_indexes] = source_data[self._source_indexes[0]]
+            return target_data.reshape(self._target_height, self._target_width)
+        values = np.zeros(len(self._target_indexes))
+        weight_sums = np.zeros(len(self._target_indexes))
+        for indexes, weights in zip(self._source_indexes, self._weights):
+            neighbour_values = source_data[indexes]
+            if no_data_value is not None:
+                if np.isnan(no_data_value):
+                    weights = np.where(np.isnan(neighbour_values), 0., weights)
+                else:
+                    weights = np.where(neighbour_values == no_data_value, 0., weights)
+            values += np.where(weights > 0, neighbour_values, 0) * weights
+            weight_sums += weights
+        # as in gdal, pixels with hardly any valid weight are not set
+        valid = weight_sums >= 0.00001
+        values = values[valid] / weight_sums[valid]
+        if np.issubdtype(data.dtype, np.integer):
+            values = np.floor(values + 0.5)
+        target_data[self._target_indexes[valid]] = values
+        return target_data.reshape(self._target_height, self._target_width)
+
+    def remap(self, dataset: gdal.Dataset) -> gdal.Dataset:
+        """Reprojects all bands of a dataset on the source grid onto the target grid."""
+        driver = gdal.GetDriverByName('MEM')
+        remapped_dataset = driver.Create('', self._target_width, self._target_height, dataset.RasterCount,
+                                         self._target_data_type)
+        remapped_dataset.SetGeoTransform(self._target_geo_transform)
+        remapped_dataset.SetProjection(self._target_projection)
+        for i in range(dataset.RasterCount):
+            band = dataset.GetRasterBand(i + 1)
+            no_data_value = band.GetNoDataValue()
+            remapped_band = remapped_dataset.GetRasterBand(i + 1)
+            fill_value = 0
+            if no_data_value is not None:
+                remapped_band.SetNoDataValue(no_data_value)
+                fill_value = no_data_value
+            data = band.ReadAsArray(buf_type=self._target_data_type)
+            remapped_band.WriteArray(self.remap_array(data, fill_value, no_data_value))
+        return remapped_dataset
+
+
+class _WarpPlan(object):
+    """What is needed to warp datasets on one source grid."""
+
+    def __init__(self, resampling_mode: str, warp_options, source_window: Optional[Tuple[int, int, int, int]]=None,
+                 overview_factors: Optional[List[int]]=None):
+        self.resampling_mode = resampling_mode
+        self.warp_options = warp_options
+        self.source_window = source_window
+        self.overview_factors = [] if overview_factors is None else overview_factors
+        self.remap_table = None
+        # false, if a remap table cannot reproduce the warp, so gdal.Warp is always used
+        self.remap_table_supported = True
+        # width, height and geotransform of the unmasked warp
+        self.target_grid = None
+        self.valid_reprojection = None
+
+
 class Reprojection(object):
 
     def __init__(self, bounds: Sequence[float], x_res: int, y_res: int, destination_srs: osr.SpatialReference,
-                 bounds_srs: Optional[osr.SpatialReference]=None, resampling_mode: Optional[str]=None):
+                 bounds_srs: Optional[osr.SpatialReference]=None, resampling_mode: Optional[str]=None,
+                 use_remap_tables: bool=False, lazy: bool=False,
+                 warp_configuration: Optional[WarpConfiguration]=None, warp_cache: Optional[WarpCache]=None,
+                 state_mask: Optional[Union[np.ndarray, gdal.Dataset]]=None):
+        """
+        :param use_remap_tables: If true, the mapping between source and target pixels is determined only once per
+        source grid and then reused for every dataset on that grid. This applies only to nearest neighbour and
+        bilinear resampling, other datasets are warped as usual. Bilinear resampling onto a coarser grid is warped as
+        usual, too.
+        :param lazy: If true, reprojected datasets are warped VRTs which are only warped when data is read from them.
+        Reading a window then warps only that window. Remap tables are not used for lazy reprojections.
+        :param warp_configuration: Configures threading, working memory, output data type and cropping of the warps.
+        If not given, the default warp configuration is used.
+        :param warp_cache: A cache in which warped datasets are stored, so that they need not be warped again. If not
+        given, the warp cache which has been set with set_warp_cache is used, if any. Lazy reprojections are not
+        cached.
+        :param state_mask: A mask on the target grid. If given, only the bounding box of its valid pixels is warped,
+        the remaining pixels are set to the no data value (or 0). If it has no valid pixels, datasets are not read at
+        all. Lazy reprojections are not restricted to the bounding box. When a dataset is reprojected, a ValueError is
+        raised if the mask does not have the shape of the grid gdal warps onto.
+        """
         self._bounds = bounds
         self._x_res = x_res
         self._y_res = y_res
@@ -165,23 +722,189 @@ class Reprojection(object):
             self._bounds_srs = destination_srs
         else:
             self._bounds_srs = bounds_srs
+        self._use_remap_tables = use_remap_tables and not lazy
+        self._lazy = lazy
+        if warp_configuration is None:
+            warp_configuration = DEFAULT_WARP_CONFIGURATION
+        self._warp_configuration = warp_configuration
+        self._warp_cache = warp_cache
+        # warp plans per source grid, so these need to be set up only once for datasets on the same grid
+        self._warp_plans = {}
+        self._state_mask_shape = None
+        self._valid_window = None
+        if state_mask is not None:
+            self._set_state_mask(state_mask)
+
+    def _set_state_mask(self, state_mask: Union[np.ndarray, gdal.Dataset]):
+        # the mask is checked against the target grid only when a dataset is reprojected, as the grid is taken from
+        # the unmasked warp
+        if not isinstance(state_mask, np.ndarray):
+            state_mask = state_mask.ReadAsArray()
+        self._state_mask_shape = state_mask.shape
+        valid_rows = np.flatnonzero(np.any(state_mask, axis=1))
+        valid_cols = np.flatnonzero(np.any(state_mask, axis=0))
+        if len(valid_rows) == 0:
+            self._valid_window = (0, 0, 0, 0)
+            return
+        self._valid_window = (int(valid_cols[0]), int(valid_rows[0]), int(valid_cols[-1] - valid_cols[0] + 1),
+                              int(valid_rows[-1] - valid_rows[0] + 1))
+
+    def with_state_mask(self, state_mask: Union[np.ndarray, gdal.Dataset]) -> 'Reprojection':
+        """
+        :return: A reprojection onto the same grid which considers the given state mask.
+        """
+        return Reprojection(self._bounds, self._x_res, self._y_res, self._destination_srs, self._bounds_srs,
+                            self._resampling_mode, self._use_remap_tables, self._lazy, self._warp_configuration,
+                            self._warp_cache, state_mask)
+
+    def has_valid_pixels(self) -> bool:
+        """
+        :return: False, if a state mask has been set which has no valid pixels, True otherwise.
+        """
+        return self._valid_window is None or self._valid_window[2] > 0
 
     def reproject(self, dataset: Union[str, gdal.Dataset]) -> gdal.Dataset:
         if type(dataset) is str:
             dataset = gdal.Open(dataset)
-        if self._resampling_mode is None:
-            resampling_mode = _get_resampling(dataset, self._bounds, self._x_res, self._y_res, self._bounds_srs,
-                                              self._destination_srs)
-        else:
-            resampling_mode = self._resampling_mode
-        warp_options = gdal.WarpOptions(format='Mem', outputBounds=self._bounds, outputBoundsSRS=self._bounds_srs,
-                                        xRes=self._x_res, yRes=self._y_res, dstSRS=self._destination_srs,
-                                        resampleAlg=resampling_mode)
-        reprojected_data_set = gdal.Warp('', dataset, options=warp_options)
+        warp_plan = self._get_warp_plan(dataset)
+        if self._state_mask_shape is not None:
+            target_grid = self._get_target_grid(dataset, warp_plan)
+            if not self.has_valid_pixels():
+                return self._create_target_data_set(dataset, target_grid)
+            valid_reprojection = self._get_valid_reprojection(warp_plan)
+            if valid_reprojection is not None and not self._lazy:
+                valid_data_set = valid_reprojection.reproject(dataset)
+                target_data_set = self._create_target_data_set(valid_data_set, target_grid)
+                _write_into(target_data_set, valid_data_set)
+                return target_data_set
+        warp_cache = self._get_warp_cache()
+        cache_key = None
+        if warp_cache is not None:
+            cache_key = warp_cache.get_key(dataset, self._get_target_grid_description(), warp_plan.resampling_mode,
+                                           self._use_remap_tables, self._warp_configuration.get_result_parameters())
+        if cache_key is not None:
+            cached_data_set = warp_cache.get(cache_key)
+            if cached_data_set is not None:
+                return cached_data_set
+        reprojected_data_set = self._reproject(dataset, warp_plan)
+        if cache_key is not None:
+            warp_cache.put(cache_key, reprojected_data_set)
+        return reprojected_data_set
+
+    def _get_target_grid(self, dataset: gdal.Dataset, warp_plan: _WarpPlan) -> tuple:
+        if warp_plan.target_grid is None:
+            # setting up a warped vrt determines the grid of the unmasked warp without warping any data
+            grid_options = gdal.WarpOptions(format='VRT', outputBounds=self._bounds, outputBoundsSRS=self._bounds_srs,
+                                            xRes=self._x_res, yRes=self._y_res, dstSRS=self._destination_srs,
+                                            resampleAlg=warp_plan.resampling_mode)
+            grid_data_set = gdal.Warp('', dataset, options=grid_options)
+            warp_plan.target_grid = (grid_data_set.RasterXSize, grid_data_set.RasterYSize,
+                                     grid_data_set.GetGeoTransform())
+        width, height, geo_transform = warp_plan.target_grid
+        if self._state_mask_shape != (height, width):
+            raise ValueError('State mask of shape {} does not fit target grid of shape {}'.
+                             format(self._state_mask_shape, (height, width)))
+        return warp_plan.target_grid
+
+    def _get_valid_reprojection(self, warp_plan: _WarpPlan) -> Optional['Reprojection']:
+        # a reprojection onto the bounding box of the valid pixels, or None, if that is the whole target grid
+        width, height, geo_transform = warp_plan.target_grid
+        if self._valid_window == (0, 0, width, height):
+            return None
+        if warp_plan.valid_reprojection is None:
+            x_offset, y_offset, valid_width, valid_height = self._valid_window
+            x_min = geo_transform[0] + x_offset * geo_transform[1]
+            x_max = x_min + valid_width * geo_transform[1]
+            y_max = geo_transform[3] + y_offset * geo_transform[5]
+            y_min = y_max + valid_height * geo_transform[5]
+            valid_bounds = (min(x_min, x_max), min(y_min, y_max), max(x_min, x_max), max(y_min, y_max))
+            warp_plan.valid_reprojection = Reprojection(valid_bounds, abs(geo_transform[1]), abs(geo_transform[5]),
+                                                        self._destination_srs, None, warp_plan.resampling_mode,
+                                                        self._use_remap_tables, False, self._warp_configuration,
+                                                        self._warp_cache)
+        return warp_plan.valid_reprojection
+
+    def _create_target_data_set(self, dataset: gdal.Dataset, target_grid: tuple) -> gdal.Dataset:
+        # creates a dataset on the target grid with the bands of the given dataset, filled with no data values
+        width, height, geo_transform = target_grid
+        data_type = dataset.GetRasterBand(1).DataType
+        if self._warp_configuration.output_type is not None:
+            data_type = self._warp_configuration.output_type
+        driver = gdal.GetDriverByName('MEM')
+        target_data_set = driver.Create('', width, height, dataset.RasterCount, data_type)
+        target_data_set.SetGeoTransform(geo_transform)
+        target_data_set.SetProjection(self._destination_srs.ExportToWkt())
+        for i in range(dataset.RasterCount):
+            no_data_value = dataset.GetRasterBand(i + 1).GetNoDataValue()
+            if no_data_value is not None:
+                target_band = target_data_set.GetRasterBand(i + 1)
+                target_band.SetNoDataValue(no_data_value)
+                target_band.Fill(no_data_value)
+        return target_data_set
+
+    def _get_warp_cache(self) -> Optional[WarpCache]:
+        if self._lazy:
+            return None
+        if self._warp_cache is not None:
+            return self._warp_cache
+        return get_warp_cache()
+
+    def _get_target_grid_description(self) -> tuple:
+        return tuple(self._bounds), self._bounds_srs.ExportToWkt(), self._x_res, self._y_res, \
+            self._destination_srs.ExportToWkt()
+
+    def _reproject(self, dataset: gdal.Dataset, warp_plan: _WarpPlan) -> gdal.Dataset:
+        if self._use_remap_tables and warp_plan.resampling_mode in _REMAP_RESAMPLING_MODES and \
+                warp_plan.remap_table_supported:
+            if warp_plan.remap_table is not None:
+                return warp_plan.remap_table.remap(dataset)
+            reprojected_data_set = gdal.Warp('', dataset, options=warp_plan.warp_options)
+            # the target grid is taken from the warped dataset, so it is the same as if determined by gdal
+            remap_table = _RemapTable(dataset, reprojected_data_set, warp_plan.resampling_mode)
+            if remap_table.supported:
+                warp_plan.remap_table = remap_table
+            else:
+                warp_plan.remap_table_supported = False
+            return reprojected_data_set
+        dataset = _get_dataset_with_overviews(dataset, warp_plan.overview_factors,
+                                              self._warp_configuration.overview_cache_dir)
+        if warp_plan.source_window is not None and _can_be_cropped(dataset):
+            dataset = _crop(dataset, warp_plan.source_window)
+        reprojected_data_set = gdal.Warp('', dataset, options=warp_plan.warp_options)
         return reprojected_data_set
 
+    def _get_warp_plan(self, dataset: gdal.Dataset) -> _WarpPlan:
+        source_grid = (dataset.GetProjection(), dataset.GetGeoTransform(), dataset.RasterXSize, dataset.RasterYSize)
+        if source_grid not in self._warp_plans:
+            if self._resampling_mode is None:
+                resampling_mode = _get_resampling(dataset, self._bounds, self._x_res, self._y_res, self._bounds_srs,
+                                                  self._destination_srs)
+            else:
+                resampling_mode = self._resampling_mode
+            warp_options = self._warp_configuration.get_warp_options(format=_get_warp_format(self._lazy),
+                                                                     outputBounds=self._bounds,
+                                                                     outputBoundsSRS=self._bounds_srs,
+                                                                     xRes=self._x_res, yRes=self._y_res,
+                                                                     dstSRS=self._destination_srs,
+                                                                     resampleAlg=resampling_mode)
+            source_window = None
+            if self._warp_configuration.crop_source:
+                source_window = _get_source_window(dataset, self._bounds, self._bounds_srs, self._x_res,
+                                                   self._y_res, self._destination_srs, resampling_mode)
+            overview_factors = []
+            if self._warp_configuration.overview_cache_dir is not None:
+                overview_factors = _get_overview_factors(dataset, self._bounds, self._x_res, self._y_res,
+                                                         self._bounds_srs, self._destination_srs)
+            self._warp_plans[source_grid] = _WarpPlan(resampling_mode, warp_options, source_window, overview_factors)
+        return self._warp_plans[source_grid]
+
     def get_destination_srs(self) -> osr.SpatialReference:
-        return self._destination_srs
+        # a copy is handed out, as the reference system may be shared with other reprojections
+        return self._destination_srs.Clone()
+
+    @property
+    def lazy(self) -> bool:
+        return self._lazy
 
 
 def reproject_image(source_img, target_img, dstSRSs=None):
@@ -189,14 +912,16 @@ def reproject_image(source_img, target_img, dstSRSs=None):
     """Reprojects/Warps an image to fit exactly another image.
     Additionally, you can set the destination SRS if you want
     to or if it isn't defined in the source image."""
+    target_grid = _get_target_image_grid(target_img, dstSRSs)
+    g = _warp_to_target_image(source_img, target_grid, _get_target_image_warp_options(*target_grid))
+    return g
+
+
+def _get_target_image_grid(target_img, dstSRSs=None):
     if type(target_img) is str:
         g = gdal.Open(target_img)
     else:
         g = target_img
-    if type(source_img) is str:
-        s = gdal.Open(source_img)
-    else:
-        s = source_img
     geo_t = g.GetGeoTransform()
     x_size, y_size = g.RasterXSize, g.RasterYSize
     xmin = min(geo_t[0], geo_t[0] + x_size * geo_t[1])
@@ -210,13 +935,95 @@ def reproject_image(source_img, target_img, dstSRSs=None):
         dstSRS.ImportFromWkt(raster_wkt)
     else:
         dstSRS = dstSRSs
-    g = gdal.Warp('', s, format='MEM', outputBounds=[xmin, ymin, xmax, ymax], xRes=xRes, yRes=yRes, dstSRS=dstSRS)
-    return g
+    return (xmin, ymin, xmax, ymax), xRes, yRes, dstSRS
+
+
+def _get_target_image_warp_options(bounds, xRes, yRes, dstSRS):
+    return gdal.WarpOptions(format='MEM', outputBounds=list(bounds), xRes=xRes, yRes=yRes, dstSRS=dstSRS)
+
+
+def _warp_to_target_image(source_img, target_grid, warp_options) -> gdal.Dataset:
+    if type(source_img) is str:
+        source_img = gdal.Open(source_img)
+    warp_cache = get_warp_cache()
+    cache_key = None
+    if warp_cache is not None:
+        bounds, x_res, y_res, destination_srs = target_grid
+        cache_key = warp_cache.get_key(source_img, 'reproject_image', bounds, x_res, y_res,
+                                       destination_srs.ExportToWkt())
+    if cache_key is not None:
+        cached_data_set = warp_cache.get(cache_key)
+        if cached_data_set is not None:
+            return cached_data_set
+    warped_image = gdal.Warp('', source_img, options=warp_options)
+    if cache_key is not None:
+        warp_cache.put(cache_key, warped_image)
+    return warped_image
+
+
+def reproject_images(source_imgs: Sequence[Union[str, gdal.Dataset]], target_img: Union[str, gdal.Dataset],
+                     dstSRSs: Optional[osr.SpatialReference] = None, as_data_set: bool = False,
+                     max_workers: Optional[int] = None) -> Union[np.ndarray, gdal.Dataset]:
+    """
+    Reprojects many images to fit exactly another image. The grid of the target image is determined only once and
+    the images are warped concurrently.
+    :param source_imgs: The images to be reprojected, given as paths or datasets. A dataset must not be used
+    elsewhere while it is being reprojected.
+    :param target_img: The image onto whose grid the images shall be reprojected
+    :param dstSRSs: The destination spatial reference system. If not given, the one of the target image is used.
+    :param as_data_set: If true, a dataset is returned, otherwise an array.
+    :param max_workers: The number of images which are warped at the same time. If not given, a default depending
+    on the number of processors is used.
+    :return: Either an array of shape (number of bands, height, width) or an in-memory dataset which holds the bands
+    of all images, in the order of the images.
+    :raises ValueError: If no source images are given
+    """
+    if len(source_imgs) == 0:
+        raise ValueError('At least one source image must be given')
+    target_grid = _get_target_image_grid(target_img, dstSRSs)
+    warp_options = _get_target_image_warp_options(*target_grid)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        warped_images = list(executor.map(lambda source_img: _warp_to_target_image(source_img, target_grid,
+                                                                                   warp_options), source_imgs))
+    if not as_data_set:
+        data = [warped_image.ReadAsArray() for warped_image in warped_images]
+        return np.concatenate([d.reshape((-1,) + d.shape[-2:]) for d in data])
+    bands = [warped_image.GetRasterBand(i + 1) for warped_image in warped_images
+             for i in range(warped_image.RasterCount)]
+    data_types = set(band.DataType for band in bands)
+    data_type = data_types.pop() if len(data_types) == 1 else gdal.GDT_Float64
+    first_image = warped_images[0]
+    driver = gdal.GetDriverByName('MEM')
+    stacked_data_set = driver.Create('', first_image.RasterXSize, first_image.RasterYSize, len(bands), data_type)
+    stacked_data_set.SetGeoTransform(first_image.GetGeoTransform())
+    stacked_data_set.SetProjection(first_image.GetProjection())
+    for i, band in enumerate(bands):
+        stacked_band = stacked_data_set.GetRasterBand(i + 1)
+        no_data_value = band.GetNoDataValue()
+        if no_data_value is not None:
+            stacked_band.SetNoDataValue(no_data_value)
+        stacked_band.WriteArray(band.ReadAsArray())
+    return stacked_data_set
+
+
+def _get_cached_reference_system(key: tuple, create) -> osr.SpatialReference:
+    # spatial reference systems must not be shared between threads, so every thread keeps its own.
+    # They must not be altered after creation, as they are shared by all callers within a thread, so they are only
+    # used internally and public accessors hand out copies.
+    if not hasattr(_REFERENCE_SYSTEMS, 'cache'):
+        _REFERENCE_SYSTEMS.cache = {}
+    if key not in _REFERENCE_SYSTEMS.cache:
+        _REFERENCE_SYSTEMS.cache[key] = create()
+    return _REFERENCE_SYSTEMS.cache[key]
 
 
 def _get_reference_system(wkt: str) -> Optional[osr.SpatialReference]:
     if wkt is None:
         return None
+    return _get_cached_reference_system(('wkt', wkt), lambda: _create_reference_system(wkt))
+
+
+def _create_reference_system(wkt: str) -> osr.SpatialReference:
     spatial_reference = osr.SpatialReference()
     if wkt.startswith('EPSG:'):
         epsg_code = int(wkt.split(':')[1])
@@ -229,6 +1036,15 @@ def _get_reference_system(wkt: str) -> Optional[osr.SpatialReference]:
 def _get_projected_srs(roi_center):
     utm_zone = int(1 + (roi_center.coords[0][0] + 180.0) / 6.0)
     is_northern = int(roi_center.coords[0][1] > 0.0)
+    return _get_utm_srs(utm_zone, is_northern)
+
+
+def _get_utm_srs(utm_zone: int, is_northern: int) -> osr.SpatialReference:
+    return _get_cached_reference_system(('utm', utm_zone, is_northern),
+                                        lambda: _create_utm_srs(utm_zone, is_northern))
+
+
+def _create_utm_srs(utm_zone: int, is_northern: int) -> osr.SpatialReference:
     spatial_reference_system = osr.SpatialReference()
     spatial_reference_system.SetWellKnownGeogCS('WGS84')
     spatial_reference_system.SetUTM(utm_zone, is_northern)
@@ -236,6 +1052,13 @@ def _get_projected_srs(roi_center):
 
 
 def _get_default_global_state_mask():
+    # the mask is only read from, but gdal datasets must not be used by several threads at once
+    if not hasattr(_DEFAULT_GLOBAL_STATE_MASKS, 'mask'):
+        _DEFAULT_GLOBAL_STATE_MASKS.mask = _create_default_global_state_mask()
+    return _DEFAULT_GLOBAL_STATE_MASKS.mask
+
+
+def _create_default_global_state_mask():
     driver = gdal.GetDriverByName('MEM')
     dataset = driver.Create('', 360, 90, bands=1)
     dataset.SetGeoTransform((-180.0, 1.00, 0.0, 90.0, 0.0, -1.00))
@@ -246,35 +1069,79 @@ def _get_default_global_state_mask():
     return dataset
 
 
+def _get_roi_reference_systems(roi_center, roi_grid: Optional[str], destination_grid: Optional[str]) \
+        -> (osr.SpatialReference, osr.SpatialReference):
+    roi_srs = _get_reference_system(roi_grid)
+    destination_srs = _get_reference_system(destination_grid)
+    wgs84_srs = _get_reference_system('EPSG:4326')
+    if roi_srs is None:
+        if destination_srs is None:
+            roi_srs = wgs84_srs
+            destination_srs = _get_projected_srs(roi_center)
+        else:
+            roi_srs = destination_srs
+    elif destination_srs is None:
+        if roi_srs.IsSame(wgs84_srs):
+            destination_srs = _get_projected_srs(roi_center)
+        else:
+            raise ValueError('Cannot derive destination grid for roi grid {}. Please specify destination grid'.
+                             format(roi_grid))
+    return roi_srs, destination_srs
+
+
+def _rasterize_roi(roi: Polygon, roi_srs: osr.SpatialReference, grid_data_set: gdal.Dataset) -> gdal.Dataset:
+    # the roi is rasterized onto the grid of a (warped) data set, so that the mask matches it pixel by pixel
+    driver = gdal.GetDriverByName('MEM')
+    mask_data_set = driver.Create('', grid_data_set.RasterXSize, grid_data_set.RasterYSize, 1, gdal.GDT_Byte)
+    mask_data_set.SetGeoTransform(grid_data_set.GetGeoTransform())
+    mask_data_set.SetProjection(grid_data_set.GetProjection())
+    roi_data_source = ogr.GetDriverByName('Memory').CreateDataSource('')
+    roi_layer = roi_data_source.CreateLayer('roi', roi_srs, ogr.wkbPolygon)
+    roi_feature = ogr.Feature(roi_layer.GetLayerDefn())
+    roi_feature.SetGeometry(ogr.CreateGeometryFromWkt(roi.wkt))
+    roi_layer.CreateFeature(roi_feature)
+    # the roi is transformed to the reference system of the mask by gdal
+    gdal.RasterizeLayer(mask_data_set, [1], roi_layer, burn_values=[1])
+    return mask_data_set
+
+
+def _apply_roi_mask(mask_data_set: gdal.Dataset, roi_mask: np.ndarray):
+    for i in range(mask_data_set.RasterCount):
+        band = mask_data_set.GetRasterBand(i + 1)
+        data = band.ReadAsArray()
+        data[roi_mask == 0] = 0
+        band.WriteArray(data)
+
+
 def get_mask_data_set_and_reprojection(state_mask: Optional[str] = None, spatial_resolution: Optional[int] = None,
                                         roi: Optional[Union[str, Polygon]] = None, roi_grid: Optional[str] = None,
-                                        destination_grid: Optional[str] = None):
+                                        destination_grid: Optional[str] = None, rasterize_roi: bool = False):
+    """
+    Provides the state mask on the grid defined by roi and spatial resolution or, if these are not given, on the grid
+    of the state mask, together with a reprojection onto that grid.
+    :param rasterize_roi: If true, the roi polygon is rasterized on the target grid and all pixels outside of it are
+    set to 0 in the mask, so that they are not processed. If no state mask is given, the rasterized roi is the mask
+    and no mask is warped. If false (the default), the mask covers the whole bounding box of the roi.
+    """
     if roi is not None and spatial_resolution is not None:
         if type(roi) is str:
             roi = loads(roi)
         roi_bounds = roi.bounds
-        roi_center = roi.centroid
-        roi_srs = _get_reference_system(roi_grid)
-        destination_srs = _get_reference_system(destination_grid)
-        wgs84_srs = _get_reference_system('EPSG:4326')
-        if roi_srs is None:
-            if destination_srs is None:
-                roi_srs = wgs84_srs
-                destination_srs = _get_projected_srs(roi_center)
-            else:
-                roi_srs = destination_srs
-        elif destination_srs is None:
-            if roi_srs.IsSame(wgs84_srs):
-                destination_srs = _get_projected_srs(roi_center)
-            else:
-                raise ValueError('Cannot derive destination grid for roi grid {}. Please specify destination grid'.
-                                 format(roi_grid))
+        roi_srs, destination_srs = _get_roi_reference_systems(roi.centroid, roi_grid, destination_grid)
+        reprojection = Reprojection(roi_bounds, spatial_resolution, spatial_resolution, destination_srs, roi_srs)
+        if rasterize_roi and state_mask is None:
+            # the rasterized roi is the mask, so it is rasterized onto the target grid without warping any mask
+            grid_data_set = _get_destination_grid_data_set(roi_bounds, spatial_resolution, spatial_resolution,
+                                                           destination_srs, roi_srs)
+            return _rasterize_roi(roi, roi_srs, grid_data_set), reprojection
         if state_mask is not None:
             mask_data_set = gdal.Open(state_mask)
         else:
             mask_data_set = _get_default_global_state_mask()
-        reprojection = Reprojection(roi_bounds, spatial_resolution, spatial_resolution, destination_srs, roi_srs)
         reprojected_dataset = reprojection.reproject(mask_data_set)
+        if rasterize_roi:
+            roi_mask_data_set = _rasterize_roi(roi, roi_srs, reprojected_dataset)
+            _apply_roi_mask(reprojected_dataset, roi_mask_data_set.ReadAsArray())
         return reprojected_dataset, reprojection
     elif state_mask is not None:
         state_mask_data_set = gdal.Open(state_mask)
@@ -296,8 +1163,213 @@ def get_num_tiles(state_mask: Optional[str] = None, spatial_resolution: Optional
                   roi: Optional[Union[str, Polygon]] = None, roi_grid: Optional[str] = None,
                   destination_grid: Optional[str] = None, tile_width: Optional[int] = None,
                   tile_height: Optional[int] = None) -> Tuple:
-    mask_data_set, untiled_reprojection = get_mask_data_set_and_reprojection(state_mask, spatial_resolution, roi,
-                                                                              roi_grid, destination_grid)
-    raster_width = mask_data_set.RasterXSize
-    raster_height = mask_data_set.RasterYSize
-    return (int(np.ceil(raster_width / tile_width)), int(np.ceil(raster_height / tile_height)))
+    tile_grid = TileGrid.from_parameters(state_mask, spatial_resolution, roi, roi_grid, destination_grid, tile_width,
+                                         tile_height)
+    return tile_grid.num_tiles
+
+
+def _get_destination_grid_data_set(bounds: Sequence[float], x_res: float, y_res: float,
+                                   destination_srs: osr.SpatialReference,
+                                   bounds_srs: osr.SpatialReference) -> gdal.Dataset:
+    """
+    Provides a warped VRT on the grid onto which gdal warps data for the given bounds and resolution. As the grid
+    does not depend on the warped dataset when bounds and resolution are given, the VRT is set up for a dataset of a
+    single pixel which covers the bounds. No data is warped unless the VRT is read.
+    """
+    x_min, y_min, x_max, y_max = bounds
+    source_data_set = gdal.GetDriverByName('MEM').Create('', 1, 1, 1, gdal.GDT_Byte)
+    source_data_set.SetGeoTransform((x_min, x_max - x_min, 0.0, y_max, 0.0, y_min - y_max))
+    source_data_set.SetProjection(bounds_srs.ExportToWkt())
+    grid_options = gdal.WarpOptions(format='VRT', outputBounds=bounds, outputBoundsSRS=bounds_srs, xRes=abs(x_res),
+                                    yRes=abs(y_res), dstSRS=destination_srs)
+    return gdal.Warp('', source_data_set, options=grid_options)
+
+
+def _get_destination_grid(bounds: Sequence[float], x_res: float, y_res: float, destination_srs: osr.SpatialReference,
+                          bounds_srs: osr.SpatialReference) -> Tuple[int, int, Tuple[float, ...]]:
+    """
+    Determines the grid onto which gdal warps data for the given bounds and resolution, without warping any data.
+    :return: The width, the height and the geo transform of the grid
+    """
+    grid_data_set = _get_destination_grid_data_set(bounds, x_res, y_res, destination_srs, bounds_srs)
+    return grid_data_set.RasterXSize, grid_data_set.RasterYSize, grid_data_set.GetGeoTransform()
+
+
+class Tile(object):
+    """
+    A tile of a tile grid.
+    :param tile_x: The index of the tile in x-direction
+    :param tile_y: The index of the tile in y-direction
+    :param window: The pixels of the grid covered by the tile, given as x offset, y offset, width and height
+    :param bounds: The bounds of the tile in the destination reference system, as xmin, ymin, xmax, ymax
+    :param reprojection: A reprojection onto the tile
+    """
+
+    def __init__(self, tile_x: int, tile_y: int, window: Tuple[int, int, int, int],
+                 bounds: Tuple[float, float, float, float], reprojection: Reprojection):
+        self.tile_x = tile_x
+        self.tile_y = tile_y
+        self.window = window
+        self.bounds = bounds
+        self.reprojection = reprojection
+
+
+class TileGrid(object):
+    """
+    A raster in a destination reference system which is split into tiles. The dimensions of the raster are those gdal
+    determines from the bounds and the resolution when warping, but nothing is warped to get them.
+    Tiles at the right and lower borders may be smaller than the others.
+    """
+
+    def __init__(self, bounds: Sequence[float], x_res: float, y_res: float, destination_srs: osr.SpatialReference,
+                 bounds_srs: Optional[osr.SpatialReference] = None, tile_width: Optional[int] = None,
+                 tile_height: Optional[int] = None):
+        """
+        :param bounds: The bounds of the raster, as xmin, ymin, xmax, ymax
+        :param x_res: The resolution in x-direction, in units of the destination reference system
+        :param y_res: The resolution in y-direction, in units of the destination reference system
+        :param destination_srs: The reference system of the raster
+        :param bounds_srs: The reference system in which the bounds are given. If not given, the bounds are assumed to
+        be given in the destination reference system.
+        :param tile_width: The width of the tiles in pixels. If not given, tiles span the whole width of the raster.
+        :param tile_height: The height of the tiles in pixels. If not given, tiles span the whole height of the raster.
+        """
+        if bounds_srs is None:
+            bounds_srs = destination_srs
+        width, height, geo_transform = _get_destination_grid(bounds, x_res, y_res, destination_srs, bounds_srs)
+        self._x_res = abs(geo_transform[1])
+        self._y_res = abs(geo_transform[5])
+        self._x_min = geo_transform[0]
+        self._y_max = geo_transform[3]
+        self._width = width
+        self._height = height
+        self._destination_srs = destination_srs
+        self._tile_width = max(self._width, 1) if tile_width is None else tile_width
+        self._tile_height = max(self._height, 1) if tile_height is None else tile_height
+        if self._tile_width <= 0 or self._tile_height <= 0:
+            raise ValueError('Tile width and tile height must be positive')
+
+    def __getstate__(self):
+        # spatial reference systems cannot be pickled, so the grid is sent to other processes with the wkt
+        state = self.__dict__.copy()
+        state['_destination_srs'] = self._destination_srs.ExportToWkt()
+        return state
+
+    def __setstate__(self, state):
+        state = state.copy()
+        destination_srs = osr.SpatialReference()
+        destination_srs.ImportFromWkt(state['_destination_srs'])
+        state['_destination_srs'] = destination_srs
+        self.__dict__.update(state)
+
+    @classmethod
+    def from_parameters(cls, state_mask: Optional[str] = None, spatial_resolution: Optional[int] = None,
+                        roi: Optional[Union[str, Polygon]] = None, roi_grid: Optional[str] = None,
+                        destination_grid: Optional[str] = None, tile_width: Optional[int] = None,
+                        tile_height: Optional[int] = None) -> 'TileGrid':
+        """
+        Creates the tile grid on which get_mask_data_set_and_reprojection would provide the mask. Only in case no roi
+        is given, the state mask is opened to read its grid.
+        """
+        if roi is not None and spatial_resolution is not None:
+            roi = _get_roi_as_polygon(roi)
+            roi_srs, destination_srs = _get_roi_reference_systems(roi.centroid, roi_grid, destination_grid)
+            return TileGrid(roi.bounds, spatial_resolution, spatial_resolution, destination_srs, roi_srs, tile_width,
+                            tile_height)
+        elif state_mask is not None:
+            state_mask_data_set = gdal.Open(state_mask)
+            ulx, xres, xskew, uly, yskew, yres = state_mask_data_set.GetGeoTransform()
+            lrx = ulx + (state_mask_data_set.RasterXSize * xres)
+            lry = uly + (state_mask_data_set.RasterYSize * yres)
+            bounds = (min(ulx, lrx), min(uly, lry), max(ulx, lrx), max(uly, lry))
+            destination_srs = get_spatial_reference_system_from_dataset(state_mask_data_set)
+            return TileGrid(bounds, xres, yres, destination_srs, tile_width=tile_width, tile_height=tile_height)
+        else:
+            raise ValueError("Either state mask or roi and spatial resolution must be given")
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def height(self) -> int:
+        return self._height
+
+    @property
+    def tile_width(self) -> int:
+        return self._tile_width
+
+    @property
+    def tile_height(self) -> int:
+        return self._tile_height
+
+    @property
+    def num_tiles(self) -> Tuple[int, int]:
+        return int(np.ceil(self._width / self._tile_width)), int(np.ceil(self._height / self._tile_height))
+
+    @property
+    def destination_srs(self) -> osr.SpatialReference:
+        # a copy is handed out, as the reference system may be shared with other tile grids
+        return self._destination_srs.Clone()
+
+    @property
+    def geo_transform(self) -> Tuple[float, float, float, float, float, float]:
+        return self._x_min, self._x_res, 0.0, self._y_max, 0.0, -self._y_res
+
+    def __len__(self) -> int:
+        num_tiles_x, num_tiles_y = self.num_tiles
+        return num_tiles_x * num_tiles_y
+
+    def __iter__(self) -> Iterator[Tile]:
+        """Iterates over the tiles row by row, starting in the upper left corner."""
+        num_tiles_x, num_tiles_y = self.num_tiles
+        for tile_y in range(num_tiles_y):
+            for tile_x in range(num_tiles_x):
+                yield self.get_tile(tile_x, tile_y)
+
+    def get_tile_window(self, tile_x: int, tile_y: int) -> Tuple[int, int, int, int]:
+        """
+        :return: The pixels of the raster covered by the tile, as x offset, y offset, width and height
+        """
+        num_tiles_x, num_tiles_y = self.num_tiles
+        if not (0 <= tile_x < num_tiles_x and 0 <= tile_y < num_tiles_y):
+            raise ValueError('Tile ({}, {}) is not within grid of {} x {} tiles'.format(tile_x, tile_y, num_tiles_x,
+                                                                                     num_tiles_y))
+        x_offset = tile_x * self._tile_width
+        y_offset = tile_y * self._tile_height
+        return x_offset, y_offset, min(self._tile_width, self._width - x_offset), \
+            min(self._tile_height, self._height - y_offset)
+
+    def get_tile_bounds(self, tile_x: int, tile_y: int) -> Tuple[float, float, float, float]:
+        """
+        :return: The bounds of the tile in the destination reference system, as xmin, ymin, xmax, ymax
+        """
+        return self.get_window_bounds(self.get_tile_window(tile_x, tile_y))
+
+    def get_window_bounds(self, window: Tuple[int, int, int, int]) -> Tuple[float, float, float, float]:
+        """
+        :param window: A window of pixels, given as x offset, y offset, width and height
+        :return: The bounds of the window in the destination reference system, as xmin, ymin, xmax, ymax
+        """
+        x_offset, y_offset, width, height = window
+        x_min = self._x_min + x_offset * self._x_res
+        y_max = self._y_max - y_offset * self._y_res
+        return x_min, y_max - height * self._y_res, x_min + width * self._x_res, y_max
+
+    def get_tile(self, tile_x: int, tile_y: int, **reprojection_kwargs) -> Tile:
+        """
+        :param reprojection_kwargs: Further arguments for the reprojection of the tile, such as lazy or
+        warp_configuration
+        :return: The tile with the given indexes
+        """
+        bounds = self.get_tile_bounds(tile_x, tile_y)
+        reprojection = Reprojection(bounds, self._x_res, self._y_res, self._destination_srs, **reprojection_kwargs)
+        return Tile(tile_x, tile_y, self.get_tile_window(tile_x, tile_y), bounds, reprojection)
+
+    def get_reprojection(self, **reprojection_kwargs) -> Reprojection:
+        """
+        :return: A reprojection onto the whole grid
+        """
+        bounds = (self._x_min, self._y_max - self._height * self._y_res, self._x_min + self._width * self._x_res,
+                  self._y_max)
+        return Reprojection(bounds, self._x_res, self._y_res, self._destination_srs, **reprojection_kwargs)
@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 import scipy.sparse
 import logging
 import numpy as np
 import os
 from shapely.geometry import Point, Polygon
 from shapely.wkt import loads
-from typing import Optional, Union
+from typing import Optional, Sequence, Union
 
 __author__ = "MULTIPLY Team"
 
@@ -48,16 +49,39 @@ class AttributeDict(object):
         return getattr(self, key)
 
 
+_NOT_PARSED = object()
+
+
 class FileRef:
     """
     A reference to the physical location of a file.
+    File refs are compared and hashed by url, times and mime type. The data type is not considered, as it is only an
+    optional annotation.
     """
 
-    def __init__(self, url: str, start_time: str, end_time: str, mime_type: str):
+    __slots__ = ('_url', '_start_time', '_end_time', '_mime_type', '_data_type', '_start_datetime', '_end_datetime')
+
+    def __init__(self, url: str, start_time: str, end_time: str, mime_type: str, data_type: Optional[str] = None):
         self._url = url
         self._start_time = start_time
         self._end_time = end_time
         self._mime_type = mime_type
+        self._data_type = data_type
+        self._start_datetime = _NOT_PARSED
+        self._end_datetime = _NOT_PARSED
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FileRef):
+            return NotImplemented
+        return self._url == other._url and self._start_time == other._start_time and \
+            self._end_time == other._end_time and self._mime_type == other._mime_type
+
+    def __hash__(self) -> int:
+        return hash((self._url, self._start_time, self._end_time, self._mime_type))
+
+    def __repr__(self) -> str:
+        return 'FileRef({!r}, {!r}, {!r}, {!r}, {!r})'.format(self._url, self._start_time, self._end_time,
+                                                               self._mime_type, self._data_type)
 
     @property
     def url(self) -> str:
@@ -74,11 +98,30 @@ class FileRef:
         """The dataset's end time."""
         return self._end_time
 
+    @property
+    def start_datetime(self) -> Optional[datetime]:
+        """The dataset's start time as datetime. It is parsed on first access. None, if no start time is set."""
+        if self._start_datetime is _NOT_PARSED:
+            self._start_datetime = get_time_from_string(self._start_time)
+        return self._start_datetime
+
+    @property
+    def end_datetime(self) -> Optional[datetime]:
+        """The dataset's end time as datetime. It is parsed on first access. None, if no end time is set."""
+        if self._end_datetime is _NOT_PARSED:
+            self._end_datetime = get_time_from_string(self._end_time)
+        return self._end_datetime
+
     @property
     def mime_type(self):
         """The mime type of the file in question."""
         return self._mime_type
 
+    @property
+    def data_type(self) -> Optional[str]:
+        """The data type of the file, if it has been detected when the file ref was created."""
+        return self._data_type
+
 
 def get_logger(name: str) -> logging.Logger:
     """
@@ -109,11 +152,83 @@ def compute_distance(lon_0: float, lat_0: float, lon_1: float, lat_1: float, sph
     return distance
 
 
+_TIME_FORMATS = [("%Y%j", timedelta(hours=24, seconds=-1), False),
+                 ("%Y%m%dT%H%M%S", timedelta(), False),
+                 ("%Y-%m-%dT%H:%M:%S.%fZ", timedelta(), False),
+                 ("%Y-%m-%dT%H:%M:%S.%f", timedelta(), False),
+                 ("%Y-%m-%dT%H:%M:%SZ", timedelta(), False),
+                 ("%Y-%m-%dT%H:%M:%S", timedelta(), False),
+                 ("%Y-%m-%d %H:%M:%S", timedelta(), False),
+                 ("%Y-%m-%d", timedelta(hours=24, seconds=-1), False),
+                 ("%Y-%m", timedelta(), True),
+                 ("%Y", timedelta(days=365, seconds=-1), False)]
+_DIGITS_TO_NINES = str.maketrans('0123456789', '9999999999')
+_TIME_CACHE_SIZE = 65536
+
+
+def _get_time_string_shape(time_string: str) -> str:
+    return time_string.translate(_DIGITS_TO_NINES)
+
+
+def _get_time_format_shapes() -> dict:
+    # maps the shape of a zero-padded time string (all digits replaced by '9') to the index of its format
+    shapes = {}
+    sample_time = datetime(2000, 1, 1, 1, 1, 1, 1)
+    for i, (time_format, td, adjust) in enumerate(_TIME_FORMATS):
+        shape = _get_time_string_shape(sample_time.strftime(time_format))
+        if '%f' in time_format:
+            # fractions of seconds may be given with one to six digits
+            fraction_start = shape.index('.') + 1
+            for num_digits in range(1, 7):
+                shapes[shape[:fraction_start] + '9' * num_digits + shape[fraction_start + 6:]] = i
+        else:
+            shapes[shape] = i
+    return shapes
+
+
+_TIME_FORMAT_SHAPES = _get_time_format_shapes()
+_last_time_format_index = 0
+
+
+def _parse_time(time_string: str, format_index: int, adjust_to_last_day: bool) -> datetime:
+    time_format, td, adjust = _TIME_FORMATS[format_index]
+    dt = datetime.strptime(time_string, time_format)
+    if adjust:
+        td = timedelta(days=get_days_of_month(dt.year, dt.month), seconds=-1)
+    return dt + td if adjust_to_last_day else dt
+
+
+@lru_cache(maxsize=_TIME_CACHE_SIZE)
+def _get_time_from_string(time_string: str, adjust_to_last_day: bool) -> datetime:
+    global _last_time_format_index
+    # the format of well-formed strings can be told from their shape alone
+    format_index = _TIME_FORMAT_SHAPES.get(_get_time_string_shape(time_string))
+    if format_index is not None:
+        try:
+            return _parse_time(time_string, format_index, adjust_to_last_day)
+        except ValueError:
+            pass
+    # strings which are not zero-padded are most likely in the format that has been used last
+    try:
+        return _parse_time(time_string, _last_time_format_index, adjust_to_last_day)
+    except ValueError:
+        pass
+    for i in range(len(_TIME_FORMATS)):
+        try:
+            dt = _parse_time(time_string, i, adjust_to_last_day)
+            _last_time_format_index = i
+            return dt
+        except ValueError:
+            pass
+    raise ValueError('Invalid date/time value: "%s"' % time_string)
+
+
 def get_time_from_string(time_string: str, adjust_to_last_day: bool = False) -> Optional[datetime]:
     # note: This an excerpt of a method in cate_core
     """
     Retrieves a datetime object from a string. If the string is empty, None is returned.
     If the extraction failed, a ValueError is thrown.
+    The format is determined from the shape of the string, results are cached.
     :param time_string: A string in UTC time format
     :param adjust_to_last_day: If true (and if the time string has no information about the number of days of
     the month), the returned datetime will be set to the last day of the month; otherwise to the first.
@@ -122,25 +237,28 @@ def get_time_from_string(time_string: str, adjust_to_last_day: bool = False) ->
     """
     if time_string == '':
         return None
-    format_to_timedelta = [("%Y%j", timedelta(hours=24, seconds=-1), False),
-                           ("%Y%m%dT%H%M%S", timedelta(), False),
-                           ("%Y-%m-%dT%H:%M:%S.%fZ", timedelta(), False),
-                           ("%Y-%m-%dT%H:%M:%S.%f", timedelta(), False),
-                           ("%Y-%m-%dT%H:%M:%SZ", timedelta(), False),
-                           ("%Y-%m-%dT%H:%M:%S", timedelta(), False),
-                           ("%Y-%m-%d %H:%M:%S", timedelta(), False),
-                           ("%Y-%m-%d", timedelta(hours=24, seconds=-1), False),
-                           ("%Y-%m", timedelta(), True),
-                           ("%Y", timedelta(days=365, seconds=-1), False)]
-    for f, td, adjust in format_to_timedelta:
-        try:
-            dt = datetime.strptime(time_string, f)
-            if adjust:
-                td = timedelta(days=get_days_of_month(dt.year, dt.month), seconds=-1)
-            return dt + td if adjust_to_last_day else dt
-        except ValueError:
-            pass
-    raise ValueError('Invalid date/time value: "%s"' % time_string)
+    return _get_time_from_string(time_string, adjust_to_last_day)
+
+
+def get_times_from_strings(time_strings: Sequence[str], adjust_to_last_day: bool = False) -> np.ndarray:
+    """
+    Converts a sequence of time strings into an array of numpy datetime64 values. Every distinct string is parsed
+    only once. Empty strings are converted to NaT.
+    If the extraction of any time failed, a ValueError is thrown.
+    :param time_strings: A sequence of strings in UTC time format
+    :param adjust_to_last_day: If true (and if the time string has no information about the number of days of
+    the month), the returned times will be set to the last day of the month; otherwise to the first.
+    :return: An array of datetime64 values with a precision of microseconds and of the same shape as the input.
+    """
+    time_strings = np.asarray(time_strings, dtype=str)
+    if time_strings.size == 0:
+        return np.empty(time_strings.shape, dtype='datetime64[us]')
+    unique_time_strings, inverse = np.unique(time_strings, return_inverse=True)
+    unique_times = np.empty(len(unique_time_strings), dtype='datetime64[us]')
+    for i, time_string in enumerate(unique_time_strings):
+        time = get_time_from_string(str(time_string), adjust_to_last_day)
+        unique_times[i] = np.datetime64('NaT') if time is None else np.datetime64(time, 'us')
+    return unique_times[inverse].reshape(time_strings.shape)
 
 
 def get_time_from_year_and_day_of_year(year: int, day_of_year: int, set_to_end: bool=False):
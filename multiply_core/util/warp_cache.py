@@ -0,0 +1,119 @@
+"""
+Description
+===========
+
+This module contains a persistent cache for warped rasters. Warped rasters are stored as tiled GeoTIFFs in a cache
+directory. When the cache exceeds its maximum size, the rasters which have not been used for the longest time are
+removed.
+"""
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+import gdal
+import hashlib
+import os
+import threading
+
+from typing import Optional
+
+_CREATION_OPTIONS = ['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+
+
+class WarpCache(object):
+    """
+    A cache for warped rasters.
+    :param cache_dir: The directory in which the warped rasters are stored
+    :param max_size: The maximum size of the cache in bytes
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 10 * 1024 ** 3):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @staticmethod
+    def get_key(dataset: gdal.Dataset, *target_parameters) -> Optional[str]:
+        """
+        Creates the key under which the warp of a dataset is stored.
+        :param dataset: The dataset which is warped
+        :param target_parameters: Everything else which determines the outcome of the warp, such as the target grid,
+        the resampling mode and the output type
+        :return: The key, or None, if the dataset is not a file and hence cannot be cached
+        """
+        path = dataset.GetDescription()
+        if not os.path.isfile(path):
+            return None
+        file_stat = os.stat(path)
+        key = repr((os.path.abspath(path), file_stat.st_mtime_ns, file_stat.st_size) + tuple(target_parameters))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _get_file_name(self, key: str) -> str:
+        return os.path.join(self._cache_dir, '{}.tif'.format(key))
+
+    def get(self, key: str) -> Optional[gdal.Dataset]:
+        """
+        :return: An in-memory copy of the warped raster stored under the key, or None, if there is none
+        """
+        file_name = self._get_file_name(key)
+        try:
+            # the modification time marks when the raster has been used last
+            os.utime(file_name)
+        except OSError:
+            return None
+        cached_data_set = gdal.Open(file_name)
+        if cached_data_set is None:
+            return None
+        return gdal.Translate('', cached_data_set, format='MEM')
+
+    def put(self, key: str, dataset: gdal.Dataset):
+        """
+        Stores a warped raster under the key and removes the least recently used rasters if the cache has become too
+        large.
+        """
+        file_name = self._get_file_name(key)
+        # the raster is written under a temporary name, so that nobody reads an incomplete file
+        temp_file_name = '{}.{}.{}.tmp.tif'.format(file_name[:-4], os.getpid(), threading.get_ident())
+        cached_data_set = gdal.Translate(temp_file_name, dataset, format='GTiff', creationOptions=_CREATION_OPTIONS)
+        cached_data_set = None
+        os.replace(temp_file_name, file_name)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self._cache_dir):
+                if entry.name.endswith('.tif') and not entry.name.endswith('.tmp.tif'):
+                    try:
+                        entry_stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+            size = sum(entry[1] for entry in entries)
+            for modification_time, entry_size, path in sorted(entries):
+                if size <= self._max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                size -= entry_size
+
+
+_WARP_CACHE = None
+
+
+def set_warp_cache(warp_cache: Optional[WarpCache]):
+    """
+    Sets the warp cache which is used by reprojections and reproject_image. If None is set, warps are not cached.
+    """
+    global _WARP_CACHE
+    _WARP_CACHE = warp_cache
+
+
+def get_warp_cache() -> Optional[WarpCache]:
+    return _WARP_CACHE
@@ -1,10 +1,14 @@
 from datetime import datetime
+import numpy as np
 from multiply_core.observations.data_validation import S2L1CValidator, AWSS2L1Validator, ModisMCD43Validator, \
     ModisMCD15A2HValidator, CamsValidator, S2AEmulatorValidator, S2BEmulatorValidator, WVEmulatorValidator, \
     AsterValidator, get_valid_types, CamsTiffValidator, VariableValidator, S2L2Validator, S1SlcValidator, \
-    S1SpeckledValidator
+    S1SpeckledValidator, AWSS2L2Validator, are_valid_for, get_valid_type, is_valid
+from multiply_core.observations.data_validation import _are_named_products_valid_for, _get_names_matcher
+from multiply_core.util import get_time_from_string
 from shapely.geometry import Polygon
 from shapely.wkt import loads
+import re
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -60,6 +64,47 @@ def test_s1_slc_is_valid_for():
     assert not validator.is_valid_for(other_s1_path, Polygon(), datetime(2016, 6, 8), datetime(2018, 6, 9))
 
 
+def test_s1_slc_are_valid_for():
+    validator = S1SlcValidator()
+    paths = ['S1A_IW_SLC__1SDH_20140502T170314_20140502T170344_000421_0004CC_1A90',
+             '/some/path/S1A_IW_SLC__1SDH_20160607T170314_20160607T170344_000421_0004CC_1A90/',
+             'S2A_IW_SLC__1SDH_20140502T170314_20140502T170344_000421_0004CC_1A90',
+             'dtsfrghgj']
+
+    valid = validator.are_valid_for(paths, Polygon(), datetime(2014, 5, 1), datetime(2014, 5, 3))
+    np.testing.assert_array_equal([True, False, False, False], valid)
+    valid = validator.are_valid_for(paths, Polygon(), datetime(2014, 5, 1), datetime(2016, 6, 8))
+    np.testing.assert_array_equal([True, True, False, False], valid)
+    valid = validator.are_valid_for(paths, Polygon(), datetime(2014, 5, 3), datetime(2016, 6, 6))
+    np.testing.assert_array_equal([False, False, False, False], valid)
+    assert 0 == len(validator.are_valid_for([], Polygon(), datetime(2014, 5, 1), datetime(2014, 5, 3)))
+
+
+def _is_valid_for_by_name_parts(name: str, start_time: datetime, end_time: datetime) -> bool:
+    # how is_valid_for determines the time: the first part starting with a time is parsed as a whole
+    for name_part in name.split('_'):
+        if re.match('[0-9]{8}T[0-9]{6}', name_part) is not None:
+            try:
+                time = get_time_from_string(name_part)
+            except ValueError:
+                return False
+            return time is not None and start_time <= time <= end_time
+    return False
+
+
+def test_are_named_products_valid_for_uses_whole_name_parts():
+    names = ['A_20140502T170314_B', 'A_20140502T170314.SAFE', 'A_20140502T170314123_B', 'A_20140502T1703_B',
+             'A_2014050_20140502T170314_B', 'A_B20140502T170314_20140502T170314x_B', 'A_20140502T170314x_B',
+             '20140502T170314_B', 'A_B']
+    start_time, end_time = datetime(2014, 5, 1), datetime(2014, 5, 3)
+
+    valid = _are_named_products_valid_for(_get_names_matcher('.*'), names, start_time, end_time)
+
+    expected = [_is_valid_for_by_name_parts(name, start_time, end_time) for name in names]
+    np.testing.assert_array_equal(expected, valid)
+    assert valid[0]
+
+
 def test_s1_speckled_validator_get_relative_path():
     validator = S1SpeckledValidator()
 
@@ -123,6 +168,18 @@ def test_aws_s2_validator_is_valid():
     assert validator.is_valid(VALID_AWS_S2_DATA)
 
 
+def test_aws_s2_validator_is_valid_name():
+    assert AWSS2L1Validator().is_valid_name('/29/S/QB/2017/9/4/0')
+    assert AWSS2L2Validator().is_valid_name('/29/S/QB/2017/9/4/0')
+    assert not AWSS2L1Validator().is_valid_name('fcsfzvdbt/chvs/201')
+    assert not AWSS2L2Validator().is_valid_name('fcsfzvdbt/chvs/201')
+
+
+def test_aws_s2_get_valid_type_name_only_does_not_distinguish_levels():
+    assert 'AWS_S2_L1C' == get_valid_type('/29/S/QB/2017/9/4/0', name_only=True)
+    assert is_valid('/29/S/QB/2017/9/4/0', 'AWS_S2_L2', name_only=True)
+
+
 def test_aws_s2_validator_get_relative_path():
     validator = AWSS2L1Validator()
 
@@ -145,6 +202,15 @@ def test_s2_is_valid():
     assert not validator.is_valid('./test/test_data/S2A_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300')
 
 
+def test_s2_is_valid_name():
+    validator = S2L1CValidator()
+    assert validator.is_valid_name(VALID_S2_PATH)
+    assert validator.is_valid_name('S2A_OPER_PRD_MSIL1C_PDMC_20150714T123646_R019_V20150704T102427_20150704T102427.SAFE')
+    assert validator.is_valid_name('s3://bucket/S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300/')
+    assert not validator.is_valid_name('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300-ac')
+    assert not validator.is_valid_name('dtsfrghgj')
+
+
 def test_s2_get_relative_path():
     validator = S2L1CValidator()
     assert 'S2A_OPER_PRD_MSIL1C_PDMC_20150714T123646_R019_V20150704T102427_20150704T102427.SAFE' \
@@ -185,6 +251,14 @@ def test_s2l2_is_valid():
     assert not validator.is_valid(ANOTHER_VALID_S2_PATH)
 
 
+def test_s2l2_is_valid_name():
+    validator = S2L2Validator()
+    assert validator.is_valid_name('S2A_MSIL1C_20170605T105031_N0205_R051_T30SWJ_20170605T105303-ac')
+    assert validator.is_valid_name(
+        'https://some.host/S2B_MSIL1C_20170605T105031_N0205_R051_T30SWJ_20170605T105303-ac')
+    assert not validator.is_valid_name('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300')
+
+
 def test_s2l2_get_relative_path():
     validator = S2L2Validator()
     assert 'S2A_MSIL1C_20170605T105031_N0205_R051_T30SWJ_20170605T105303-ac' \
@@ -418,6 +492,16 @@ def test_aster_is_valid_for():
     assert not validator.is_valid_for('ASTGTM2_N13E133_dem.tif', polygon, datetime(1000, 1, 1), datetime(1000, 1, 3))
 
 
+def test_aster_are_valid_for():
+    validator = AsterValidator()
+
+    polygon = loads('POLYGON((134.20 12.09, 133.91 12.09, 133.91 11.94, 134.2 11.94, 134.20 12.09))')
+    paths = ['ASTGTM2_N12E134_dem.tif', 'ASTGTM2_N11E133_dem.tif', '/some/path/ASTGTM2_N12E133_dem.tif',
+             'ASTGTM2_N13E133_dem.tif', 'ASTGTM2_S12E134_dem.tif', 'ASTGTM2_N12W134_dem.tif', 'dtsfrghgj']
+    valid = validator.are_valid_for(paths, polygon, datetime(1000, 1, 1), datetime(1000, 1, 3))
+    np.testing.assert_array_equal([True, True, True, False, False, False, False], valid)
+
+
 def test_variable_validator_name():
     validator = VariableValidator('cvgfs')
 
@@ -491,3 +575,39 @@ def test_get_valid_types():
     assert 'ASTER' in valid_types
     assert 'S2_L1C' in valid_types
     assert 'S2_L2' in valid_types
+
+
+def test_are_valid_for():
+    paths = ['S1A_IW_SLC__1SDH_20140502T170314_20140502T170344_000421_0004CC_1A90',
+             'S1A_IW_SLC__1SDH_20160607T170314_20160607T170344_000421_0004CC_1A90',
+             'isotropic_MSI_emulators_correction_xap_S2A.pkl']
+
+    valid = are_valid_for(paths, 'S1_SLC', Polygon(), datetime(2014, 5, 1), datetime(2014, 5, 3))
+    np.testing.assert_array_equal([True, False, False], valid)
+    valid = are_valid_for(paths, 'ISO_MSI_A_EMU', Polygon(), datetime(2014, 5, 1), datetime(2014, 5, 3))
+    np.testing.assert_array_equal([False, False, True], valid)
+    valid = are_valid_for(paths, 'dgfvbgf', Polygon(), datetime(2014, 5, 1), datetime(2014, 5, 3))
+    np.testing.assert_array_equal([False, False, False], valid)
+
+
+def test_are_valid_for_name_only():
+    paths = ['S2A_MSIL1C_20170605T105031_N0205_R051_T30SWJ_20170605T105303-ac',
+             'S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300-ac',
+             'S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300']
+
+    valid = are_valid_for(paths, 'S2_L2', Polygon(), datetime(2017, 6, 4), datetime(2017, 6, 6), name_only=True)
+    np.testing.assert_array_equal([True, False, False], valid)
+    valid = are_valid_for(paths, 'S2_L2', Polygon(), datetime(2017, 6, 4), datetime(2017, 6, 6))
+    np.testing.assert_array_equal([False, False, False], valid)
+
+
+def test_get_valid_type_name_only():
+    assert 'S2_L1C' == get_valid_type('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300',
+                                      name_only=True)
+    assert 'S2_L2' == get_valid_type('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300-ac',
+                                     name_only=True)
+    assert 'CAMS_TIFF' == get_valid_type('/some/path/2018_10_23/', name_only=True)
+    assert 'CAMS_TIFF' != get_valid_type('/some/path/2018_10_23/2018_10_23_aod550.tif', name_only=True)
+    assert '' == get_valid_type('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300')
+    assert is_valid('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300', 'S2_L1C', name_only=True)
+    assert not is_valid('S2B_MSIL1C_20180819T100019_N0206_R122_T32TQR_20180819T141300', 'S2_L1C')
@@ -29,6 +29,17 @@ def test_sort_file_ref_list():
     assert 'loc5', file_refs[4]
 
 
+def test_sort_file_ref_list_with_different_time_formats():
+    file_refs = [FileRef(url='loc1', start_time='2017-06-04', end_time='2017-06-07', mime_type='unknown mime type'),
+                 FileRef(url='loc2', start_time='20170603T105031', end_time='2017-06-06', mime_type='unknown mime type'),
+                 FileRef(url='loc3', start_time='2017-06-03 09:50:31', end_time='2017-06-10',
+                         mime_type='unknown mime type'),
+                 FileRef(url='loc4', start_time='2017154', end_time='2017-06-09', mime_type='unknown mime type')]
+    observations_factory = ObservationsFactory()
+    observations_factory.sort_file_ref_list(file_refs)
+    assert ['loc4', 'loc3', 'loc2', 'loc1'] == [file_ref.url for file_ref in file_refs]
+
+
 def test_create_observations():
 
     class DummyObservations(ProductObservations):
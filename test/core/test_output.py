@@ -1,7 +1,9 @@
 import gdal
-from multiply_core.observations import GeoTiffWriter
+from multiply_core.observations import AsyncWriter, CloudOptimizedGeoTiffWriter, GeoTiffWriter
+from multiply_core.observations.output import Writer, _downsample, _get_overview_factors
 import numpy as np
 import os
+import time
 from pytest import raises
 
 GEOTIFF_WRITE_FOLDER = './test/test_data/geotiff'
@@ -148,3 +150,153 @@ def test_geotiff_writer_write():
         for file_name in file_names:
             if os.path.exists(file_name):
                 os.remove(file_name)
+
+
+def test_geotiff_writer_write_tiles_as_context_manager():
+    file_name = os.path.abspath('{}/name61.tif'.format(GEOTIFF_WRITE_FOLDER))
+    try:
+        with GeoTiffWriter([file_name], GEO_TRANSFORM, PROJECTION, 4, 4, [1], data_types=['Float']) as writer:
+            writer.write([np.full((2, 4), 1.)], width=4, height=2, offset_x=0, offset_y=0)
+            writer.checkpoint()
+            writer.write([np.full((2, 4), 2.)], width=4, height=2, offset_x=0, offset_y=2)
+        with raises(ValueError):
+            writer.write([np.full((2, 4), 3.)], width=4, height=2, offset_x=0, offset_y=0)
+        read_data = gdal.Open(file_name)
+        data = read_data.GetRasterBand(1).ReadAsArray()
+        np.testing.assert_array_almost_equal(np.array([[1.] * 4, [1.] * 4, [2.] * 4, [2.] * 4]), data)
+        # noinspection PyUnusedLocal
+        read_data = None
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+def test_cloud_optimized_geotiff_writer_write_tiles():
+    file_name = os.path.abspath('{}/name_cog.tif'.format(GEOTIFF_WRITE_FOLDER))
+    try:
+        with CloudOptimizedGeoTiffWriter([file_name], GEO_TRANSFORM, PROJECTION, 256, 256, [1], ['Float'],
+                                         block_size=64) as writer:
+            for tile_y in range(0, 256, 100):
+                for tile_x in range(0, 256, 100):
+                    height, width = min(100, 256 - tile_y), min(100, 256 - tile_x)
+                    writer.write([np.full((height, width), float(tile_x + tile_y))], width, height, tile_x, tile_y)
+
+        assert not os.path.exists('{}/name_cog.partial.tif'.format(GEOTIFF_WRITE_FOLDER))
+        data_set = gdal.Open(file_name)
+        band = data_set.GetRasterBand(1)
+        assert [64, 64] == band.GetBlockSize()
+        assert 2 == band.GetOverviewCount()
+        assert (128, 128) == (band.GetOverview(0).XSize, band.GetOverview(0).YSize)
+        assert (64, 64) == (band.GetOverview(1).XSize, band.GetOverview(1).YSize)
+        overview = band.GetOverview(1).ReadAsArray()
+        assert 0. == overview[0, 0]
+        assert 200. == overview[63, 0]
+        assert 100. == overview[25, 0]
+    finally:
+        for file_name in [file_name, '{}/name_cog.partial.tif'.format(GEOTIFF_WRITE_FOLDER)]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+
+def test_cloud_optimized_geotiff_writer_invalid_block_size():
+    with raises(ValueError):
+        CloudOptimizedGeoTiffWriter([], GEO_TRANSFORM, PROJECTION, 256, 256, block_size=100)
+
+
+def test_get_overview_factors():
+    assert [] == _get_overview_factors(512, 300, 512)
+    assert [2] == _get_overview_factors(1000, 300, 512)
+    assert [2, 4, 8] == _get_overview_factors(3000, 4000, 512)
+
+
+def test_downsample():
+    data = np.array([[1., 3., 5.], [5., np.nan, 7.], [2., 2., 2.]])
+
+    downsampled = _downsample(data)
+
+    assert np.float64 == downsampled.dtype
+    np.testing.assert_array_equal(np.array([[3., 6.], [2., 2.]]), downsampled)
+    np.testing.assert_array_equal(np.array([[2, 4]], dtype=np.int32),
+                                  _downsample(np.array([[1, 2, 4], [2, 3, 4]], dtype=np.int32)))
+
+
+def test_downsample_with_no_data_value():
+    data = np.array([[-1, -1, 4, -1],
+                     [-1, -1, 2, 8]], dtype=np.int16)
+
+    downsampled = _downsample(data, -1)
+
+    assert np.int16 == downsampled.dtype
+    np.testing.assert_array_equal(np.array([[-1, 5]], dtype=np.int16), downsampled)
+    np.testing.assert_array_equal(np.array([[0., 3.]]),
+                                  _downsample(np.array([[0., 0., 2., 4.], [0., 0., np.nan, 0.]]), 0.))
+
+
+class _RecordingWriter(Writer):
+
+    def init(self, file_names, geo_transform, projection, width, height, num_bands=None, data_types=None):
+        self.writes = []
+        self.closed = False
+
+    def write(self, data, width=None, height=None, offset_x=0, offset_y=0):
+        time.sleep(0.01)
+        if offset_x < 0:
+            raise IOError('Invalid offset')
+        self.writes.append((data[0][0, 0], offset_x, offset_y))
+
+    def close(self):
+        self.closed = True
+
+
+def test_async_writer_write():
+    recording_writer = _RecordingWriter([], GEO_TRANSFORM, PROJECTION, 4, 4, None, None)
+
+    with AsyncWriter(recording_writer, max_queued_writes=2) as writer:
+        for i in range(5):
+            writer.write([np.full((1, 4), float(i))], width=4, height=1, offset_x=0, offset_y=i)
+        writer.checkpoint()
+        assert 5 == len(recording_writer.writes)
+
+    assert [(float(i), 0, i) for i in range(5)] == recording_writer.writes
+    assert recording_writer.closed
+
+
+def test_async_writer_propagates_errors_on_close():
+    recording_writer = _RecordingWriter([], GEO_TRANSFORM, PROJECTION, 4, 4, None, None)
+    writer = AsyncWriter(recording_writer)
+    writer.write([np.zeros((1, 4))], width=4, height=1, offset_x=-1, offset_y=0)
+    writer.write([np.zeros((1, 4))], width=4, height=1, offset_x=0, offset_y=1)
+
+    with raises(IOError):
+        writer.close()
+    assert recording_writer.closed
+    assert 0 == len(recording_writer.writes)
+
+
+def test_async_writer_propagates_errors_on_write():
+    recording_writer = _RecordingWriter([], GEO_TRANSFORM, PROJECTION, 4, 4, None, None)
+    writer = AsyncWriter(recording_writer, max_queued_writes=1)
+    writer.write([np.zeros((1, 4))], width=4, height=1, offset_x=-1, offset_y=0)
+
+    # the failed write is noticed by one of the following writes, as soon as the background thread has got to it
+    with raises(IOError):
+        for i in range(100):
+            writer.write([np.zeros((1, 4))], width=4, height=1, offset_x=0, offset_y=i)
+    assert 0 == len(recording_writer.writes)
+    with raises(IOError):
+        writer.close()
+
+
+def test_async_writer_with_several_writers():
+    recording_writers = [_RecordingWriter([], GEO_TRANSFORM, PROJECTION, 4, 4, None, None) for _ in range(3)]
+
+    with AsyncWriter(recording_writers) as writer:
+        for i in range(4):
+            writer.write([np.full((1, 4), float(i + j)) for j in range(3)], width=4, height=1, offset_x=0,
+                         offset_y=i)
+        with raises(ValueError):
+            writer.write([np.zeros((1, 4))], width=4, height=1)
+
+    for j, recording_writer in enumerate(recording_writers):
+        assert [(float(i + j), 0, i) for i in range(4)] == recording_writer.writes
+        assert recording_writer.closed
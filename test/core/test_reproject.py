@@ -1,9 +1,14 @@
 from shapely.wkt import loads
 
 import gdal
+import numpy as np
+import os
 import osr
 import multiply_core.util.reproject as reproject
 import pytest
+import shutil
+import tempfile
+import threading
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -26,6 +31,20 @@ def test_reproject_to_wgs84():
     assert transformed_roi.almost_equals(expected_roi)
 
 
+def test_reproject_rois_to_wgs84():
+    roi = 'POLYGON((685700. 6462200., 685700. 6470700., 697660. 6470700., 697660. 6462200., 685700. 6462200.))'
+    holed_roi = 'POLYGON((685700 6462200, 685700 6470700, 697660 6470700, 697660 6462200, 685700 6462200), ' \
+                '(686000 6463000, 686000 6464000, 687000 6464000, 686000 6463000))'
+
+    reprojected_rois = reproject.reproject_rois_to_wgs84([roi, '', holed_roi], 'EPSG:3301')
+
+    assert 3 == len(reprojected_rois)
+    assert '' == reprojected_rois[1]
+    assert loads(reproject.reproject_to_wgs84(roi, 'EPSG:3301')).almost_equals(loads(reprojected_rois[0]))
+    assert loads(reproject.reproject_to_wgs84(holed_roi, 'EPSG:3301')).almost_equals(loads(reprojected_rois[2]))
+    assert 1 == len(loads(reprojected_rois[2]).interiors)
+
+
 def test_transform_coordinates_0():
     ala_dataset = gdal.Open(ALA_TIFF_FILE)
     ala_srs = reproject.get_spatial_reference_system_from_dataset(ala_dataset)
@@ -139,6 +158,25 @@ def test_reproject_image():
     assert 14 == raster_data[94][285]
 
 
+def test_reproject_images():
+    expected_data = reproject.reproject_image(S2_FILE, ALA_TIFF_FILE).ReadAsArray()
+
+    stacked_data = reproject.reproject_images([S2_FILE, gdal.Open(S2_FILE)], ALA_TIFF_FILE, max_workers=2)
+
+    assert (2,) + expected_data.shape == stacked_data.shape
+    np.testing.assert_array_equal(expected_data, stacked_data[0])
+    np.testing.assert_array_equal(expected_data, stacked_data[1])
+
+    stacked_data_set = reproject.reproject_images([S2_FILE, S2_FILE], ALA_TIFF_FILE, as_data_set=True)
+    assert 2 == stacked_data_set.RasterCount
+    np.testing.assert_array_equal(expected_data, stacked_data_set.GetRasterBand(2).ReadAsArray())
+
+
+def test_reproject_images_without_source_images():
+    with pytest.raises(ValueError):
+        reproject.reproject_images([], ALA_TIFF_FILE)
+
+
 def test_get_num_tiles():
     roi = 'POLYGON ((27.1647563115467534 58.2611263320005577, 27.1716005869326196 58.3373581174386473, ' \
           '27.3755330955532621 58.3321196269764286, 27.3682501734918766 58.2558991181697223, ' \
@@ -146,3 +184,508 @@ def test_get_num_tiles():
     num_x_tiles, num_y_tiles = reproject.get_num_tiles(spatial_resolution=120, roi=roi, tile_width=5, tile_height=5)
     assert 21 == num_x_tiles
     assert 16 == num_y_tiles
+
+
+def test_get_mask_data_set_and_reprojection_with_rasterized_roi():
+    roi = 'POLYGON((500000 5000000, 500000 5001000, 501000 5001000, 501000 5000500, 500500 5000500, ' \
+          '500500 5000000, 500000 5000000))'
+
+    mask_data_set, reprojection = reproject.get_mask_data_set_and_reprojection(
+        spatial_resolution=100, roi=roi, roi_grid='EPSG:32632', destination_grid='EPSG:32632', rasterize_roi=True)
+
+    assert 10 == mask_data_set.RasterXSize
+    assert 10 == mask_data_set.RasterYSize
+    assert (500000, 100, 0, 5001000, 0, -100) == pytest.approx(mask_data_set.GetGeoTransform())
+    mask = mask_data_set.ReadAsArray()
+    assert 75 == mask.sum()
+    assert 1 == mask[0, 9]
+    assert 1 == mask[9, 0]
+    assert 0 == mask[9, 9]
+    assert reprojection.get_destination_srs().IsSame(reproject._get_reference_system('EPSG:32632'))
+
+    bounding_box_mask_data_set, reprojection = reproject.get_mask_data_set_and_reprojection(
+        spatial_resolution=100, roi=roi, roi_grid='EPSG:32632', destination_grid='EPSG:32632')
+    assert 100 == bounding_box_mask_data_set.ReadAsArray().sum()
+
+
+def test_get_mask_data_set_and_reprojection_with_rasterized_wgs84_roi(monkeypatch):
+    roi = 'POLYGON ((9.0 51.0, 9.0 51.02, 9.03 51.02, 9.0 51.0))'
+
+    bounding_box_mask_data_set, bounding_box_reprojection = reproject.get_mask_data_set_and_reprojection(
+        spatial_resolution=100, roi=roi, roi_grid='EPSG:4326', destination_grid='EPSG:32632')
+
+    def _fail_to_reproject(*args, **kwargs):
+        raise AssertionError('No mask must be warped when the rasterized roi is the mask')
+
+    monkeypatch.setattr(reproject.Reprojection, 'reproject', _fail_to_reproject)
+    mask_data_set, reprojection = reproject.get_mask_data_set_and_reprojection(
+        spatial_resolution=100, roi=roi, roi_grid='EPSG:4326', destination_grid='EPSG:32632', rasterize_roi=True)
+
+    # the rasterized roi lies on the same grid as the warped mask
+    assert bounding_box_mask_data_set.RasterXSize == mask_data_set.RasterXSize
+    assert bounding_box_mask_data_set.RasterYSize == mask_data_set.RasterYSize
+    assert bounding_box_mask_data_set.GetGeoTransform() == pytest.approx(mask_data_set.GetGeoTransform())
+    assert reprojection.get_destination_srs().IsSame(reproject._get_reference_system('EPSG:32632'))
+    mask = mask_data_set.ReadAsArray()
+    assert 0 < mask.sum() < mask.size
+    # the triangle covers the upper left, but not the lower right part of the grid
+    assert 1 == mask[1, 1]
+    assert 0 == mask[-1, -1]
+
+
+def test_tile_grid():
+    roi = 'POLYGON ((27.1647563115467534 58.2611263320005577, 27.1716005869326196 58.3373581174386473, ' \
+          '27.3755330955532621 58.3321196269764286, 27.3682501734918766 58.2558991181697223, ' \
+          '27.1647563115467534 58.2611263320005577))'
+    tile_grid = reproject.TileGrid.from_parameters(spatial_resolution=120, roi=roi, tile_width=5, tile_height=5)
+    # the wgs84 roi is warped to utm, the tile grid must match the grid of the warped mask
+    mask_data_set, reprojection = reproject.get_mask_data_set_and_reprojection(spatial_resolution=120, roi=roi)
+
+    assert mask_data_set.RasterXSize == tile_grid.width
+    assert mask_data_set.RasterYSize == tile_grid.height
+    assert pytest.approx(mask_data_set.GetGeoTransform()) == tile_grid.geo_transform
+    assert reprojection.get_destination_srs().IsSame(tile_grid.destination_srs)
+    assert (21, 16) == tile_grid.num_tiles
+    assert 336 == len(tile_grid)
+    tiles = list(tile_grid)
+    assert 336 == len(tiles)
+    assert (0, 0, 5, 5) == tiles[0].window
+    assert (20, 15) == (tiles[-1].tile_x, tiles[-1].tile_y)
+    assert (100, 75, tile_grid.width - 100, tile_grid.height - 75) == tiles[-1].window
+    geo_transform = tile_grid.geo_transform
+    x_min, y_min, x_max, y_max = tiles[-1].bounds
+    assert pytest.approx(geo_transform[0] + 100 * 120) == x_min
+    assert pytest.approx(geo_transform[3] - tile_grid.height * 120) == y_min
+    assert pytest.approx((tile_grid.width - 100) * 120) == x_max - x_min
+    assert pytest.approx((tile_grid.height - 75) * 120) == y_max - y_min
+    assert tiles[-1].reprojection.get_destination_srs().IsSame(tile_grid.destination_srs)
+    with pytest.raises(ValueError):
+        tile_grid.get_tile(21, 0)
+
+
+def test_reprojection_caches_warp_options():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    reprojection = reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs)
+
+    first_reprojected_dataset = reprojection.reproject(S2_FILE)
+    second_reprojected_dataset = reprojection.reproject(gdal.Open(S2_FILE))
+
+    assert 1 == len(reprojection._warp_plans)
+    assert first_reprojected_dataset.RasterXSize == second_reprojected_dataset.RasterXSize
+    assert first_reprojected_dataset.RasterYSize == second_reprojected_dataset.RasterYSize
+    np.testing.assert_array_equal(first_reprojected_dataset.ReadAsArray(), second_reprojected_dataset.ReadAsArray())
+
+    reprojection.reproject(ALA_TIFF_FILE)
+    assert 2 == len(reprojection._warp_plans)
+
+
+def test_lazy_reprojection():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    reprojection = reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs)
+    lazy_reprojection = reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs,
+                                               lazy=True)
+
+    expected_data = reprojection.reproject(S2_FILE).ReadAsArray()
+    lazy_dataset = lazy_reprojection.reproject(S2_FILE)
+
+    assert 'VRT' == lazy_dataset.GetDriver().ShortName
+    assert expected_data.shape == (lazy_dataset.RasterYSize, lazy_dataset.RasterXSize)
+    window_data = reproject.read_window(lazy_dataset, (100, 50, 200, 100))
+    assert (100, 200) == window_data.shape
+    np.testing.assert_array_equal(expected_data[50:150, 100:300], window_data)
+
+
+def test_reprojection_with_warp_configuration():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    bounds = [8.0, 53.6, 8.3, 53.7]
+    configuration = reproject.WarpConfiguration(multithread=True, warp_memory_limit=512, num_threads=2,
+                                                crop_source=True)
+    float_configuration = reproject.WarpConfiguration(output_type=gdal.GDT_Float32)
+    plain_reprojection = reproject.Reprojection(bounds, 50, 100, destination_srs, bounds_srs)
+    reprojection = reproject.Reprojection(bounds, 50, 100, destination_srs, bounds_srs,
+                                          warp_configuration=configuration)
+    float_reprojection = reproject.Reprojection(bounds, 50, 100, destination_srs, bounds_srs,
+                                                warp_configuration=float_configuration)
+
+    expected_data = plain_reprojection.reproject(S2_FILE).ReadAsArray()
+    reprojected_dataset = reprojection.reproject(S2_FILE)
+    float_dataset = float_reprojection.reproject(S2_FILE)
+
+    assert reprojection._get_warp_plan(gdal.Open(S2_FILE)).source_window is not None
+    assert expected_data.dtype == reprojected_dataset.ReadAsArray().dtype
+    # cropping shifts the source coordinates, which may change how averages are rounded
+    np.testing.assert_allclose(expected_data, reprojected_dataset.ReadAsArray(), atol=1)
+    assert gdal.GDT_Float32 == float_dataset.GetRasterBand(1).DataType
+    np.testing.assert_allclose(expected_data, np.rint(float_dataset.ReadAsArray()), atol=1)
+
+
+def test_warp_configuration_threading():
+    assert (False, None) == reproject.WarpConfiguration()._get_threading()
+    configuration = reproject.WarpConfiguration(multithread=True, num_threads='ALL_CPUS')
+    assert (True, 'ALL_CPUS') == configuration._get_threading()
+    with reproject.limit_warp_threads(1):
+        assert (False, None) == configuration._get_threading()
+    with reproject.limit_warp_threads(2):
+        assert (True, 2) == configuration._get_threading()
+        assert (True, 1) == reproject.WarpConfiguration(multithread=True, num_threads=1)._get_threading()
+    assert (True, 'ALL_CPUS') == configuration._get_threading()
+
+
+def test_reprojection_with_cached_overviews():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    bounds = [7.8, 53.5, 8.8, 53.8]
+    cache_dir = tempfile.mkdtemp()
+    try:
+        configuration = reproject.WarpConfiguration(overview_cache_dir=cache_dir)
+        reprojection = reproject.Reprojection(bounds, 1500, 1500, destination_srs, bounds_srs,
+                                              warp_configuration=configuration)
+
+        reprojected_dataset = reprojection.reproject(ALA_TIFF_FILE)
+
+        assert 0 == gdal.Open(ALA_TIFF_FILE).GetRasterBand(1).GetOverviewCount()
+        downsampling_factor = reproject._get_downsampling_factor(gdal.Open(ALA_TIFF_FILE), bounds, 1500, 1500,
+                                                                 bounds_srs, destination_srs)
+        overview_factors = reprojection._get_warp_plan(gdal.Open(ALA_TIFF_FILE)).overview_factors
+        assert 0 < len(overview_factors)
+        assert [2 ** (i + 1) for i in range(len(overview_factors))] == overview_factors
+        assert overview_factors[-1] <= downsampling_factor
+        cached_files = sorted(os.listdir(cache_dir))
+        assert 2 == len(cached_files)
+        assert cached_files[0].endswith('.vrt')
+        assert cached_files[1].endswith('.vrt.ovr')
+        plain_dataset = reproject.Reprojection(bounds, 1500, 1500, destination_srs, bounds_srs).\
+            reproject(ALA_TIFF_FILE)
+        assert plain_dataset.RasterXSize == reprojected_dataset.RasterXSize
+        assert plain_dataset.RasterYSize == reprojected_dataset.RasterYSize
+
+        reprojection.reproject(ALA_TIFF_FILE)
+        assert cached_files == sorted(os.listdir(cache_dir))
+
+        cropping_configuration = reproject.WarpConfiguration(overview_cache_dir=cache_dir, crop_source=True)
+        cropping_reprojection = reproject.Reprojection(bounds, 1500, 1500, destination_srs, bounds_srs,
+                                                       warp_configuration=cropping_configuration)
+        cropped_dataset = cropping_reprojection.reproject(ALA_TIFF_FILE)
+        assert cropping_reprojection._get_warp_plan(gdal.Open(ALA_TIFF_FILE)).source_window is not None
+        assert cached_files == sorted(os.listdir(cache_dir))
+        np.testing.assert_allclose(reprojected_dataset.ReadAsArray(), cropped_dataset.ReadAsArray(), atol=1)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_reprojection_with_warp_cache():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    cache_dir = tempfile.mkdtemp()
+    try:
+        warp_cache = reproject.WarpCache(cache_dir)
+        reprojection = reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs,
+                                              warp_cache=warp_cache)
+
+        reprojected_dataset = reprojection.reproject(S2_FILE)
+        assert 1 == len(os.listdir(cache_dir))
+        cached_dataset = reprojection.reproject(S2_FILE)
+
+        assert 1 == len(os.listdir(cache_dir))
+        assert reprojected_dataset.GetGeoTransform() == cached_dataset.GetGeoTransform()
+        np.testing.assert_array_equal(reprojected_dataset.ReadAsArray(), cached_dataset.ReadAsArray())
+
+        reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs, use_remap_tables=True,
+                               warp_cache=warp_cache).reproject(S2_FILE)
+        assert 2 == len(os.listdir(cache_dir))
+        reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs,
+                               warp_configuration=reproject.WarpConfiguration(overview_level='NONE'),
+                               warp_cache=warp_cache).reproject(S2_FILE)
+        assert 3 == len(os.listdir(cache_dir))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_warp_configuration_result_parameters():
+    configuration = reproject.WarpConfiguration()
+    assert configuration.get_result_parameters() == \
+        reproject.WarpConfiguration(multithread=True, num_threads=2, warp_memory_limit=512).get_result_parameters()
+    assert configuration.get_result_parameters() != \
+        reproject.WarpConfiguration(crop_source=True).get_result_parameters()
+    assert configuration.get_result_parameters() != \
+        reproject.WarpConfiguration(overview_level=1).get_result_parameters()
+    assert configuration.get_result_parameters() != \
+        reproject.WarpConfiguration(overview_cache_dir='overviews').get_result_parameters()
+
+
+def test_reprojection_with_state_mask():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    reprojection = reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs)
+    expected_dataset = reprojection.reproject(S2_FILE)
+    expected_data = expected_dataset.ReadAsArray()
+    state_mask = np.zeros(expected_data.shape, dtype=np.uint8)
+    state_mask[100:200, 300:500] = 1
+
+    masked_dataset = reprojection.with_state_mask(state_mask).reproject(S2_FILE)
+
+    assert expected_dataset.GetGeoTransform() == pytest.approx(masked_dataset.GetGeoTransform())
+    masked_data = masked_dataset.ReadAsArray()
+    assert expected_data.shape == masked_data.shape
+    np.testing.assert_array_equal(expected_data[100:200, 300:500], masked_data[100:200, 300:500])
+    assert 0 == masked_data[:100].max()
+
+    empty_reprojection = reprojection.with_state_mask(np.zeros(expected_data.shape))
+    assert not empty_reprojection.has_valid_pixels()
+    empty_dataset = empty_reprojection.reproject(S2_FILE)
+    assert expected_data.shape == empty_dataset.ReadAsArray().shape
+    assert 0 == empty_dataset.ReadAsArray().max()
+    with pytest.raises(ValueError):
+        reprojection.with_state_mask(np.ones((10, 10))).reproject(S2_FILE)
+
+
+def test_reprojection_with_remap_tables():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.SetWellKnownGeogCS('EPSG:4326')
+    reprojection = reproject.Reprojection([7.8, 53.5, 8.8, 53.8], 50, 100, destination_srs, bounds_srs,
+                                          resampling_mode='near', use_remap_tables=True)
+
+    warped_dataset = reprojection.reproject(S2_FILE)
+    remapped_dataset = reprojection.reproject(S2_FILE)
+
+    assert reprojection._warp_plans[list(reprojection._warp_plans.keys())[0]].remap_table is not None
+    assert warped_dataset.GetGeoTransform() == remapped_dataset.GetGeoTransform()
+    assert warped_dataset.GetProjection() == remapped_dataset.GetProjection()
+    np.testing.assert_array_equal(warped_dataset.ReadAsArray(), remapped_dataset.ReadAsArray())
+
+
+def _create_utm_dataset_with_no_data() -> gdal.Dataset:
+    dataset = gdal.GetDriverByName('MEM').Create('', 20, 20, 1, gdal.GDT_Float32)
+    dataset.SetGeoTransform((500000, 100, 0, 5000000, 0, -100))
+    dataset.SetProjection(EPSG_32632_WKT)
+    data = np.arange(400, dtype=np.float32).reshape(20, 20) % 37
+    data[5:8, 5:7] = -999.
+    data[12, 14] = -999.
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(-999.)
+    band.WriteArray(data)
+    return dataset
+
+
+def test_reprojection_with_bilinear_remap_tables():
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromWkt(EPSG_32232_WKT)
+    bounds_srs = osr.SpatialReference()
+    bounds_srs.ImportFromWkt(EPSG_32632_WKT)
+    dataset = _create_utm_dataset_with_no_data()
+    reprojection = reproject.Reprojection([500150, 4998150, 501750, 4999750], 40, 40, destination_srs, bounds_srs,
+                                          resampling_mode='bilinear', use_remap_tables=True)
+
+    warped_dataset = reprojection.reproject(dataset)
+    remapped_dataset = reprojection.reproject(dataset)
+
+    assert reprojection._warp_plans[list(reprojection._warp_plans.keys())[0]].remap_table is not None
+    warped_data = warped_dataset.ReadAsArray()
+    remapped_data = remapped_dataset.ReadAsArray()
+    assert (warped_data == -999.).any()
+    np.testing.assert_array_equal(warped_data == -999., remapped_data == -999.)
+    np.testing.assert_allclose(warped_data, remapped_data, atol=1e-3)
+
+    # when sampling down, gdal scales the bilinear kernel, so datasets are always warped
+    coarse_reprojection = reproject.Reprojection([500150, 4998150, 501750, 4999750], 400, 400, destination_srs,
+                                                 bounds_srs, resampling_mode='bilinear', use_remap_tables=True)
+    coarse_reprojection.reproject(dataset)
+    warp_plan = coarse_reprojection._warp_plans[list(coarse_reprojection._warp_plans.keys())[0]]
+    assert warp_plan.remap_table is None
+    assert not warp_plan.remap_table_supported
+
+
+class _FakeBand(object):
+    DataType = 6
+
+
+class _FakeDataset(object):
+
+    def __init__(self, width, height):
+        self.RasterXSize = width
+        self.RasterYSize = height
+
+    def GetGeoTransform(self):
+        return 0., 1., 0., 0., 0., -1.
+
+    def GetProjection(self):
+        return ''
+
+    def GetRasterBand(self, index):
+        return _FakeBand()
+
+
+def _create_remap_table(monkeypatch, target_width, target_height, scale):
+    def get_source_pixel_coordinates(remap_table, source_dataset, target_dataset):
+        cols, rows = np.meshgrid(np.arange(target_width) + 0.5, np.arange(target_height) + 0.5)
+        return (cols * scale).ravel(), (rows * scale).ravel()
+
+    monkeypatch.setattr(reproject._RemapTable, '_get_source_pixel_coordinates', get_source_pixel_coordinates)
+    return reproject._RemapTable(_FakeDataset(2, 2), _FakeDataset(target_width, target_height), 'bilinear')
+
+
+def test_remap_table_bilinear_with_no_data(monkeypatch):
+    remap_table = _create_remap_table(monkeypatch, 4, 4, 0.5)
+    data = np.array([[1., 2.], [3., -1.]])
+
+    remapped = remap_table.remap_array(data, -1., -1.)
+
+    # neighbours beyond the source and no data values get no weight, the others are renormalised
+    assert 1. == remapped[0, 0]
+    assert pytest.approx((0.5625 * 1. + 0.1875 * 2. + 0.1875 * 3.) / 0.9375) == remapped[1, 1]
+    assert 2. == remapped[0, 3]
+    assert 3. == remapped[3, 0]
+    assert -1. == remapped[3, 3]
+    assert pytest.approx(1.25) == remap_table.remap_array(np.array([[1., 2.], [1., 2.]]))[1, 1]
+
+
+def test_remap_table_bilinear_does_not_sample_down(monkeypatch):
+    remap_table = _create_remap_table(monkeypatch, 2, 2, 2.)
+
+    assert not remap_table.supported
+    with pytest.raises(ValueError):
+        remap_table.remap_array(np.zeros((2, 2)))
+
+
+class _ArrayBand(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None):
+        return self.data[yoff:yoff + win_ysize, xoff:xoff + win_xsize].copy()
+
+    def WriteArray(self, data, xoff=0, yoff=0):
+        # like gdal, refuse writes beyond the band
+        if xoff + data.shape[1] > self.data.shape[1] or yoff + data.shape[0] > self.data.shape[0]:
+            raise ValueError('Access window out of range')
+        self.data[yoff:yoff + data.shape[0], xoff:xoff + data.shape[1]] = data
+
+
+class _ArrayDataset(object):
+
+    def __init__(self, data, x_min, y_max):
+        self.RasterXSize = data.shape[1]
+        self.RasterYSize = data.shape[0]
+        self.RasterCount = 1
+        self._band = _ArrayBand(data)
+        self._geo_transform = (x_min, 10., 0., y_max, 0., -10.)
+
+    def GetGeoTransform(self):
+        return self._geo_transform
+
+    def GetRasterBand(self, index):
+        return self._band
+
+
+def test_write_into():
+    target_data_set = _ArrayDataset(np.zeros((4, 5)), 100., 200.)
+
+    reproject._write_into(target_data_set, _ArrayDataset(np.ones((2, 2)), 120., 180.))
+    # a source which is a pixel larger than the rest of the target is clipped
+    reproject._write_into(target_data_set, _ArrayDataset(np.full((2, 3), 2.), 130., 170.))
+
+    expected = np.zeros((4, 5))
+    expected[2:4, 2:4] = 1.
+    expected[3:4, 3:5] = 2.
+    np.testing.assert_array_equal(expected, target_data_set.GetRasterBand(1).data)
+
+
+def test_transform_coordinate_arrays():
+    ala_dataset = gdal.Open(ALA_TIFF_FILE)
+    ala_srs = reproject.get_spatial_reference_system_from_dataset(ala_dataset)
+    s2_dataset = gdal.Open(S2_FILE)
+    s2_srs = reproject.get_spatial_reference_system_from_dataset(s2_dataset)
+
+    x = np.array([[-0.0013889, -0.0013889], [9.9986114, 9.9986114]])
+    y = np.array([[60.0013885, 50.0038300], [60.0013885, 50.0038300]])
+    transformed_x, transformed_y = reproject.transform_coordinate_arrays(ala_srs, s2_srs, x, y)
+    assert (2, 2) == transformed_x.shape
+    assert (2, 2) == transformed_y.shape
+    expected = reproject.transform_coordinates(ala_srs, s2_srs, [-0.0013889, 60.0013885, -0.0013889, 50.0038300,
+                                                                 9.9986114, 60.0013885, 9.9986114, 50.0038300])
+    np.testing.assert_array_almost_equal(expected[0::2], transformed_x.ravel())
+    np.testing.assert_array_almost_equal(expected[1::2], transformed_y.ravel())
+
+    empty_x, empty_y = reproject.transform_coordinate_arrays(ala_srs, s2_srs, [], [])
+    assert 0 == len(empty_x)
+    assert 0 == len(empty_y)
+
+
+def test_get_transformer_per_thread():
+    transformer = reproject._get_transformer('EPSG:32632', 'EPSG:4326')
+    assert transformer is reproject._get_transformer('EPSG:32632', 'EPSG:4326')
+
+    other_transformers = []
+    thread = threading.Thread(
+        target=lambda: other_transformers.append(reproject._get_transformer('EPSG:32632', 'EPSG:4326')))
+    thread.start()
+    thread.join()
+    assert other_transformers[0] is not transformer
+
+
+def test_get_cached_reference_system_per_thread():
+    spatial_reference = reproject._get_cached_reference_system(('test', 1), object)
+    assert spatial_reference is reproject._get_cached_reference_system(('test', 1), object)
+    assert spatial_reference is not reproject._get_cached_reference_system(('test', 2), object)
+
+    other_spatial_references = []
+    thread = threading.Thread(target=lambda: other_spatial_references.append(
+        reproject._get_cached_reference_system(('test', 1), object)))
+    thread.start()
+    thread.join()
+    assert other_spatial_references[0] is not spatial_reference
+
+
+def test_cached_reference_systems_are_not_handed_out():
+    cached_srs = reproject._get_reference_system('EPSG:32632')
+    reprojection = reproject.Reprojection([500000, 5000000, 501000, 5001000], 100, 100, cached_srs)
+    tile_grid = reproject.TileGrid([500000, 5000000, 501000, 5001000], 100, 100, cached_srs)
+
+    reprojection.get_destination_srs().SetUTM(33, 1)
+    tile_grid.destination_srs.SetUTM(33, 1)
+
+    assert cached_srs is reproject._get_reference_system('EPSG:32632')
+    assert 32 == cached_srs.GetUTMZone()
+    assert 32 == reprojection.get_destination_srs().GetUTMZone()
+    assert 32 == tile_grid.destination_srs.GetUTMZone()
+
+
+class _ShiftingTransformation(object):
+
+    def __init__(self):
+        self.num_points = []
+
+    def TransformPoints(self, points):
+        self.num_points.append(len(points))
+        return [(x + 1., y - 1., 0.) for x, y in points]
+
+
+def test_transform_coordinate_arrays_in_chunks(monkeypatch):
+    transformation = _ShiftingTransformation()
+    monkeypatch.setattr(reproject, '_get_coordinate_transformation', lambda source, target: transformation)
+    monkeypatch.setattr(reproject, '_MAX_POINTS_PER_TRANSFORMATION', 3)
+    x = np.arange(8, dtype=np.float64).reshape(2, 4)
+
+    transformed_x, transformed_y = reproject.transform_coordinate_arrays(None, None, x, -x)
+
+    assert [3, 3, 2] == transformation.num_points
+    np.testing.assert_array_equal(x + 1., transformed_x)
+    np.testing.assert_array_equal(-x - 1., transformed_y)
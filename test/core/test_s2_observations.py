@@ -1,8 +1,15 @@
+import gdal
+import numpy as np
+import os
 import osr
+import pytest
+import shutil
+import tempfile
 
 from multiply_core.util import Reprojection, FileRef
 from multiply_core.observations import S2Observations, S2ObservationsCreator, extract_angles_from_metadata_file, \
     extract_tile_id
+from typing import Optional
 
 S2_BASE_FILE = './test/test_data/S2A_MSIL1C_20170605T105031_N0205_R051_T30SWJ_20170605T105303-ac'
 S2_AWS_BASE_FILE = './test/test_data/product_in_aws_format/'
@@ -120,7 +127,69 @@ def test_s2_get_band_data_by_name_full():
     _assert_s2_observation_data(s2_observation_data)
 
 
-def _get_observations(url: str):
+def test_s2_get_band_data_with_state_mask():
+    expected_data = _get_observations(S2_AWS_BASE_FILE).get_band_data(3, retrieve_uncertainty=False).observations
+    state_mask = np.zeros(expected_data.shape, dtype=bool)
+    state_mask[100:200, 300:500] = True
+
+    s2_observation_data = _get_observations(S2_AWS_BASE_FILE, state_mask).get_band_data(3, retrieve_uncertainty=False)
+
+    assert expected_data.shape == s2_observation_data.observations.shape
+    np.testing.assert_array_equal(expected_data[100:200, 300:500], s2_observation_data.observations[100:200, 300:500])
+    assert not s2_observation_data.mask[:100].any()
+
+
+def test_s2_get_band_data_with_empty_state_mask():
+    expected_data = _get_observations(S2_AWS_BASE_FILE).get_band_data(3, retrieve_uncertainty=False).observations
+    s2_observations = _get_observations(S2_AWS_BASE_FILE, np.zeros(expected_data.shape, dtype=bool))
+
+    s2_observation_data = s2_observations.get_band_data(3, retrieve_uncertainty=False)
+
+    assert expected_data.shape == s2_observation_data.observations.shape
+    assert not s2_observation_data.mask.any()
+    assert (None, None, None, None, None, None) == s2_observations.read_granule()
+
+
+def _create_granule_files(directory: str):
+    # the test products come without cloud masks and angles, so these are written on the grid of a band
+    template = gdal.Open(os.path.join(directory, 'B02_sur.tiff'))
+    rows, cols = np.mgrid[0:template.RasterYSize, 0:template.RasterXSize]
+    driver = gdal.GetDriverByName('GTiff')
+    for file_name, bands in [('cloud.tif', [np.zeros_like(rows)]), ('SAA_SZA.tif', [15000 + cols, 3000 + rows]),
+                             ('VAA_VZA_B05.tif', [10000 + rows, 500 + cols])]:
+        data_set = driver.Create(os.path.join(directory, file_name), template.RasterXSize, template.RasterYSize,
+                                 len(bands), gdal.GDT_Int16)
+        data_set.SetGeoTransform(template.GetGeoTransform())
+        data_set.SetProjection(template.GetProjection())
+        for i, band in enumerate(bands):
+            data_set.GetRasterBand(i + 1).WriteArray(band)
+        data_set.FlushCache()
+
+
+def test_s2_read_granule_with_state_mask():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        granule_dir = os.path.join(temp_dir, 'granule')
+        shutil.copytree(S2_AWS_BASE_FILE, granule_dir)
+        _create_granule_files(granule_dir)
+        observations = _get_observations(granule_dir)
+        shape = observations.get_band_data(3, retrieve_uncertainty=False).observations.shape
+        state_mask = np.zeros(shape, dtype=bool)
+        state_mask[100:200, 300:500] = True
+
+        _, _, expected_sza, expected_vza, expected_raa, _ = observations.read_granule()
+        _, mask, sza, vza, raa, _ = _get_observations(granule_dir, state_mask).read_granule()
+
+        # the angles have no no data value, so they must not be averaged with pixels filled outside the state mask
+        assert pytest.approx(expected_sza) == sza
+        assert pytest.approx(expected_vza) == vza
+        assert pytest.approx(expected_raa) == raa
+        assert not mask[~state_mask].any()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def _get_observations(url: str, state_mask: Optional[np.array] = None):
     destination_srs = osr.SpatialReference()
     destination_srs.ImportFromWkt(EPSG_32232_WKT)
     bounds_srs = osr.SpatialReference()
@@ -130,7 +199,7 @@ def _get_observations(url: str):
                                 bounds_srs=bounds_srs, resampling_mode=None)
     file_ref = FileRef(url=url, start_time='2017-09-10', end_time='2017-09-10',
                        mime_type='unknown mime type')
-    return S2Observations([file_ref], reprojection, emulator_folder=EMULATOR_FOLDER)
+    return S2Observations([file_ref], reprojection, emulator_folder=EMULATOR_FOLDER, state_mask=state_mask)
 
 
 def _assert_aws_s2_observation_data(s2_observation_data):
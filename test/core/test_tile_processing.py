@@ -0,0 +1,67 @@
+from multiply_core.observations import TileProcessor, process_tiles
+from multiply_core.util import TileGrid
+import numpy as np
+import osr
+import pytest
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+class _ArrayWriter(object):
+
+    def __init__(self, width: int, height: int):
+        self.data = np.zeros((height, width))
+        self.offsets = []
+
+    def write(self, data, width=None, height=None, offset_x=0, offset_y=0):
+        self.data[offset_y:offset_y + height, offset_x:offset_x + width] = data[0]
+        self.offsets.append((offset_x, offset_y))
+
+
+def _get_tile_grid() -> TileGrid:
+    destination_srs = osr.SpatialReference()
+    destination_srs.ImportFromEPSG(32632)
+    return TileGrid([500000, 5000000, 501200, 5000500], 100, 100, destination_srs, tile_width=5, tile_height=2)
+
+
+def _get_tile_data(tile):
+    x_offset, y_offset, width, height = tile.window
+    return [np.full((height, width), tile.tile_x + 10 * tile.tile_y)]
+
+
+def test_process_tiles():
+    tile_grid = _get_tile_grid()
+    writer = _ArrayWriter(tile_grid.width, tile_grid.height)
+
+    num_written = process_tiles(tile_grid, _get_tile_data, writer, max_workers=2, max_tiles_in_flight=3)
+
+    assert 9 == num_written
+    assert [(0, 0), (5, 0), (10, 0), (0, 2), (5, 2), (10, 2), (0, 4), (5, 4), (10, 4)] == writer.offsets
+    assert 0 == writer.data[0, 4]
+    assert 2 == writer.data[1, 11]
+    assert 11 == writer.data[3, 5]
+    assert 22 == writer.data[4, 11]
+
+
+def test_tile_processor_retries_failed_tiles():
+    tile_grid = _get_tile_grid()
+    attempts = {}
+
+    def _fail_once(tile):
+        attempts[(tile.tile_x, tile.tile_y)] = attempts.get((tile.tile_x, tile.tile_y), 0) + 1
+        if (tile.tile_x, tile.tile_y) == (1, 1) and attempts[(1, 1)] == 1:
+            raise IOError('Could not read tile')
+        if (tile.tile_x, tile.tile_y) == (2, 0):
+            return None
+        return _get_tile_data(tile)
+
+    writer = _ArrayWriter(tile_grid.width, tile_grid.height)
+    num_written = TileProcessor(tile_grid, max_workers=3, use_processes=False).process(_fail_once, writer)
+
+    assert 8 == num_written
+    assert 2 == attempts[(1, 1)]
+    assert 11 == writer.data[3, 5]
+
+    attempts.clear()
+    with pytest.raises(RuntimeError):
+        TileProcessor(tile_grid, max_workers=3, max_retries=0, use_processes=False).process(_fail_once)
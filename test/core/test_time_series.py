@@ -0,0 +1,101 @@
+from datetime import datetime
+from multiply_core.observations import NetCdfTimeSeriesReader, NetCdfTimeSeriesWriter
+from multiply_core.observations.time_series import _to_seconds
+import numpy as np
+import os
+from pytest import raises
+
+TIME_SERIES_WRITE_FOLDER = './test/test_data/time_series'
+GEO_TRANSFORM = (582414.9967658486, 120.0, 0.0, 4317096.927011872, 0.0, -120.0)
+PROJECTION = 'PROJCS["UTM Zone 30, Northern Hemisphere",GEOGCS["WGS 84",DATUM["WGS_1984",' \
+             'SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],' \
+             'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,' \
+             'AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]],PROJECTION["Transverse_Mercator"],' \
+             'PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",-3],PARAMETER["scale_factor",0.9996],' \
+             'PARAMETER["false_easting",500000],PARAMETER["false_northing",0],UNIT["Meter",1]]'
+
+
+def test_to_seconds():
+    assert 86400 == _to_seconds('1970-01-02')
+    assert 86400 == _to_seconds(datetime(1970, 1, 2))
+
+
+def test_time_series_writer_write_and_read():
+    file_names = [os.path.abspath('{}/lai.nc'.format(TIME_SERIES_WRITE_FOLDER)),
+                  os.path.abspath('{}/cab.nc'.format(TIME_SERIES_WRITE_FOLDER))]
+    try:
+        # dates are written out of order, each with its own writer
+        for day in [3, 1, 2]:
+            with NetCdfTimeSeriesWriter(file_names, GEO_TRANSFORM, PROJECTION, 6, 4, [1, 2], ['Float', 'Int'],
+                                        time=datetime(2018, 1, day), time_chunk_size=2,
+                                        spatial_chunk_size=2) as writer:
+                for offset_y in [0, 2]:
+                    writer.write([np.full((2, 6), float(day + offset_y)), np.full((2, 2, 6), day, dtype=np.int32)],
+                                 6, 2, 0, offset_y)
+
+        with NetCdfTimeSeriesReader(file_names[0]) as reader:
+            assert (6, 4) == (reader.width, reader.height)
+            assert GEO_TRANSFORM == reader.geo_transform
+            assert PROJECTION == reader.projection
+            np.testing.assert_array_equal(np.array(['2018-01-01', '2018-01-02', '2018-01-03'], dtype='datetime64[s]'),
+                                          reader.times)
+            times, values = reader.read_time_series(5, 3)
+            np.testing.assert_array_equal(reader.times, times)
+            np.testing.assert_array_equal(np.array([3., 4., 5.]), values)
+            times, data = reader.read_window(1, 1, 3, 2, start_time='2018-01-02')
+            assert (2, 2, 3) == data.shape
+            np.testing.assert_array_equal(np.array([[2., 2., 2.], [4., 4., 4.]]), data[0])
+        with NetCdfTimeSeriesReader(file_names[1]) as reader:
+            times, values = reader.read_time_series(0, 0, end_time='2018-01-02')
+            assert (2, 2) == values.shape
+            np.testing.assert_array_equal(np.array([[1, 1], [2, 2]]), values)
+    finally:
+        for file_name in file_names:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+
+def test_time_series_writer_overwrites_existing_date():
+    file_name = os.path.abspath('{}/sm.nc'.format(TIME_SERIES_WRITE_FOLDER))
+    try:
+        with NetCdfTimeSeriesWriter([file_name], GEO_TRANSFORM, PROJECTION, 2, 2, time='2018-01-01') as writer:
+            writer.write([np.zeros((2, 2))])
+            writer.set_time('2018-01-02')
+            writer.write([np.ones((2, 2))])
+            writer.set_time('2018-01-01')
+            writer.write([np.full((2, 2), 2.)])
+
+        with NetCdfTimeSeriesReader(file_name) as reader:
+            np.testing.assert_array_equal(np.array([2., 1.]), reader.read_time_series(1, 1)[1])
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+def test_time_series_reader_includes_whole_end_day():
+    file_name = os.path.abspath('{}/sm3.nc'.format(TIME_SERIES_WRITE_FOLDER))
+    try:
+        with NetCdfTimeSeriesWriter([file_name], GEO_TRANSFORM, PROJECTION, 2, 2) as writer:
+            for day, time in enumerate(['2018-01-01T10:00:00', '2018-01-02T10:00:00', '2018-01-03T10:00:00']):
+                writer.set_time(time)
+                writer.write([np.full((2, 2), float(day))])
+
+        with NetCdfTimeSeriesReader(file_name) as reader:
+            times, values = reader.read_time_series(0, 0, start_time='2018-01-01', end_time='2018-01-02')
+            np.testing.assert_array_equal(np.array([0., 1.]), values)
+            assert 2 == len(times)
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+def test_time_series_writer_write_without_time():
+    file_name = os.path.abspath('{}/sm2.nc'.format(TIME_SERIES_WRITE_FOLDER))
+    try:
+        writer = NetCdfTimeSeriesWriter([file_name], GEO_TRANSFORM, PROJECTION, 2, 2)
+        with raises(ValueError):
+            writer.write([np.zeros((2, 2))])
+        writer.close()
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)
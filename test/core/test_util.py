@@ -1,3 +1,4 @@
+from datetime import datetime
 import multiply_core.util.util as util
 import numpy as np
 import pytest
@@ -146,3 +147,69 @@ def test_get_mime_type():
     assert 'application/zip' == util.get_mime_type('ctfthdbdr.zip')
     assert 'application/json' == util.get_mime_type('ctfthdbdr.json')
     assert 'unknown mime type' == util.get_mime_type('ctfthdbdr')
+
+
+def test_get_time_from_string():
+    assert datetime(2017, 6, 5, 10, 50, 31) == util.get_time_from_string('20170605T105031')
+    assert datetime(2017, 6, 5, 10, 50, 31) == util.get_time_from_string('2017-06-05T10:50:31')
+    assert datetime(2017, 6, 5, 10, 50, 31) == util.get_time_from_string('2017-06-05 10:50:31')
+    assert datetime(2017, 6, 5, 10, 50, 31, 500000) == util.get_time_from_string('2017-06-05T10:50:31.5Z')
+    assert datetime(2017, 6, 5, 10, 50, 31, 123456) == util.get_time_from_string('2017-06-05T10:50:31.123456')
+    assert datetime(2017, 6, 5) == util.get_time_from_string('2017-06-05')
+    assert datetime(2017, 6, 5) == util.get_time_from_string('2017-6-5')
+    assert datetime(2017, 6, 5, 23, 59, 59) == util.get_time_from_string('2017156', adjust_to_last_day=True)
+    assert datetime(2017, 2, 28, 23, 59, 59) == util.get_time_from_string('2017-02', adjust_to_last_day=True)
+    assert datetime(2017, 1, 1) == util.get_time_from_string('2017')
+
+
+def test_get_time_from_string_invalid():
+    with pytest.raises(ValueError):
+        util.get_time_from_string('2017-13-01')
+    with pytest.raises(ValueError):
+        util.get_time_from_string('dgfvbgf')
+
+
+def test_get_times_from_strings():
+    times = util.get_times_from_strings(['2017-06-05', '', '20170605T105031', '2017-06-05'])
+
+    assert 4 == len(times)
+    assert np.datetime64('2017-06-05T00:00:00') == times[0]
+    assert np.isnat(times[1])
+    assert np.datetime64('2017-06-05T10:50:31') == times[2]
+    assert np.datetime64('2017-06-05T00:00:00') == times[3]
+
+
+def test_get_times_from_strings_empty():
+    assert 0 == len(util.get_times_from_strings([]))
+
+
+def test_file_ref():
+    file_ref = util.FileRef('loc1', '2017-06-04', '20170607T105031', 'image/tiff', 'S2_L2')
+
+    assert 'loc1' == file_ref.url
+    assert '2017-06-04' == file_ref.start_time
+    assert '20170607T105031' == file_ref.end_time
+    assert 'image/tiff' == file_ref.mime_type
+    assert 'S2_L2' == file_ref.data_type
+    assert datetime(2017, 6, 4) == file_ref.start_datetime
+    assert datetime(2017, 6, 7, 10, 50, 31) == file_ref.end_datetime
+    assert not hasattr(file_ref, '__dict__')
+
+
+def test_file_ref_without_times():
+    file_ref = util.FileRef('loc1', '', '', 'image/tiff')
+
+    assert file_ref.data_type is None
+    assert file_ref.start_datetime is None
+    assert file_ref.end_datetime is None
+
+
+def test_file_ref_equality():
+    file_ref = util.FileRef('loc1', '2017-06-04', '2017-06-07', 'image/tiff')
+    same_file_ref = util.FileRef('loc1', '2017-06-04', '2017-06-07', 'image/tiff', 'S2_L2')
+    other_file_ref = util.FileRef('loc2', '2017-06-04', '2017-06-07', 'image/tiff')
+
+    assert file_ref == same_file_ref
+    assert hash(file_ref) == hash(same_file_ref)
+    assert file_ref != other_file_ref
+    assert 2 == len({file_ref, same_file_ref, other_file_ref})
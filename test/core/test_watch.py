@@ -0,0 +1,80 @@
+from multiply_core.observations import ValidFilesWatcher
+import os
+import shutil
+import tempfile
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+AWS_S2_L2_FILES = ['B01_sur.tif', 'B02_sur.tif', 'B03_sur.tif', 'B04_sur.tif', 'B05_sur.tif', 'B06_sur.tif',
+                   'B07_sur.tif', 'B08_sur.tif', 'B8A_sur.tif', 'B09_sur.tif', 'B10_sur.tif', 'B11_sur.tif',
+                   'B12_sur.tif']
+METADATA = '<Level-1C_Tile_ID><General_Info><SENSING_TIME>{}</SENSING_TIME></General_Info></Level-1C_Tile_ID>'
+
+
+def _create_aws_s2_l2_product(path: str, sensing_time: str):
+    os.makedirs(path)
+    for file_name in AWS_S2_L2_FILES:
+        open(os.path.join(path, file_name), 'w').close()
+    with open(os.path.join(path, 'metadata.xml'), 'w') as metadata_file:
+        metadata_file.write(METADATA.format(sensing_time))
+
+
+def test_valid_files_watcher_poll():
+    datasets_dir = tempfile.mkdtemp()
+    try:
+        watcher = ValidFilesWatcher(datasets_dir, ['AWS_S2_L2'])
+        assert 0 == len(watcher.poll())
+
+        first_product = '{}/30/S/WJ/2017/6/5/0'.format(datasets_dir)
+        _create_aws_s2_l2_product(first_product, '2017-06-05T10:50:31.456Z')
+        file_refs = watcher.poll()
+        assert 1 == len(file_refs)
+        assert first_product == file_refs[0].url
+        assert '2017-06-05 10:50:31' == file_refs[0].start_time
+        assert 0 == len(watcher.poll())
+
+        second_product = '{}/30/S/WJ/2017/6/8/0'.format(datasets_dir)
+        _create_aws_s2_l2_product(second_product, '2017-06-08T10:50:31.456Z')
+        file_refs = watcher.poll()
+        assert 1 == len(file_refs)
+        assert second_product == file_refs[0].url
+    finally:
+        shutil.rmtree(datasets_dir)
+
+
+def test_valid_files_watcher_poll_retries_unreadable_products():
+    datasets_dir = tempfile.mkdtemp()
+    try:
+        watcher = ValidFilesWatcher(datasets_dir, ['AWS_S2_L2'])
+        first_product = '{}/30/S/WJ/2017/6/5/0'.format(datasets_dir)
+        _create_aws_s2_l2_product(first_product, '2017-06-05T10:50:31.456Z')
+        with open(os.path.join(first_product, 'metadata.xml'), 'w') as metadata_file:
+            metadata_file.write('<Level-1C_Tile_ID><General_Info>')
+        second_product = '{}/30/S/WJ/2017/6/8/0'.format(datasets_dir)
+        _create_aws_s2_l2_product(second_product, '2017-06-08T10:50:31.456Z')
+
+        file_refs = watcher.poll()
+        assert 1 == len(file_refs)
+        assert second_product == file_refs[0].url
+
+        # the metadata is completed in place, so no directory changes
+        with open(os.path.join(first_product, 'metadata.xml'), 'w') as metadata_file:
+            metadata_file.write(METADATA.format('2017-06-05T10:50:31.456Z'))
+        file_refs = watcher.poll()
+        assert 1 == len(file_refs)
+        assert first_product == file_refs[0].url
+        assert 0 == len(watcher.poll())
+    finally:
+        shutil.rmtree(datasets_dir)
+
+
+def test_valid_files_watcher_watch():
+    datasets_dir = tempfile.mkdtemp()
+    try:
+        _create_aws_s2_l2_product('{}/30/S/WJ/2017/6/5/0'.format(datasets_dir), '2017-06-05T10:50:31.456Z')
+        watcher = ValidFilesWatcher(datasets_dir, ['AWS_S2_L2'])
+
+        file_refs = list(watcher.watch(interval=0.0, max_polls=3))
+        assert 1 == len(file_refs)
+    finally:
+        shutil.rmtree(datasets_dir)
@@ -1,4 +1,5 @@
-from multiply_core.util.file_ref_creation import FileRefCreation, S2L2FileRefCreator, VariableFileRefCreator
+from multiply_core.util.file_ref_creation import FileRefCreation, S2L2FileRefCreator, VariableFileRefCreator, \
+    get_file_ref_creation
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
@@ -53,6 +54,7 @@ def test_variable_file_ref_creator_create_file_ref():
     assert '2000-01-01' == file_ref.start_time
     assert '2000-01-01' == file_ref.end_time
     assert 'image/tiff' == file_ref.mime_type
+    assert 'dzfgj' == file_ref.data_type
 
 
 def test_file_ref_creation_get_variable_file_ref():
@@ -66,3 +68,24 @@ def test_file_ref_creation_get_variable_file_ref():
     assert '2000-01-01' == file_ref.start_time
     assert '2000-01-01' == file_ref.end_time
     assert 'image/tiff' == file_ref.mime_type
+
+
+def test_file_ref_creation_create_file_refs():
+    file_ref_creation = FileRefCreation()
+    file_ref_creation.add_file_ref_creator(VariableFileRefCreator('zfegth'))
+
+    file_refs = file_ref_creation.create_file_refs([('zfegth', 'something/zfegth_A2000001.tif'),
+                                                    ('dgfvbgf', 'something/dgfvbgf_A2000001.tif'),
+                                                    ('zfegth', 'something/zfegth_A2000032.tif')])
+
+    assert 3 == len(file_refs)
+    assert 'something/zfegth_A2000001.tif' == file_refs[0].url
+    assert '2000-01-01' == file_refs[0].start_time
+    assert file_refs[1] is None
+    assert 'something/zfegth_A2000032.tif' == file_refs[2].url
+    assert '2000-02-01' == file_refs[2].start_time
+    assert 0 == len(file_ref_creation.create_file_refs([]))
+
+
+def test_get_file_ref_creation():
+    assert get_file_ref_creation() is get_file_ref_creation()
@@ -0,0 +1,82 @@
+from datetime import datetime
+from multiply_core.util import FileRef, FileRefTable
+import numpy as np
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+FILE_REFS = [FileRef('loc1', '2017-06-04 10:50:31', '2017-06-04 10:50:31', 'application/x-directory', 'S2_L2'),
+             FileRef('loc2', '2017-06-01', '2017-06-06', 'image/tiff', 'lai'),
+             FileRef('loc3', '20170604T090000', '20170604T090000', 'application/x-directory', 'S2_L2'),
+             FileRef('loc4', '', '', 'unknown mime type'),
+             FileRef('loc5', '2017-06-08', '2017-06-08', 'image/tiff', 'lai')]
+
+
+def test_file_ref_table_from_file_refs():
+    table = FileRefTable.from_file_refs(FILE_REFS)
+
+    assert 5 == len(table)
+    assert ['loc1', 'loc2', 'loc3', 'loc4', 'loc5'] == list(table.urls)
+    assert np.int64 == table.start_times.dtype
+    assert np.datetime64('2017-06-01T00:00:00') == table.start_times[1].astype('datetime64[us]')
+    assert ['S2_L2', 'lai'] == table.data_types
+    np.testing.assert_array_equal([0, 1, 0, -1, 1], table.type_codes)
+    assert 3 == len(table.mime_types)
+
+
+def test_file_ref_table_from_file_refs_without_times():
+    table = FileRefTable.from_file_refs([FileRef('loc1', None, None, 'application/x-directory', 'AWS_S2_L2')])
+
+    assert 1 == len(table)
+    assert 0 == len(table.select(start_time='2017-06-01'))
+    assert table.to_file_refs()[0].start_time is None
+
+
+def test_file_ref_table_to_file_refs():
+    file_refs = FileRefTable.from_file_refs(FILE_REFS).to_file_refs()
+
+    assert 5 == len(file_refs)
+    assert 'loc1' == file_refs[0].url
+    assert datetime(2017, 6, 4, 10, 50, 31) == file_refs[0].start_datetime
+    assert 'application/x-directory' == file_refs[0].mime_type
+    assert 'S2_L2' == file_refs[0].data_type
+    assert '' == file_refs[3].start_time
+    assert file_refs[3].data_type is None
+    assert datetime(2017, 6, 8) == file_refs[4].end_datetime
+    # the original time strings are kept, so the file refs are equal to the original ones
+    assert FILE_REFS == file_refs
+    assert '2017-06-04 10:50:31' == file_refs[0].start_time
+    assert 5 == len(set(file_refs) | set(FILE_REFS))
+    assert FILE_REFS[1:3] == FileRefTable.from_file_refs(FILE_REFS)[1:3].to_file_refs()
+
+
+def test_file_ref_table_select():
+    table = FileRefTable.from_file_refs(FILE_REFS)
+
+    assert ['loc1', 'loc2', 'loc3'] == list(table.select(start_time='2017-06-03', end_time='2017-06-05').urls)
+    assert ['loc1', 'loc2', 'loc3'] == list(table.select(start_time=datetime(2017, 6, 3),
+                                                         end_time=datetime(2017, 6, 5)).urls)
+    assert ['loc2', 'loc5'] == list(table.select(data_types=['lai']).urls)
+    assert ['loc5'] == list(table.select(start_time='2017-06-07', data_types=['lai', 'S2_L2']).urls)
+    assert 5 == len(table.select())
+    assert ['loc1', 'loc2', 'loc3'] == list(table.select(start_time='2017-06-04', end_time='2017-06-04').urls)
+    np.testing.assert_array_equal([True, True, True, False, False], table.get_time_mask(end_time='2017-06-04'))
+    # date-only end times cover the whole day
+    assert ['loc5'] == list(table.select(start_time='2017-06-08T12:00:00').urls)
+    assert np.datetime64('2017-06-08T23:59:59') == table.end_times[4].astype('datetime64[us]')
+
+
+def test_file_ref_table_slice_shares_arrays():
+    table = FileRefTable.from_file_refs(FILE_REFS)
+
+    sliced_table = table[1:3]
+    assert 2 == len(sliced_table)
+    assert np.shares_memory(table.start_times, sliced_table.start_times)
+
+
+def test_file_ref_table_group_by_day():
+    groups = FileRefTable.from_file_refs(FILE_REFS).group_by_day()
+
+    assert [datetime(2017, 6, 1), datetime(2017, 6, 4), datetime(2017, 6, 8)] == list(groups.keys())
+    assert ['loc2'] == list(groups[datetime(2017, 6, 1)].urls)
+    assert ['loc3', 'loc1'] == list(groups[datetime(2017, 6, 4)].urls)
+    assert ['loc5'] == list(groups[datetime(2017, 6, 8)].urls)
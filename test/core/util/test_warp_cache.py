@@ -0,0 +1,71 @@
+from multiply_core.util import WarpCache
+import gdal
+import numpy as np
+import os
+import shutil
+import tempfile
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+ALA_TIFF_FILE = './test/test_data/Priors_ala_125_[50_60N]_[000_010E].tiff'
+
+
+class _FileDataset(object):
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def GetDescription(self) -> str:
+        return self._path
+
+
+def test_warp_cache_get_key():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        source_file = os.path.join(cache_dir, 'source.tif')
+        open(source_file, 'w').close()
+        warp_cache = WarpCache(cache_dir)
+
+        key = warp_cache.get_key(_FileDataset(source_file), (0, 0, 10, 10), 'average')
+
+        assert key == warp_cache.get_key(_FileDataset(source_file), (0, 0, 10, 10), 'average')
+        assert key != warp_cache.get_key(_FileDataset(source_file), (0, 0, 10, 10), 'bilinear')
+        os.utime(source_file, ns=(0, 0))
+        assert key != warp_cache.get_key(_FileDataset(source_file), (0, 0, 10, 10), 'average')
+        assert warp_cache.get_key(_FileDataset(''), (0, 0, 10, 10), 'average') is None
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_warp_cache_evicts_least_recently_used():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        warp_cache = WarpCache(cache_dir, max_size=250)
+        for i, name in enumerate(['a', 'b', 'c']):
+            with open(os.path.join(cache_dir, '{}.tif'.format(name)), 'w') as cached_file:
+                cached_file.write('x' * 100)
+            os.utime(os.path.join(cache_dir, '{}.tif'.format(name)), ns=(i * 10 ** 9, i * 10 ** 9))
+
+        warp_cache._evict()
+
+        assert ['b.tif', 'c.tif'] == sorted(os.listdir(cache_dir))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_warp_cache_put_and_get():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        warp_cache = WarpCache(cache_dir)
+        dataset = gdal.Open(ALA_TIFF_FILE)
+        key = warp_cache.get_key(dataset, 'grid')
+        assert warp_cache.get(key) is None
+
+        warp_cache.put(key, dataset)
+        cached_dataset = warp_cache.get(key)
+
+        assert 'MEM' == cached_dataset.GetDriver().ShortName
+        assert dataset.GetGeoTransform() == cached_dataset.GetGeoTransform()
+        np.testing.assert_array_equal(dataset.ReadAsArray(), cached_dataset.ReadAsArray())
+    finally:
+        shutil.rmtree(cache_dir)